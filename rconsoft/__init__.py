@@ -6,8 +6,9 @@ import rconsoft
 from rconsoft.command import CommandHandler
 from rconsoft.rcon.client import RconClient
 from rconsoft.rcon.receiver import RconReceiver
+from rconsoft.server import ServerRegistry
 
-__all__ = ['rcon_client', 'command_handler', 'rcon_receiver', 'irc_client']
+__all__ = ['rcon_client', 'command_handler', 'rcon_receiver', 'irc_client', 'servers']
 
 #==============================
 def __figure_version():
@@ -29,4 +30,7 @@ __version__ = __figure_version()
 
 command_handler = CommandHandler()
 rcon_client = RconClient()
-rcon_receiver = RconReceiver()
\ No newline at end of file
+rcon_receiver = RconReceiver()
+# The default server uses rcon_client, so plugins that only know about a
+# single server keep working.
+servers = ServerRegistry()
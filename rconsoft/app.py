@@ -12,10 +12,11 @@ from twisted.internet import reactor
 
 import rconsoft
 from rconsoft.util import reloadhelper
-from rconsoft.config import config
+from rconsoft.config import config, ConfigError, ConfigWatcher
 import rconsoft.plugins
 from rconsoft.plugins import Plugin
 from rconsoft.controller import Controller
+from rconsoft.replay import Recorder
 
 # Set up logging. One log is a general log of general things. The other
 # one isa detailed logs that spews out a bunch of different information.
@@ -36,12 +37,28 @@ log_detail.addHandler(fh)
 #------------------------------
 class RconSoft(object):       
   #==============================
-  def run(self):
+  def run(self, record=None, watch=True):
+    """record is the path of a file to record the log lines received to. It
+    can be replayed with rconsoft-replay. If watch is True, the config is
+    reloaded whenever it changes."""
+    
     log.debug('Starting %s %s' % (rconsoft.__name__, rconsoft.__version__))
     
     self._init_plugins()
     self.controller = Controller()
-    self.controller.setup()
+    try:
+      self.controller.setup()
+    except ConfigError:
+      # Already logged by setup.
+      return
+    
+    if record:
+      self.recorder = Recorder(record)
+      rconsoft.rcon_receiver.data.connect(self.recorder)
+    
+    if watch:
+      self.config_watcher = ConfigWatcher()
+      self.config_watcher.start()
     
     reactor.run()
   
@@ -58,6 +75,11 @@ def main_func():
   parser.add_option('-r', '--reload',
     action='store_true', dest='reload', default=False,
     help='reloads the program automatically on code change')
+  parser.add_option('--record', dest='record', default=None,
+    help='records the log lines received to a file which rconsoft-replay can replay')
+  parser.add_option('--no-watch',
+    action='store_false', dest='watch', default=True,
+    help='does not reload the config when it changes')
   
   (options, args) = parser.parse_args()
   
@@ -69,7 +91,7 @@ def main_func():
     return
     
   rconsoft = RconSoft()
-  rconsoft.run()
+  rconsoft.run(options.record, options.watch)
 
 #==============================
 if __name__ == "__main__":
@@ -0,0 +1,508 @@
+#!/usr/bin/env python
+# Read LICENSE for licensing details.
+"""Microbenchmarks of the paths RconSoft spends the most time in.
+
+Every benchmark runs offline: the log lines and rcon responses are made up
+by rconsoft.fakehlds. The results are compared with a baseline saved by an
+earlier run, and the run fails (exits with 1) if a benchmark got slower
+than the baseline by more than the threshold.
+
+Each benchmark is timed in turns with a reference loop of plain python,
+and the time relative to the reference is what is compared. That keeps a
+busy or slower machine from looking like a regression, and lets a
+baseline saved on one machine be used on another.
+
+Example:
+  rconsoft-bench --save         # Saves the baseline.
+  rconsoft-bench                # Compares with it.
+  rconsoft-bench -f signal,irc  # Only runs some of the benchmarks.
+"""
+
+import sys
+import json
+import random
+from timeit import Timer
+from optparse import OptionParser
+
+from twisted.internet import defer
+
+from rconsoft.config import config, cget, settings, has_access, uniqueids_with_access, rebuild_access, ACCESS_LEVELS
+from rconsoft.command import CommandHandler, command
+from rconsoft.dispatch.dispatcher import Signal
+from rconsoft.rcon.client import HL1Network, RconClient
+from rconsoft.rcon.reassembly import SplitPacketReassembler
+from rconsoft.rcon.receiver import RconReceiver
+from rconsoft.irc.client import IrcClient, IrcClientProtocol
+from rconsoft.fakehlds import FakeHLDS, LogGenerator, split_packet
+
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+DEFAULT_THRESHOLD = 0.25
+
+# Each benchmark is called enough times for a run to take at least this many
+# seconds. The best of REPEAT runs is kept.
+MIN_TIME = 0.01
+REPEAT = 20
+
+#------------------------------
+class BenchNetwork(HL1Network):
+  """A network which answers every command with response right away instead
+  of sending it."""
+
+  #==============================
+  def __init__(self, response=''):
+    HL1Network.__init__(self, '127.0.0.1', 27015, '')
+    self.response = response
+
+  #==============================
+  def command(self, *args, **kwargs):
+    if kwargs.get('deferred', True):
+      return defer.succeed(self.response)
+    return None
+
+#------------------------------
+class Receiver(object):
+  """A receiver to connect to signals."""
+
+  #==============================
+  def __call__(self, **kwargs):
+    pass
+
+  #==============================
+  def receive(self, **kwargs):
+    pass
+
+#==============================
+def _fake_server(players=32):
+  random.seed(0)
+  return FakeHLDS('', players=players)
+
+#==============================
+def bench_reference():
+  """A loop of plain python the other times are measured against."""
+
+  items = range(100)
+
+  #==============================
+  def run():
+    total = 0
+    for item in items:
+      total += item * 2
+    return total
+  yield ('reference', run)
+
+#==============================
+def bench_signal():
+  """Signal.send and send_fast with 1, 10 and 50 weakly connected
+  receivers."""
+
+  for count in (1, 10, 50):
+    signal = Signal()
+    receivers = [Receiver() for index in xrange(count)]
+    for receiver in receivers:
+      signal.connect(receiver.receive)
+
+    #==============================
+    def run(signal=signal, receivers=receivers):
+      signal.send(sender=None, event='user_say', data=None)
+    yield ('signal_send_%d' % count, run)
+
+    #==============================
+    def run_fast(signal=signal, receivers=receivers):
+      signal.send_fast(sender=None, event='user_say', data=None)
+    yield ('signal_send_fast_%d' % count, run_fast)
+
+#==============================
+def bench_signal_churn():
+  """Connecting 200 receivers to a signal, then disconnecting half of them
+  and letting the rest die."""
+
+  #==============================
+  def run():
+    signal = Signal()
+    receivers = [Receiver() for index in xrange(200)]
+    for receiver in receivers:
+      signal.connect(receiver.receive)
+    for receiver in receivers[::2]:
+      signal.disconnect(receiver.receive)
+    del receivers[:]
+  yield ('signal_churn_200', run)
+
+#==============================
+def bench_receiver():
+  """Parsing a log line into an event, for each event type."""
+
+  random.seed(0)
+  server = _fake_server()
+  generator = LogGenerator(server.players)
+  lines = []
+  for player in server.players:
+    lines.extend(generator.connect(player))
+  for index in xrange(2000):
+    lines.extend(generator.next())
+  lines.extend([
+    'Server say "hello"',
+    'Rcon: "rcon 123456789 "password" users" from "127.0.0.1:27005"',
+    '"Player1<1><STEAM_0:1:100001><CT>" disconnected',
+    '"Player1<1><STEAM_0:1:100001><CT>" changed name to "Player One"'
+  ])
+
+  receiver = RconReceiver()
+  # Parse every event, as if something handled each of them.
+  receiver.add_interest()
+  by_event = {}
+  for line in lines:
+    name, m, player = receiver.match(line)
+    by_event.setdefault(name or 'none', []).append(line)
+
+  for name, event_lines in sorted(by_event.items()):
+    # The same amount of lines for every event, so the times compare.
+    event_lines = (event_lines * (32 // len(event_lines) + 1))[:32]
+
+    #==============================
+    def run(event_lines=event_lines):
+      match = receiver.match
+      events = receiver.events
+      for line in event_lines:
+        name, m, player = match(line)
+        if m:
+          events[name]['class'](m, player)
+    yield ('receiver_%s' % name, run)
+
+#==============================
+def _client(players=32):
+  server = _fake_server(players)
+  # The network strips the newline off the end of responses.
+  client = RconClient(BenchNetwork(server._users().rstrip('\n')))
+  client.users()
+  return server, client
+
+#==============================
+def bench_players():
+  """RconClient.get_players and find_players with 32 players."""
+
+  server, client = _client()
+
+  #==============================
+  def run_all():
+    client.get_players()
+  yield ('get_players_all', run_all)
+
+  #==============================
+  def run_names():
+    client.get_players(['Player1', 'player2.*'])
+  yield ('get_players_names', run_names)
+
+  #==============================
+  def run_reverse():
+    client.get_players(['Player1'], reverse=True)
+  yield ('get_players_reverse', run_reverse)
+
+  #==============================
+  def run_find():
+    client.find_players('name', 'Player17')
+  yield ('find_players', run_find)
+
+#==============================
+def bench_reassembly():
+  """Reassembling a users response split into 0xFE packets."""
+
+  server = _fake_server()
+  packet = '\xFF\xFF\xFF\xFFl%s\x00' % server._users()
+  for size in (512, 128):
+    packets = split_packet(packet, size, 1)
+    # The last piece first, as they sometimes arrive.
+    packets.insert(0, packets.pop())
+
+    #==============================
+    def run(packets=packets):
+      reassembler = SplitPacketReassembler()
+      for data in packets:
+        reassembler.add(data, 0)
+    yield ('reassembly_%d_pieces' % len(packets), run)
+
+#==============================
+def bench_responses():
+  """Parsing the responses of users and user."""
+
+  server, client = _client()
+  users = server._users().rstrip('\n')
+  user = server._user('1').rstrip('\n')
+  uniqueid = server.players[0].uniqueid
+
+  #==============================
+  def run_users():
+    client.network.response = users
+    client.users()
+  yield ('users_parse', run_users)
+
+  #==============================
+  def run_user():
+    client.network.response = user
+    client.user(uniqueid)
+  yield ('user_parse', run_user)
+
+#==============================
+def bench_access():
+  """has_access and uniqueids_with_access with 1000 users in the config."""
+
+  users = {}
+  for index in xrange(1000):
+    users['user%d' % index] = {
+      'uniqueid': 'STEAM_0:%d:%d' % (index % 2, 200000 + index),
+      'access': ACCESS_LEVELS[index % len(ACCESS_LEVELS)]
+    }
+  last = users['user999']['uniqueid']
+
+  #==============================
+  def run_hit():
+    has_access(last, 'guest')
+  yield ('has_access_hit', run_hit, users)
+
+  #==============================
+  def run_miss():
+    has_access('STEAM_0:0:1', 'guest')
+  yield ('has_access_miss', run_miss, users)
+
+  #==============================
+  def run_bulk():
+    uniqueids_with_access('user')
+  yield ('uniqueids_with_access', run_bulk, users)
+
+#==============================
+def bench_config():
+  """Reading a nested option with cget and from the compiled settings."""
+
+  #==============================
+  def run_cget():
+    int(cget('plugins', 'ircbot', 'ad_interval', default=45))
+  yield ('config_cget', run_cget)
+
+  #==============================
+  def run_settings():
+    settings.plugins.ircbot.ad_interval
+  yield ('config_settings', run_settings)
+
+#==============================
+def bench_commands():
+  """CommandHandler.process with 8 plugins handling 8 commands each."""
+
+  handler = CommandHandler()
+  plugins = []
+  for index in xrange(8):
+    #------------------------------
+    class BenchPlugin(object):
+      #==============================
+      @command(*['command%d_%d' % (index, number) for number in xrange(8)])
+      def on_command(self, **kwargs):
+        pass
+    plugins.append(BenchPlugin())
+    handler.connect_handlers(plugins[-1])
+
+  #==============================
+  def run(plugins=plugins):
+    handler.process('command7_3 some params', extra={}, server=None)
+  yield ('command_process', run)
+
+#==============================
+def bench_irc():
+  """A call to a protocol method with and without the hooks of
+  IrcClient._do_hooks."""
+
+  client = IrcClient({})
+  plain = IrcClientProtocol({})
+  hooked = IrcClientProtocol({})
+  client._do_hooks(hooked)
+  receiver = Receiver()
+  client.events['post_privmsg'].connect(receiver.receive)
+
+  #==============================
+  def run_plain():
+    plain.privmsg('user!ident@host', '#channel', 'hello')
+  yield ('irc_privmsg_plain', run_plain)
+
+  #==============================
+  def run_hooked():
+    hooked.privmsg('user!ident@host', '#channel', 'hello')
+  yield ('irc_privmsg_hooked', run_hooked)
+
+BENCHMARKS = [
+  bench_signal,
+  bench_signal_churn,
+  bench_receiver,
+  bench_players,
+  bench_reassembly,
+  bench_responses,
+  bench_access,
+  bench_config,
+  bench_commands,
+  bench_irc
+]
+
+#==============================
+def _calibrate(timer):
+  """Returns how many calls to time at once so a run takes MIN_TIME."""
+
+  number = 1
+  while timer.timeit(number) < MIN_TIME:
+    number *= 2
+  return number
+
+#==============================
+def measure(fn, reference):
+  """Times fn and the reference in turns. Returns the best time of a single
+  call to fn in microseconds, and the time relative to the reference.
+
+  Timing both in turns cancels out the machine getting faster or slower
+  during the run (frequency scaling, other processes).
+  """
+
+  timer = Timer(fn)
+  reference_timer = Timer(reference)
+  number = _calibrate(timer)
+  reference_number = _calibrate(reference_timer)
+
+  best = reference_best = None
+  for index in xrange(REPEAT):
+    elapsed = timer.timeit(number) / number
+    reference_elapsed = reference_timer.timeit(reference_number) / reference_number
+    if best is None or elapsed < best:
+      best = elapsed
+    if reference_best is None or reference_elapsed < reference_best:
+      reference_best = reference_elapsed
+  return (best * 1000000, best / reference_best)
+
+#==============================
+def run(filters=None, names=None):
+  """Runs the benchmarks whose names contain one of filters, or whose names
+  are in names, or every benchmark. Returns {'us': microseconds, 'relative':
+  time relative to the reference} for each, indexed by name."""
+
+  reference = list(bench_reference())[0][1]
+  results = {}
+  for benchmarks in BENCHMARKS:
+    for benchmark in benchmarks():
+      name, fn = benchmark[:2]
+      if filters and not [f for f in filters if f in name]:
+        continue
+      if names is not None and name not in names:
+        continue
+
+      # Benchmarks of has_access need users in the config.
+      saved = None
+      if len(benchmark) > 2:
+        saved = config.get('users')
+        config['users'] = benchmark[2]
+        rebuild_access()
+      try:
+        us, relative = measure(fn, reference)
+      finally:
+        if len(benchmark) > 2:
+          if saved is None:
+            del config['users']
+          else:
+            config['users'] = saved
+          rebuild_access()
+      results[name] = {'us': us, 'relative': relative}
+  return results
+
+#==============================
+def load_baseline(path):
+  try:
+    fp = open(path, 'r')
+  except IOError:
+    return None
+  try:
+    return json.load(fp)
+  finally:
+    fp.close()
+
+#==============================
+def save_baseline(path, results):
+  fp = open(path, 'w')
+  try:
+    json.dump(results, fp, indent=2, sort_keys=True, separators=(',', ': '))
+    fp.write('\n')
+  finally:
+    fp.close()
+
+#==============================
+def regressions(results, baseline, threshold):
+  """Returns the names of the benchmarks that got slower than the baseline
+  by more than threshold (e.g. 0.25 for 25%)."""
+
+  return [name for name in results if name in baseline and
+    results[name]['relative'] > baseline[name]['relative'] * (1 + threshold)]
+
+#==============================
+def compare(results, baseline, threshold):
+  """Prints the results next to the baseline. Returns the names of the
+  benchmarks that got slower than the baseline by more than threshold
+  (e.g. 0.25 for 25%). The times relative to the reference are compared,
+  not the microseconds."""
+
+  regressed = []
+  print '%-32s %10s %10s %8s %12s' % ('benchmark', 'baseline', 'now', 'change', 'now us')
+  for name in sorted(results):
+    result = results[name]
+    if name not in baseline:
+      print '%-32s %10s %10.2f %8s %12.2f' % (name, '-', result['relative'], 'new', result['us'])
+      continue
+
+    change = result['relative'] / baseline[name]['relative'] - 1
+    flag = ''
+    if change > threshold:
+      regressed.append(name)
+      flag = ' REGRESSED'
+    print '%-32s %10.2f %10.2f %+7.1f%% %12.2f%s' % (name, baseline[name]['relative'], result['relative'],
+      change * 100, result['us'], flag)
+  return regressed
+
+#==============================
+def main_func():
+  parser = OptionParser()
+  parser.add_option('-b', '--baseline', dest='baseline', default=DEFAULT_BASELINE,
+    help='the baseline file to compare with or save to (default: %default)')
+  parser.add_option('-t', '--threshold', type='float', dest='threshold', default=DEFAULT_THRESHOLD,
+    help='fails if a benchmark is slower than the baseline by more than this fraction (default: %default)')
+  parser.add_option('-s', '--save', action='store_true', dest='save', default=False,
+    help='saves the results as the new baseline')
+  parser.add_option('-f', '--filter', dest='filter', default=None,
+    help='a comma separated list of strings; only runs the benchmarks whose names contain one of them')
+
+  (options, args) = parser.parse_args()
+
+  filters = None
+  if options.filter:
+    filters = [f.strip() for f in options.filter.split(',') if f.strip()]
+
+  results = run(filters)
+
+  if options.save:
+    baseline = load_baseline(options.baseline) or {}
+    baseline.update(results)
+    save_baseline(options.baseline, baseline)
+    for name in sorted(results):
+      print '%-32s %12.2f us %10.2f' % (name, results[name]['us'], results[name]['relative'])
+    print 'Saved the baseline to %s' % options.baseline
+    return
+
+  baseline = load_baseline(options.baseline)
+  if baseline is None:
+    parser.error('no baseline at %s, save one with --save' % options.baseline)
+
+  # A benchmark may have been unlucky, e.g. another process ran at the same
+  # time. Time the ones that regressed again and keep the better result.
+  retry = regressions(results, baseline, options.threshold)
+  if retry:
+    for name, result in run(names=retry).items():
+      if result['relative'] < results[name]['relative']:
+        results[name] = result
+
+  regressed = compare(results, baseline, options.threshold)
+  if regressed:
+    print '%d benchmark(s) regressed by more than %.0f%%: %s' % (len(regressed), options.threshold * 100, ', '.join(regressed))
+    sys.exit(1)
+
+#==============================
+if __name__ == "__main__":
+  main_func()
@@ -2,32 +2,43 @@
 
 """Everything that deals with commands goes here."""
 
+import types
 import logging
 import traceback
 import shlex
 import inspect
+from collections import deque
+
+from twisted.internet import reactor, defer, threads
 
 from rconsoft.dispatch.dispatcher import Signal
-from rconsoft.config import config
+from rconsoft.config import config, cget, config_changed
 
 log = logging.getLogger('general')
 
 ALL_COMMANDS = object()
 REMAINING_COMMANDS = object()
+# What a handler returns when its work goes on after it returns.
+ASYNC_RESPONSES = (defer.Deferred, types.GeneratorType)
 
 #==============================
 def command(*args):
   """A simple decorator that stores the commands
-  the method handles into the method itself. This method
-  will be used by the dispatcher made by get_dispatcher.
+  the method handles into the method itself. The methods of an
+  object are connected with CommandHandler.connect_handlers.
   Pass in ALL_COMMANDS in order to catch all commands.
   Pass REMAINING_COMMANDS in order to catch all the remaining
-  commands that did not have handlers.
+  commands that no plugin has a handler for.
   
   Note: This is not necessary to do command handling. This is
   a helper decorator. You can connect to the command handler
   event directly and handle commands yourself.
   
+  A handler doing slow work should return a Deferred (or be a generator,
+  which is run with inlineCallbacks) instead of starting a thread on its
+  own. Blocking work can be run with defer_to_thread. CommandHandler then
+  limits how many of the command run at once. See CommandLimit.
+  
   E.g.
   @command('kick', 'ban')
   func handler(*args, **kwargs):
@@ -37,6 +48,22 @@ def command(*args):
     return f
   return new
 
+#==============================
+def defer_to_thread(f, *args, **kwargs):
+  """Runs f(*args, **kwargs) in a thread and returns a Deferred firing with
+  its result, like twisted's deferToThread. For command handlers doing
+  blocking work.
+  
+  A thread can't be stopped, so cancelling the Deferred (e.g. at the
+  deadline of a CommandLimit) only stops waiting for its result. The
+  Deferred's done attribute fires once the thread has really finished, and
+  CommandLimit keeps the run's place until then."""
+  
+  d = defer.Deferred()
+  d.done = threads.deferToThread(f, *args, **kwargs)
+  d.done.chainDeferred(d)
+  return d
+
 #==============================
 def get_dispatcher(self):
   """Creates a dispatcher for a class that can be connected to
@@ -47,6 +74,11 @@ def get_dispatcher(self):
   Note: This is not necessary to do command handling. This is
   a helper dispatcher. You can connect to the command handler
   event directly and handle commands yourself.  
+  
+  Note: CommandHandler.connect_handlers does the same without a
+  dispatcher per object, and should be used instead. Here
+  REMAINING_COMMANDS is per object: it catches the commands this
+  object has no handler for.
   """
   
   members = inspect.getmembers(self)
@@ -96,39 +128,319 @@ def shell_parse(params):
 #------------------------------
 class CommandInterrupt(Exception):
   """Raise this exception when you want to stop the command
-  from propagating to other plugins."""
+  from propagating to other plugins. The ALL_COMMANDS handlers and
+  CommandHandler.event still get it."""
   pass
 
 #------------------------------
-class CommandHandler(object):  
+class CommandLimit(object):
+  """Runs the handlers of a single command, at most concurrency at once.
+  
+  A run lasts until the Deferreds its handlers returned have fired, or
+  until deadline seconds have passed, when they are cancelled. A run
+  waiting on a thread (see defer_to_thread) lasts until the thread is done,
+  even once cancelled, so no more than concurrency threads run at once.
+  Runs beyond concurrency wait their turn, and beyond queue more they are
+  dropped. A run with the same key as one waiting or running (the same
+  command from the same player) is dropped as well, since its result would
+  be the same. Handlers answer players themselves, so there is no result
+  to share with the dropped run; it is only counted in stats['coalesced'].
+  """
+  
+  #==============================
+  def __init__(self, name, concurrency=2, queue=8, deadline=30.0):
+    self.name = name
+    self.concurrency = max(1, concurrency)
+    self.queue = queue
+    self.deadline = deadline
+    self.running = 0
+    self.waiting = deque() # (key, run, args)
+    self.keys = set() # The keys of the runs waiting or running
+    self.stats = {
+      'runs': 0,
+      'coalesced': 0,
+      'dropped': 0,
+      'expired': 0,
+      'failed': 0
+    }
+  
+  #==============================
+  def submit(self, key, run, *args):
+    """Runs or queues run(*args), a function returning the Deferreds of the
+    handlers it called. Returns False if it was dropped."""
+    
+    if key is not None and key in self.keys:
+      self.stats['coalesced'] += 1
+      log.debug('[%s] %s is already running for %s' % (self.__class__.__name__, self.name, key))
+      return False
+    
+    if self.running >= self.concurrency and len(self.waiting) >= self.queue:
+      self.stats['dropped'] += 1
+      log.warning('[%s] too many %s commands waiting, dropping one' % (self.__class__.__name__, self.name))
+      return False
+    
+    if key is not None:
+      self.keys.add(key)
+    if self.running >= self.concurrency:
+      self.waiting.append((key, run, args))
+    else:
+      self._start(key, run, args)
+    return True
+  
+  #==============================
+  def adopt(self, key, deferreds):
+    """Counts deferreds, the Deferreds of a run that was started without
+    the limit, as running until they fire. Runs submitted meanwhile wait
+    for it like for any other."""
+    
+    if key is not None:
+      self.keys.add(key)
+    self.running += 1
+    self.stats['runs'] += 1
+    self._track(key, deferreds)
+  
+  #==============================
+  def _start(self, key, run, args):
+    self.running += 1
+    self.stats['runs'] += 1
+    try:
+      deferreds = run(*args)
+    except:
+      self._finish(None, key, None)
+      raise
+    self._track(key, deferreds)
+  
+  #==============================
+  def _track(self, key, deferreds):
+    if not deferreds:
+      self._finish(None, key, None)
+      return
+    
+    for d in deferreds:
+      d.addErrback(self._failed)
+    timeout = reactor.callLater(self.deadline, self._expire, deferreds)
+    finished = [getattr(d, 'done', d) for d in deferreds]
+    defer.DeferredList(finished).addCallback(self._finish, key, timeout)
+  
+  #==============================
+  def _failed(self, failure):
+    if not failure.check(defer.CancelledError):
+      self.stats['failed'] += 1
+      log.error('[%s] %s failed: %s' % (self.__class__.__name__, self.name, failure.getTraceback()))
+  
+  #==============================
+  def _expire(self, deferreds):
+    self.stats['expired'] += 1
+    log.warning('[%s] %s took more than %s seconds, cancelling it' % (self.__class__.__name__, self.name, self.deadline))
+    for d in deferreds:
+      if not d.called:
+        d.cancel()
+  
+  #==============================
+  def _finish(self, result, key, timeout):
+    if timeout is not None and timeout.active():
+      timeout.cancel()
+    self.running -= 1
+    self.keys.discard(key)
+    self._start_waiting()
+  
+  #==============================
+  def configure(self, concurrency, queue, deadline):
+    """Changes the limits. Runs already started keep their deadline, and
+    runs waiting beyond a smaller queue still run."""
+    
+    self.concurrency = max(1, concurrency)
+    self.queue = queue
+    self.deadline = deadline
+    self._start_waiting()
+  
+  #==============================
+  def _start_waiting(self):
+    while self.waiting and self.running < self.concurrency:
+      key, run, args = self.waiting.popleft()
+      try:
+        self._start(key, run, args)
+      except:
+        log.error('[%s] %s failed: %s' % (self.__class__.__name__, self.name, traceback.format_exc()))
+
+#------------------------------
+class CommandHandler(object):
+  """Routes commands to their handlers. Every command has a signal in
+  self.routes, as do ALL_COMMANDS and REMAINING_COMMANDS, so a command
+  only costs a lookup and the handlers it has. self.event is sent every
+  command, for whoever wants to handle commands themselves.
+  
+  Most handlers answer right away, so a command is called directly until
+  one of its handlers returns a Deferred. From then on it runs through a
+  CommandLimit, set up from the [commands] section of the config and
+  updated when it is reloaded. Commands with a subsection of their own
+  there run through their limit from the start. Commands without handlers
+  of their own share the limit of REMAINING_COMMANDS. The ALL_COMMANDS
+  handlers and self.event observe every command, even one the limit drops,
+  so they aren't limited and should be quick."""
+  
   #==============================
   def __init__(self):
     self._init_signals()
+    self.limits = {} # Indexed by command
+    self._configured_limits()
+    config_changed.connect(self.on_config_changed)
     
   #==============================
   def _init_signals(self):
     self.event = Signal()
+    self.routes = {} # Indexed by command
+  
+  #==============================
+  def limit(self, command):
+    """Returns the CommandLimit of a command."""
+    
+    limit = self.limits.get(command)
+    if limit is None:
+      name = isinstance(command, basestring) and command or 'remaining commands'
+      limit = self.limits[command] = CommandLimit(name, **self._limit_options(command))
+    return limit
+  
+  #==============================
+  def _configured_limits(self):
+    """Makes the limits of the commands with a subsection in [commands]."""
+    
+    for command, options in cget('commands', default={}).items():
+      if isinstance(options, dict):
+        self.limit(command)
+  
+  #==============================
+  def _limit_options(self, command):
+    section = cget('commands', default={})
+    options = {}
+    if isinstance(command, basestring) and isinstance(section.get(command), dict):
+      options = section[command]
+    
+    #==============================
+    def option(key, default):
+      return options.get(key, section.get(key, default))
+    
+    return {
+      'concurrency': int(option('concurrency', 2)),
+      'queue': int(option('queue', 8)),
+      'deadline': float(option('deadline', 30))
+    }
+  
+  #==============================
+  def on_config_changed(self, paths, **kwargs):
+    """Applies a changed [commands] section to the limits already made."""
+    
+    for path in paths:
+      if path[0] == 'commands':
+        break
+    else:
+      return
+    for command, limit in self.limits.items():
+      limit.configure(**self._limit_options(command))
+    self._configured_limits()
 
+  #==============================
+  def connect_command(self, command, receiver, weak=True):
+    """Connects a receiver to a single command, or to ALL_COMMANDS or
+    REMAINING_COMMANDS."""
+    
+    route = self.routes.get(command)
+    if route is None:
+      route = self.routes[command] = Signal()
+    route.connect(receiver, weak=weak)
+  
+  #==============================
+  def disconnect_command(self, command, receiver, weak=True):
+    """Undoes a call to connect_command."""
+    
+    route = self.routes.get(command)
+    if route is not None:
+      route.disconnect(receiver, weak=weak)
+  
+  #==============================
+  def connect_handlers(self, obj):
+    """Connects every method of obj tagged by the command decorator to the
+    commands it handles."""
+    
+    for name, method in inspect.getmembers(obj, inspect.ismethod):
+      for command in getattr(method, '__commands__', []):
+        self.connect_command(command, method)
+  
   #==============================
   def process(self, command, extra=None, silent=False, **kwargs):
     command = command.split(' ')
     params = ' '.join(command[1:])
     command = command[0]
-    stop = False
-        
-    try:
-      stop = self.event.send(
-        sender=self.__class__,
-        command=command,
-        params=params,
-        extra=extra,
-        silent=silent,
-        **kwargs
-      )
-    except CommandInterrupt:
-      pass
-    except:
-      raise
+    
+    named = kwargs
+    named['sender'] = self.__class__
+    named['command'] = command
+    named['params'] = params
+    named['extra'] = extra
+    named['silent'] = silent
+    
+    if command:
+      limited = command
+      route = self.routes.get(command)
+      # The handlers of the remaining commands are only called if no
+      # plugin handles the command.
+      if route is None or not route.receivers:
+        limited = REMAINING_COMMANDS
+        route = self.routes.get(REMAINING_COMMANDS)
+      if route is not None and route.receivers:
+        limit = self.limits.get(limited)
+        if limit is not None:
+          limit.submit(self._key(named), self._run, route, named)
+        else:
+          deferreds = self._run(route, named)
+          if deferreds:
+            self.limit(limited).adopt(self._key(named), deferreds)
+      route = self.routes.get(ALL_COMMANDS)
+      if route is not None and route.receivers:
+        self._observe(route, named)
+    if self.event.receivers:
+      self._observe(self.event, named)
+  
+  #==============================
+  def _key(self, named):
+    """Returns the key a command is coalesced by: the same command from the
+    same player on the same server. Commands whose player isn't known are
+    never coalesced."""
+    
+    uniqueid = named['extra'] and named['extra'].get('uniqueid')
+    if uniqueid:
+      return (named['command'], named['params'], uniqueid, named.get('server'))
+    return None
+  
+  #==============================
+  def _run(self, route, named):
+    """Sends a command to a route. Returns the Deferreds the handlers
+    returned. A handler raising an exception is logged, and the handlers
+    after it still run, unless the exception is CommandInterrupt."""
+    
+    deferreds = []
+    for receiver in route.live_receivers(named['sender']):
+      try:
+        response = receiver(signal=route, **named)
+      except CommandInterrupt:
+        break
+      except:
+        log.error('[%s] a %s handler failed: %s' % (self.__class__.__name__, named['command'], traceback.format_exc()))
+        continue
+      if isinstance(response, ASYNC_RESPONSES):
+        if isinstance(response, types.GeneratorType):
+          response = defer.inlineCallbacks(lambda response=response: response)()
+        deferreds.append(response)
+    return deferreds
+  
+  #==============================
+  def _observe(self, route, named):
+    for d in self._run(route, named):
+      d.addErrback(self._observer_failed, named['command'])
+  
+  #==============================
+  def _observer_failed(self, failure, command):
+    log.error('[%s] a %s handler failed: %s' % (self.__class__.__name__, command, failure.getTraceback()))
     
     ##==============================
     ## A helper function that called a command function with
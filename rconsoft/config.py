@@ -4,12 +4,22 @@
 
 import os
 import sys
+import keyword
+import logging
 from configobj import ConfigObj, Section
 
-__all__ = ['config', 'has_access', 'INSTALLDIR', 'cget']
+from twisted.internet import reactor, threads
+from twisted.python.filepath import FilePath
+
+from rconsoft.dispatch.dispatcher import Signal
+
+__all__ = ['config', 'has_access', 'uniqueids_with_access', 'rebuild_access', 'INSTALLDIR', 'cget',
+  'settings', 'load_settings', 'ConfigError', 'config_changed', 'reload_config', 'ConfigWatcher']
 
 INSTALLDIR = os.path.dirname(sys.modules[__name__].__file__)
 
+log = logging.getLogger('general')
+
 #==============================
 def mergeif(self, indict):
   """
@@ -25,6 +35,8 @@ Section.mergeif = mergeif
 
 #++++++++++++++++++++++++++++++
 
+# Replaced as a whole when the config is reloaded. Read it through cget
+# rather than importing it, which would keep the config of the import.
 config = ConfigObj(os.path.join(INSTALLDIR, 'rconsoft.conf'))
 
 #==============================
@@ -52,11 +64,374 @@ ACCESS_LEVELS = [
   'guest'
 ]
 
+# The index of each access level. Lower is more access.
+ACCESS_INDEX = dict((access, level) for level, access in enumerate(ACCESS_LEVELS))
+
+# (the level of each uniqueid in [users], the uniqueids at or above each
+# level). Replaced as a whole by rebuild_access, so a lookup never sees half
+# of an old index and half of a new one.
+_access = ({}, [frozenset()] * len(ACCESS_LEVELS))
+
 #==============================
-def has_access(uniqueid, access):
-  level = ACCESS_LEVELS.index(access)
-  for user in config['users']:
+def rebuild_access():
+  """Rebuilds the access index from the [users] section of the config. Call
+  it whenever [users] changes. A user listed more than once gets the most
+  access they are given."""
+  
+  global _access
+  
+  levels = {}
+  for user in cget('users', default={}):
     entry = config['users'][user]
-    if entry['uniqueid'] == uniqueid and ACCESS_LEVELS.index(entry['access']) <= level:
-      return True
-  return False
+    if not isinstance(entry, dict):
+      continue
+    uniqueid = entry.get('uniqueid')
+    level = ACCESS_INDEX.get(entry.get('access'))
+    if uniqueid is None or level is None:
+      continue
+    if uniqueid not in levels or level < levels[uniqueid]:
+      levels[uniqueid] = level
+  
+  at_or_above = [frozenset(u for u, l in levels.iteritems() if l <= index)
+    for index in xrange(len(ACCESS_LEVELS))]
+  _access = (levels, at_or_above)
+
+#==============================
+def has_access(uniqueid, access):
+  level = _access[0].get(uniqueid)
+  return level is not None and level <= ACCESS_INDEX[access]
+
+#==============================
+def uniqueids_with_access(access):
+  """Returns a frozenset of the uniqueids with access or more."""
+  
+  return _access[1][ACCESS_INDEX[access]]
+
+#++++++++++++++++++++++++++++++
+
+#------------------------------
+class ConfigError(Exception):
+  """Raised when the config has an option that can't be used."""
+
+#------------------------------
+class Settings(object):
+  """A compiled section of the config. Its options and subsections are
+  attributes, already converted to the types they're used as. Options named
+  after a python keyword get a trailing underscore (e.g. plugins.exec_).
+  Settings can't be changed; change the config and call load_settings."""
+  
+  #==============================
+  def __init__(self, values):
+    self.__dict__.update(values)
+  
+  #==============================
+  def __setattr__(self, name, value):
+    raise AttributeError('settings are read only')
+  
+  #==============================
+  def __delattr__(self, name):
+    raise AttributeError('settings are read only')
+  
+  #==============================
+  def __repr__(self):
+    return '<Settings %r>' % self.__dict__
+
+#==============================
+def string(value):
+  if isinstance(value, (list, tuple)):
+    raise ValueError('expected a single value')
+  return value
+
+#==============================
+def escaped_string(value):
+  """A string with escapes (e.g. '\\x37' for '7') interpreted."""
+  
+  return string(value).decode('string-escape')
+
+#==============================
+def integer(value):
+  return int(string(value))
+
+#==============================
+def string_list(value):
+  if not isinstance(value, (list, tuple)):
+    value = [value]
+  return tuple(value)
+
+#==============================
+def integer_list(value):
+  return tuple([int(item) for item in string_list(value)])
+
+#==============================
+def lowercase_set(value):
+  return frozenset([item.lower() for item in string_list(value)])
+
+# The options compiled into settings, as { section : { option : (converter,
+# default) } }. Sections nest the same way they do in the config. Options
+# missing from the config get their default, which isn't converted.
+SETTINGS = {
+  'game': {
+    'hostname': (string, None),
+    'password': (string, None),
+    'default_password': (string, 'scrim'),
+  },
+  'rcon': {
+    'local': {
+      'host': (string, ''),
+      'port': (integer, 27129),
+      'max_batch': (integer, 64),
+      'receive_buffer': (integer, 1048576),
+    },
+    'remote': {
+      'host': (string, None),
+      'port': (integer, 27129),
+    },
+  },
+  'plugins': {
+    'exec': {
+      'scripts_path': (string, None),
+      'exec_on_lo3': (string, None),
+      'lo3_messages': (string_list, ('[ Going live on 3 restarts ]', '[ Two more restarts ]', '[ Last restart ]')),
+      'lo3_delays': (integer_list, (2, 2, 5)),
+      'lo3_live_message': (string, '[* LIVE LIVE LIVE *]'),
+    },
+    'ircbot': {
+      'host': (string, None),
+      'port': (integer, 6667),
+      'alias': (string, None),
+      'nickname': (string, None),
+      'username': (string, None),
+      'realname': (string, ''),
+      'authname': (string, None),
+      'password': (string, None),
+      'channels': (string_list, ()),
+      'modes': (string, ''),
+      'ignore_nicks': (lowercase_set, frozenset()),
+      'ad': (escaped_string, ''),
+      'ad_interval': (integer, 45),
+      'default_comment': (string, 'de_any'),
+      'accept_message': (string, 'connect {host}:{port};password {password}'),
+    },
+  },
+}
+
+# The current settings. load_settings replaces what is in it rather than the
+# object itself, so it can be imported.
+settings = Settings({})
+
+#==============================
+def _section_name(path):
+  return ' '.join(['%s%s%s' % ('[' * depth, name, ']' * depth) for depth, name in enumerate(path, 1)])
+
+#==============================
+def compile_settings(section, schema=SETTINGS, path=()):
+  """Converts a section of the config into Settings as described by schema.
+  Raises ConfigError naming the option that couldn't be converted."""
+  
+  values = {}
+  for name, spec in schema.items():
+    attr = keyword.iskeyword(name) and name + '_' or name
+    value = section.get(name) if section is not None else None
+    if isinstance(spec, dict):
+      if value is not None and not isinstance(value, dict):
+        raise ConfigError('%s should be a section' % _section_name(path + (name,)))
+      values[attr] = compile_settings(value, spec, path + (name,))
+    else:
+      convert, default = spec
+      if value is None:
+        values[attr] = default
+        continue
+      try:
+        values[attr] = convert(value)
+      except (ValueError, TypeError), e:
+        raise ConfigError('%s %s = %r: %s' % (_section_name(path), name, value, e))
+  return Settings(values)
+
+#==============================
+def check_settings(compiled, source=None):
+  """Checks the options of source, the config compiled, that depend on each
+  other or on more than their type. source defaults to the current config.
+  Raises ConfigError on the first problem."""
+  
+  if source is None:
+    source = config
+  lo3 = compiled.plugins.exec_
+  if len(lo3.lo3_delays) < len(lo3.lo3_messages):
+    raise ConfigError('[plugins] [[exec]] lo3_delays needs a delay for each of lo3_messages')
+  
+  users = source.get('users', {})
+  if not isinstance(users, dict):
+    raise ConfigError('[users] should be a section')
+  for user, entry in users.items():
+    if not isinstance(entry, dict):
+      raise ConfigError('[users] %s should be a section' % user)
+    if not entry.get('uniqueid'):
+      raise ConfigError('[users] [[%s]] has no uniqueid' % user)
+    if entry.get('access') not in ACCESS_INDEX:
+      raise ConfigError('[users] [[%s]] access = %r: expected one of %s' % (user, entry.get('access'), ', '.join(ACCESS_LEVELS)))
+
+#==============================
+def _use_settings(compiled):
+  object.__setattr__(settings, '__dict__', compiled.__dict__)
+  rebuild_access()
+
+#==============================
+def load_settings():
+  """Compiles and checks the config, then replaces settings and the access
+  index with it. If the config is invalid, ConfigError is raised and the
+  current settings are kept."""
+  
+  compiled = compile_settings(config)
+  check_settings(compiled)
+  _use_settings(compiled)
+
+#==============================
+def _load_initial_settings():
+  """Loads the settings when the module is imported. An invalid config
+  doesn't stop the import; Controller.setup loads the settings again and
+  reports it. Until then the defaults are used."""
+  
+  try:
+    load_settings()
+  except ConfigError:
+    _use_settings(compile_settings(None))
+
+_load_initial_settings()
+
+#++++++++++++++++++++++++++++++
+
+# Sent after the config is reloaded, with paths: a list of the (section,
+# ..., option) tuples that changed. A section added or removed is a single
+# path. settings and the access index are already up to date by then.
+config_changed = Signal(providing_args=['paths'])
+
+#==============================
+def changed_paths(old, new, path=()):
+  """Returns the paths of the options and sections that differ between two
+  configs, sorted."""
+  
+  paths = []
+  for name in sorted(set(old) | set(new)):
+    if name in old and name in new:
+      if isinstance(old[name], dict) and isinstance(new[name], dict):
+        paths.extend(changed_paths(old[name], new[name], path + (name,)))
+        continue
+      if old[name] == new[name]:
+        continue
+    paths.append(path + (name,))
+  return paths
+
+#==============================
+def apply_config(new):
+  """Replaces the config with new, a ConfigObj, then sends config_changed.
+  Returns the paths that changed. If new is invalid, ConfigError is raised
+  and nothing is replaced.
+  
+  new is swapped in with a single assignment, as settings is, so cget never
+  sees half of the old config and half of the new one, even in a thread."""
+  
+  global config
+  
+  compiled = compile_settings(new)
+  check_settings(compiled, new)
+  
+  paths = changed_paths(config, new)
+  if not paths:
+    return paths
+  
+  config = new
+  _use_settings(compiled)
+  
+  for receiver, response in config_changed.send_robust(sender=config, paths=paths):
+    if isinstance(response, Exception):
+      log.error('[config] %r failed handling config_changed: %s' % (receiver, response))
+  return paths
+
+#==============================
+def reload_config():
+  """Reads the config file again in a thread and applies it in the reactor
+  thread. Returns a Deferred firing with the paths that changed."""
+  
+  d = threads.deferToThread(ConfigObj, config.filename)
+  d.addCallback(apply_config)
+  return d
+
+#------------------------------
+class ConfigWatcher(object):
+  """Reloads the config when its file changes, using inotify. A reload
+  happens delay seconds after the last change to the file, since editors
+  often write it in several steps. An invalid config is logged and the
+  current one kept."""
+  
+  #==============================
+  def __init__(self, delay=1.0):
+    self.delay = delay
+    self.notifier = None
+    self.pending = None # The delayed call of the next reload
+    self.reloading = False
+    self.again = False # Whether to reload again once reloading finishes
+  
+  #==============================
+  def start(self):
+    """Starts watching. Returns False if inotify isn't available."""
+    
+    try:
+      from twisted.internet import inotify
+      self.notifier = inotify.INotify()
+    except Exception, e:
+      log.warning('[%s] not watching the config, inotify is not available: %s' % (self.__class__.__name__, e))
+      return False
+    
+    # The directory is watched rather than the file, since editors often
+    # replace the file instead of writing to it, which ends a watch on it.
+    path = FilePath(config.filename)
+    self.name = path.basename()
+    self.notifier.startReading()
+    self.notifier.watch(path.parent(), mask=inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO,
+      callbacks=[self._notified])
+    return True
+  
+  #==============================
+  def stop(self):
+    if self.pending is not None and self.pending.active():
+      self.pending.cancel()
+    if self.notifier is not None:
+      self.notifier.loseConnection()
+      self.notifier = None
+  
+  #==============================
+  def _notified(self, ignored, path, mask):
+    if path.basename() != self.name:
+      return
+    if self.pending is not None and self.pending.active():
+      self.pending.reset(self.delay)
+    else:
+      self.pending = reactor.callLater(self.delay, self.reload)
+  
+  #==============================
+  def reload(self):
+    """Reloads the config, or does so again after the reload in progress."""
+    
+    if self.reloading:
+      self.again = True
+      return
+    self.reloading = True
+    d = reload_config()
+    d.addCallbacks(self._reloaded, self._failed)
+    d.addBoth(self._finish)
+  
+  #==============================
+  def _reloaded(self, paths):
+    if paths:
+      log.info('[%s] reloaded the config, changed: %s' % (self.__class__.__name__, ', '.join(['.'.join(path) for path in paths])))
+  
+  #==============================
+  def _failed(self, failure):
+    log.error('[%s] not reloading the config: %s' % (self.__class__.__name__, failure.getErrorMessage()))
+  
+  #==============================
+  def _finish(self, result):
+    self.reloading = False
+    if self.again:
+      self.again = False
+      self.reload()
@@ -6,48 +6,102 @@ import logging
 
 from twisted.internet import reactor
 
-from rconsoft.rcon.client import HL1Network
 from rconsoft.rcon.tracker import RconTracker
-from rconsoft.config import cget
-from rconsoft import command_handler, rcon_client, rcon_receiver
+from rconsoft.rcon.receiver import event
+from rconsoft.server import Server
+from rconsoft.config import cget, settings, load_settings, ConfigError, config_changed
+from rconsoft import command_handler, rcon_client, rcon_receiver, servers
 
 log = logging.getLogger('general')
 log_detail = logging.getLogger('detail')
 
+# The parts of the config that are only read at startup.
+RESTART_PATHS = [('global',), ('rcon',), ('servers',), ('game', 'hostname')]
+
 #------------------------------
 class Controller(object):
   #==============================
-  def __init__(self):
-    self.rcon_tracker = None
+  def setup(self):
+    """Connects to the servers in the config. Raises ConfigError, after
+    logging it, if the config is invalid."""
+    
+    try:
+      load_settings()
+    except ConfigError, e:
+      log.error('[%s] the config is invalid: %s' % (self.__class__.__name__, e))
+      raise
+    
+    self.setup_events()
+    config_changed.connect(self.on_config_changed)
+    local = settings.rcon.local
+    rcon_receiver.listen(local.port, interface=local.host,
+      max_batch=local.max_batch, receive_buffer=local.receive_buffer)
+    
+    # Each section of [servers] is a server. Options that aren't set for a
+    # server are taken from [rcon]. Without [servers], [rcon] is the only server.
+    sections = cget('servers', default={})
+    if not sections:
+      sections = {'default': cget('rcon')}
+    
+    for name in sections:
+      if not isinstance(sections[name], dict):
+        continue
+      server = self._create_server(name, sections[name])
+      server.network.ready.connect(self.on_rcon_client_ready)
+      server.rcon_client.set_default_hostname(sections[name].get('hostname', settings.game.hostname))
+      reactor.listenUDP(0, server.network)
   
   #==============================
-  def setup(self):
-    rcon_receiver.event.connect(self.on_rcon_event)
-    reactor.listenUDP(interface=cget('rcon', 'local', 'host'), port=int(cget('rcon', 'local', 'port')), protocol=rcon_receiver)
-    
-    network = HL1Network(cget('rcon', 'host'), int(cget('rcon', 'port')), cget('rcon', 'password'))
-    network.ready.connect(self.on_rcon_client_ready)
-    rcon_client.set_network(network)
-    rcon_client.set_default_hostname(cget('game', 'hostname'))
-    reactor.listenUDP(0, network)
+  def setup_events(self):
+    """Connects the controller to the log events without touching the
+    network. setup calls this, and so does the log replay tool."""
+    
+    rcon_receiver.set_servers(servers)
+    rcon_receiver.connect_handlers(self)
+  
+  #==============================
+  def _create_server(self, name, section):
+    #==============================
+    def option(key, default=None):
+      return section.get(key, cget('rcon', key, default=default))
+    
+    # The first server uses the global rcon_client.
+    return servers.add(Server(
+      name, option('host'), int(option('port')), option('password'),
+      rcon_client=rcon_client if not len(servers) else None,
+      window=int(option('window', 8)),
+      max_pending=int(option('max_pending', 256)),
+      batch_size=int(option('batch_size', 512)),
+      rate=float(option('rate', 20)),
+      burst=int(option('burst', 10)),
+      lane_limits=[int(x) for x in option('lane_limits', [64, 64, 128])],
+      max_challenge_age=int(option('max_challenge_age', 300))))
   
   #==============================
-  def on_rcon_client_ready(self, **kwargs):
-    #rcon_client.command('logaddress_del %s %s' % (config['rcon']['remote']['host'], config['rcon']['remote']['port']))
-    rcon_client.command('logaddress_add %s %s' % (cget('rcon', 'remote', 'host'), cget('rcon', 'remote', 'port')))
+  def on_config_changed(self, paths, **kwargs):
+    for path in paths:
+      if [prefix for prefix in RESTART_PATHS if path[:len(prefix)] == prefix]:
+        log.warning('[%s] %s changed, restart for it to take effect' % (self.__class__.__name__, '.'.join(path)))
+  
+  #==============================
+  def on_rcon_client_ready(self, network, **kwargs):
+    server = servers.find_network(network)
+    
+    #server.rcon_client.command('logaddress_del %s %s' % (config['rcon']['remote']['host'], config['rcon']['remote']['port']))
+    remote = settings.rcon.remote
+    server.rcon_client.command('logaddress_add %s %s' % (remote.host, remote.port), deferred=False)
     
-    if not self.rcon_tracker:
-      self.rcon_tracker = RconTracker()
-      self.rcon_tracker.setup()
+    if not server.rcon_tracker:
+      server.rcon_tracker = RconTracker(server)
+      server.rcon_tracker.setup()
     
   #============================== 
-  def on_rcon_event(self, event, data, **kwargs):
+  @event('user_say')
+  def on_user_say(self, event, data, server=None, **kwargs):
     # Process commands
-    if event == 'user_say':
-      if data['message'].startswith('.'):
-        command_handler.process(data['message'][1:], extra=data)
-        log_detail.debug('[%s] Typed command: %s' % (data['name'], data['message']))
-      elif data['message'].startswith('/'):
-        command_handler.process(data['message'][1:], extra=data, silent=True)
-        log_detail.debug('[%s] Typed command: %s' % (data['name'], data['message']))
-    
\ No newline at end of file
+    if data['message'].startswith('.'):
+      command_handler.process(data['message'][1:], extra=data, server=server)
+      log_detail.debug('[%s] Typed command: %s' % (data['name'], data['message']))
+    elif data['message'].startswith('/'):
+      command_handler.process(data['message'][1:], extra=data, silent=True, server=server)
+      log_detail.debug('[%s] Typed command: %s' % (data['name'], data['message']))
@@ -1,8 +1,5 @@
 import weakref
-try:
-    set
-except NameError:
-    from sets import Set as set # Python 2.3 fallback
+from collections import OrderedDict
 
 import saferef
 
@@ -13,18 +10,33 @@ def _make_id(target):
         return (id(target.im_self), id(target.im_func))
     return id(target)
 
+NONE_ID = _make_id(None)
+
 class Signal(object):
     """Base class for all signals
     
     Internal attributes:
-        receivers -- { receriverkey (id) : weakref(receiver) }
+        receivers -- { (receiverkey (id), senderkey (id)) : weakref(receiver) }
+            Ordered by when the receivers were connected.
+        sender_receivers_cache -- { senderkey (id) : ((receiver, is weakref), ...) }
+            The receivers for each sender, as send found them. It is
+            cleared whenever a receiver is connected, disconnected or dies,
+            and must be cleared by anything else changing receivers.
     """
     
     def __init__(self, providing_args=None):
         """providing_args -- A list of the arguments this signal can pass along in
                        a send() call.
         """
-        self.receivers = []
+        self.receivers = OrderedDict()
+        # { id(weakref(receiver)) : [lookup key, ...] }, to find the
+        # connections of a weak reference that died.
+        self._weak_keys = {}
+        self.sender_receivers_cache = {}
+        # Whether any receiver is connected to a particular sender. If none
+        # is, every sender has the same receivers and a single cache entry
+        # does for all of them.
+        self._sender_specific = False
         if providing_args is None:
             providing_args = []
         self.providing_args = set(providing_args)
@@ -92,11 +104,13 @@ class Signal(object):
         if weak:
             receiver = saferef.safeRef(receiver, onDelete=self._remove_receiver)
 
-        for r_key, _ in self.receivers:
-            if r_key == lookup_key:
-                break
-        else:
-            self.receivers.append((lookup_key, receiver))
+        if lookup_key not in self.receivers:
+            self.receivers[lookup_key] = receiver
+            if weak:
+                self._weak_keys.setdefault(id(receiver), []).append(lookup_key)
+            if lookup_key[1] != NONE_ID:
+                self._sender_specific = True
+            self.sender_receivers_cache.clear()
 
     def disconnect(self, receiver=None, sender=None, weak=True, dispatch_uid=None):
         """Disconnect receiver from sender for signal
@@ -120,9 +134,15 @@ class Signal(object):
         else:
             lookup_key = (_make_id(receiver), _make_id(sender))
 
-        for idx, (r_key, _) in enumerate(self.receivers):
-            if r_key == lookup_key:
-                del self.receivers[idx]
+        receiver = self.receivers.pop(lookup_key, None)
+        if receiver is None:
+            return
+        keys = self._weak_keys.get(id(receiver))
+        if keys is not None:
+            keys.remove(lookup_key)
+            if not keys:
+                del self._weak_keys[id(receiver)]
+        self.sender_receivers_cache.clear()
 
     def send(self, sender, **named):
         """Send signal from sender to all connected receivers.
@@ -149,6 +169,35 @@ class Signal(object):
             responses.append((receiver, response))
         return responses
 
+    def send_fast(self, sender, **named):
+        """Send signal from sender to all connected receivers, without
+        collecting their responses.
+
+        Use it where the responses aren't needed, e.g. for signals sent
+        for every log line. Errors propagate the same way as with send.
+
+        returns None
+        """
+
+        if not self.receivers:
+            return
+
+        if self._sender_specific:
+            senderkey = _make_id(sender)
+        else:
+            senderkey = NONE_ID
+        try:
+            receivers = self.sender_receivers_cache[senderkey]
+        except KeyError:
+            receivers = self._find_receivers(senderkey)
+
+        for receiver, weak in receivers:
+            if weak:
+                receiver = receiver()
+                if receiver is None:
+                    continue
+            receiver(signal=self, sender=sender, **named)
+
     def send_robust(self, sender, **named):
         """Send signal from sender to all connected receivers catching errors
 
@@ -182,6 +231,34 @@ class Signal(object):
                 responses.append((receiver, response))
         return responses
 
+    def live_receivers(self, sender=None):
+        """Returns the receivers send would call for sender, in order.
+
+        For callers that call the receivers themselves, e.g. to handle the
+        errors of each one. Call them with signal=self and sender=sender.
+        """
+        if not self.receivers:
+            return []
+        if self._sender_specific:
+            return self._live_receivers(_make_id(sender))
+        return self._live_receivers(NONE_ID)
+
+    def _find_receivers(self, senderkey):
+        """Find the receivers connected to senderkey and cache them
+
+        Returns a tuple of (receiver, whether receiver is a weak reference).
+        The weak references are left as they are: resolving them here would
+        keep the receivers alive through the cache.
+        """
+        if not self._sender_specific:
+            senderkey = NONE_ID
+
+        receivers = tuple([(receiver, isinstance(receiver, WEAKREF_TYPES))
+            for (receiverkey, r_senderkey), receiver in self.receivers.iteritems()
+            if r_senderkey == NONE_ID or r_senderkey == senderkey])
+        self.sender_receivers_cache[senderkey] = receivers
+        return receivers
+
     def _live_receivers(self, senderkey):
         """Filter sequence of receivers to get resolved, live receivers
 
@@ -189,26 +266,29 @@ class Signal(object):
         and resolves them, then returning only live
         receivers.
         """
-        none_senderkey = _make_id(None)
-
-        for (receiverkey, r_senderkey), receiver in self.receivers:
-            if r_senderkey == none_senderkey or r_senderkey == senderkey:
-                if isinstance(receiver, WEAKREF_TYPES):
-                    # Dereference the weak reference.
-                    receiver = receiver()
-                    if receiver is not None:
-                        yield receiver
-                else:
-                    yield receiver
+        if not self._sender_specific:
+            senderkey = NONE_ID
+        try:
+            receivers = self.sender_receivers_cache[senderkey]
+        except KeyError:
+            receivers = self._find_receivers(senderkey)
+
+        live = []
+        for receiver, weak in receivers:
+            if weak:
+                # Dereference the weak reference.
+                receiver = receiver()
+                if receiver is None:
+                    continue
+            live.append(receiver)
+        return live
 
     def _remove_receiver(self, receiver):
         """Remove dead receivers from connections."""
 
-        to_remove = []
-        for key, connected_receiver in self.receivers:
-            if connected_receiver == receiver:
-                to_remove.append(key)
-        for key in to_remove:
-            for idx, (r_key, _) in enumerate(self.receivers):
-                if r_key == key:
-                    del self.receivers[idx]
+        keys = self._weak_keys.pop(id(receiver), None)
+        if keys is None:
+            return
+        for key in keys:
+            self.receivers.pop(key, None)
+        self.sender_receivers_cache.clear()
@@ -0,0 +1,494 @@
+#!/usr/bin/env python
+# Read LICENSE for licensing details.
+"""A fake HLDS to test RconSoft against without a game server.
+
+It answers rcon the way a HL1 server does (challenge rcon, password checks,
+users, user, status, cvars, echo, ...) and sends a made up log stream to
+every address added with logaddress_add. Replies can be split into 0xFE
+packets, and packets can be lost, delayed and reordered, so HL1Network,
+the tracker and the plugins can be load tested on a single box.
+
+Example:
+  rconsoft-fakehlds --port 27015 --players 32 --loss 0.05 --log-rate 200
+"""
+
+import re
+import time
+import struct
+import random
+import logging
+from optparse import OptionParser
+
+from twisted.internet import reactor, task
+from twisted.internet.protocol import DatagramProtocol
+
+log = logging.getLogger('general')
+
+HEADER = '\xFF\xFF\xFF\xFF'
+SPLIT_HEADER = '\xFE\xFF\xFF\xFF'
+
+# rcon <challenge> "<password>" <commands>. The password may be unquoted.
+RCON_RE = re.compile(r'^rcon (?P<challenge>\d+) (?:"(?P<quoted>[^"]*)"|(?P<password>\S*)) ?(?P<commands>.*)$', re.DOTALL)
+
+TEAMS = ['CT', 'TERRORIST']
+MODELS = {
+  'CT': ['urban', 'gsg9', 'sas', 'gign'],
+  'TERRORIST': ['terror', 'leet', 'arctic', 'guerilla']
+}
+WEAPONS = ['ak47', 'm4a1', 'awp', 'deagle', 'usp', 'glock18', 'famas', 'galil']
+CHAT = ['gg', 'nice', 'rush b', 'eco', 'save', 'lol', '.id', 'wp', 'nt']
+
+#==============================
+def split_commands(commands):
+  """Splits commands on the semicolons which aren't quoted, like the
+  hlds does."""
+
+  result = []
+  quoted = False
+  start = 0
+  for index, char in enumerate(commands):
+    if char == '"':
+      quoted = not quoted
+    elif char == ';' and not quoted:
+      result.append(commands[start:index])
+      start = index + 1
+  result.append(commands[start:])
+  return [command.strip() for command in result if command.strip()]
+
+#==============================
+def split_packet(packet, size, sequence):
+  """Splits a packet into 0xFE packets whose payloads are at most size
+  bytes. A packet can't be split into more than 15 pieces, so size is
+  raised if needed."""
+
+  size = max(size, (len(packet) + 14) // 15)
+  pieces = [packet[offset:offset + size] for offset in xrange(0, len(packet), size)]
+  count = len(pieces)
+  return [SPLIT_HEADER + struct.pack('<iB', sequence, (index << 4) | count) + piece
+    for index, piece in enumerate(pieces)]
+
+#------------------------------
+class FakePlayer(object):
+  __slots__ = ('userid', 'uniqueid', 'name', 'team', 'model', 'address', 'frags', 'joined')
+
+  #==============================
+  def __init__(self, userid, uniqueid, name, team, address):
+    self.userid = userid
+    self.uniqueid = uniqueid
+    self.name = name
+    self.team = team
+    self.model = random.choice(MODELS[team])
+    self.address = address
+    self.frags = 0
+    self.joined = time.time()
+
+  #==============================
+  def prefix(self, team=None):
+    """Returns the player as the log shows it: "name<userid><uniqueid><team>"."""
+
+    if team is None:
+      team = self.team
+    return '"%s<%d><%s><%s>"' % (self.name, self.userid, self.uniqueid, team)
+
+#------------------------------
+class LogGenerator(object):
+  """Makes up log lines for a match between players."""
+
+  #==============================
+  def __init__(self, players):
+    self.players = players
+    self.round_lines = 0
+    self.ct_score = 0
+    self.t_score = 0
+
+  #==============================
+  def connect(self, player):
+    """Returns the lines of a player connecting and joining a team."""
+
+    return [
+      '%s connected, address "%s"' % (player.prefix(''), player.address),
+      '%s STEAM USERID validated' % player.prefix(''),
+      '%s entered the game' % player.prefix(''),
+      '%s joined team "%s"' % (player.prefix('Unassigned'), player.team)
+    ]
+
+  #==============================
+  def next(self):
+    """Returns the next few lines of the match."""
+
+    if not self.players:
+      return []
+
+    # A round is about 60 lines long.
+    self.round_lines += 1
+    if self.round_lines == 1:
+      return ['World triggered "Round_Start"']
+    if self.round_lines > 60:
+      self.round_lines = 0
+      if random.random() < 0.5:
+        self.ct_score += 1
+        winner, event = 'CT', 'CTs_Win'
+      else:
+        self.t_score += 1
+        winner, event = 'TERRORIST', 'Terrorists_Win'
+      return [
+        'Team "%s" triggered "%s" (CT "%d") (T "%d")' % (winner, event, self.ct_score, self.t_score),
+        'Team "CT" scored "%d" with "%d" players' % (self.ct_score, len([p for p in self.players if p.team == 'CT'])),
+        'Team "TERRORIST" scored "%d" with "%d" players' % (self.t_score, len([p for p in self.players if p.team == 'TERRORIST'])),
+        'World triggered "Round_End"'
+      ]
+
+    attacker = random.choice(self.players)
+    roll = random.random()
+    if roll < 0.08:
+      return ['%s say "%s"' % (attacker.prefix(), random.choice(CHAT))]
+    if roll < 0.12:
+      return ['%s say_team "%s"' % (attacker.prefix(), random.choice(CHAT))]
+    if roll < 0.14:
+      return ['%s triggered "Planted_The_Bomb"' % attacker.prefix()]
+
+    victim = random.choice(self.players)
+    weapon = random.choice(WEAPONS)
+    lines = ['%s attacked %s with "%s" (damage "%d") (damage_armor "0") (health "0") (armor "0")' % (
+      attacker.prefix(), victim.prefix(), weapon, random.randint(20, 100))]
+    if roll < 0.6:
+      attacker.frags += 1
+      lines.append('%s killed %s with "%s"' % (attacker.prefix(), victim.prefix(), weapon))
+    return lines
+
+#------------------------------
+class FakeHLDS(DatagramProtocol):
+  """A fake HL1 dedicated server.
+
+  password - the rcon password.
+  players - how many players are on the server.
+  split_size - replies longer than this many bytes are split into 0xFE
+    packets of this size. 0 never splits.
+  loss - the chance of a packet (in either direction) being lost.
+  reorder - the chance of a reply being held back by reorder_delay seconds,
+    letting later replies overtake it.
+  latency - seconds every reply is delayed by.
+  log_rate - log lines per second sent to every log address. 0 only logs
+    what rcon commands cause.
+  """
+
+  #==============================
+  def __init__(self, password='password', players=32, split_size=0, loss=0.0, reorder=0.0,
+               reorder_delay=0.05, latency=0.0, log_rate=0.0):
+    self.password = password
+    self.split_size = split_size
+    self.loss = loss
+    self.reorder = reorder
+    self.reorder_delay = reorder_delay
+    self.latency = latency
+    self.log_rate = log_rate
+
+    self.challenges = {} # Indexed by (host, port)
+    self.log_addresses = []
+    self.sequence = 0
+    self.cvars = {
+      'hostname': 'RconSoft fake server',
+      'sv_password': '',
+      'sv_restart': '0',
+      'mp_timelimit': '0',
+      'mp_startmoney': '800',
+      'mp_freezetime': '6',
+      'mp_friendlyfire': '1',
+      'rcon_password': password
+    }
+    self.map = 'de_dust2'
+    self.bans = set()
+
+    self.players = []
+    self.next_userid = 1
+    for index in xrange(players):
+      self.add_player()
+    self.generator = LogGenerator(self.players)
+    self._log_loop = None
+
+    self.stats = {
+      'received': 0,
+      'sent': 0,
+      'lost': 0,
+      'reordered': 0,
+      'split': 0,
+      'commands': 0,
+      'bad_challenges': 0,
+      'bad_passwords': 0,
+      'log_lines': 0
+    }
+
+  #==============================
+  def add_player(self, name=None, team=None):
+    userid = self.next_userid
+    self.next_userid += 1
+    if team is None:
+      team = TEAMS[userid % 2]
+    player = FakePlayer(userid, 'STEAM_0:%d:%d' % (userid % 2, 100000 + userid), name or 'Player%d' % userid,
+      team, '10.0.%d.%d:27005' % (userid // 250, userid % 250 + 1))
+    self.players.append(player)
+    return player
+
+  #==============================
+  def find_player(self, value):
+    """Finds a player by #userid, userid, uniqueid or name."""
+
+    value = value.strip('"')
+    if value.startswith('#'):
+      value = value[1:]
+    for player in self.players:
+      if value == str(player.userid) or value == player.uniqueid or value == player.name:
+        return player
+    return None
+
+  #==============================
+  # Twisted event
+  def startProtocol(self):
+    if self.log_rate > 0:
+      self._log_loop = task.LoopingCall(self._emit_logs)
+      # Log in ticks of at most 100 per second.
+      self._interval = max(0.01, 1.0 / self.log_rate)
+      self._log_loop.start(self._interval, now=False)
+
+  #==============================
+  # Twisted event
+  def stopProtocol(self):
+    if self._log_loop and self._log_loop.running:
+      self._log_loop.stop()
+
+  #==============================
+  def _emit_logs(self):
+    lines = int(round(self.log_rate * self._interval)) or 1
+    while lines > 0:
+      for line in self.generator.next():
+        self.log(line)
+        lines -= 1
+
+  #==============================
+  def log(self, line):
+    """Sends a log line to every log address."""
+
+    if not self.log_addresses:
+      return
+    data = '%slog L %s: %s\n\x00' % (HEADER, time.strftime('%m/%d/%Y - %H:%M:%S'), line)
+    for address in self.log_addresses:
+      self.stats['log_lines'] += 1
+      self._send(data, address, lossy=True)
+
+  #==============================
+  def _send(self, data, address, lossy=True, delay=0.0):
+    if lossy and self.loss and random.random() < self.loss:
+      self.stats['lost'] += 1
+      return
+    self.stats['sent'] += 1
+    if delay > 0:
+      reactor.callLater(delay, self.transport.write, data, address)
+    else:
+      self.transport.write(data, address)
+
+  #==============================
+  def reply(self, text, address):
+    """Sends an rcon reply, splitting it and delaying it as configured."""
+
+    packet = '%sl%s\x00' % (HEADER, text)
+    if self.split_size and len(packet) > self.split_size:
+      self.sequence += 1
+      packets = split_packet(packet, self.split_size, self.sequence)
+      self.stats['split'] += 1
+    else:
+      packets = [packet]
+
+    for packet in packets:
+      delay = self.latency
+      if self.reorder and random.random() < self.reorder:
+        self.stats['reordered'] += 1
+        delay += self.reorder_delay
+      self._send(packet, address, delay=delay)
+
+  #==============================
+  # Twisted event
+  def datagramReceived(self, data, address):
+    self.stats['received'] += 1
+    if self.loss and random.random() < self.loss:
+      self.stats['lost'] += 1
+      return
+    if not data.startswith(HEADER):
+      return
+
+    request = data[4:].rstrip('\x00\n')
+    if request.startswith('challenge rcon'):
+      challenge = self.challenges[address] = str(random.randint(100000000, 999999999))
+      self._send('%schallenge rcon %s\n\x00' % (HEADER, challenge), address, delay=self.latency)
+      return
+
+    m = RCON_RE.match(request)
+    if not m:
+      return
+
+    if m.group('challenge') != self.challenges.get(address):
+      self.stats['bad_challenges'] += 1
+      self.reply('Bad challenge.\n', address)
+      return
+
+    password = m.group('quoted')
+    if password is None:
+      password = m.group('password')
+    if password != self.password:
+      self.stats['bad_passwords'] += 1
+      self.reply('Bad rcon_password.\n', address)
+      return
+
+    output = []
+    for command in split_commands(m.group('commands')):
+      self.stats['commands'] += 1
+      self.log('Rcon: "rcon %s "%s" %s" from "%s:%s"' % (m.group('challenge'), password, command, address[0], address[1]))
+      output.append(self.execute(command, address))
+    self.reply(''.join(output), address)
+
+  #==============================
+  def execute(self, command, address):
+    """Runs a single console command and returns what it prints."""
+
+    parts = command.split(None, 1)
+    name = parts[0].lower()
+    args = len(parts) > 1 and parts[1].strip() or ''
+    value = args.strip('"')
+
+    if name == 'echo':
+      return '%s\n' % value
+    if name == 'users':
+      return self._users()
+    if name == 'user':
+      return self._user(value)
+    if name == 'status':
+      return self._status()
+    if name == 'say':
+      self.log('Server say "%s"' % value)
+      return ''
+    if name == 'logaddress_add':
+      host, port = (args.split() + ['', ''])[:2]
+      if host and port.isdigit() and (host, int(port)) not in self.log_addresses:
+        self.log_addresses.append((host, int(port)))
+        # Let a new listener know who is already here.
+        for player in self.players:
+          for line in self.generator.connect(player):
+            self.log(line)
+      return 'logaddress:  %s %s\n' % (host, port)
+    if name == 'logaddress_del':
+      host, port = (args.split() + ['', ''])[:2]
+      if port.isdigit() and (host, int(port)) in self.log_addresses:
+        self.log_addresses.remove((host, int(port)))
+      return ''
+    if name == 'kick':
+      player = self.find_player(value)
+      if player:
+        self.players.remove(player)
+        self.log('%s disconnected' % player.prefix())
+      return ''
+    if name == 'banid':
+      for arg in args.split():
+        if arg.startswith('STEAM_'):
+          self.bans.add(arg)
+      return ''
+    if name == 'removeid':
+      self.bans.discard(value)
+      return ''
+    if name in ('writeid', 'exec', 'quit'):
+      return ''
+    if name == 'changelevel':
+      self.map = value
+      return ''
+    if name in self.cvars:
+      if not args:
+        return '"%s" is "%s"\n' % (name, self.cvars[name])
+      self.cvars[name] = value
+      self.log('Server cvar "%s" = "%s"' % (name, value))
+      return ''
+    return 'Unknown command "%s"\n' % name
+
+  #==============================
+  def _users(self):
+    lines = ['userid : uniqueid : name', '------ : ---------: ----']
+    for player in self.players:
+      lines.append('%6d : %s : %s' % (player.userid, player.uniqueid, player.name))
+    lines.append('%d users' % len(self.players))
+    return '\n'.join(lines) + '\n'
+
+  #==============================
+  def _user(self, value):
+    player = self.find_player(value)
+    if player is None:
+      return 'Couldn\'t find user %s\n' % value
+    return '\n'.join([
+      'name           %s' % player.name,
+      'model          %s' % player.model,
+      'rate           25000',
+      'cl_updaterate  101',
+      'cl_lw          1',
+      'cl_lc          1',
+      'topcolor       0',
+      'bottomcolor    0'
+    ]) + '\n'
+
+  #==============================
+  def _status(self):
+    host = self.transport.getHost()
+    lines = [
+      'hostname:  %s' % self.cvars['hostname'],
+      'version :  48/1.1.2.7/Stdio 8684 secure',
+      'tcp/ip  :  %s:%d' % (host.host, host.port),
+      'map     :  %s at: 0 x, 0 y, 0 z' % self.map,
+      'players :  %d active (32 max)' % len(self.players),
+      '',
+      '#      name userid uniqueid frag time ping loss adr'
+    ]
+    now = time.time()
+    for index, player in enumerate(self.players):
+      connected = int(now - player.joined)
+      lines.append('#%2d "%s" %d %s %d %02d:%02d %d 0 %s' % (index + 1, player.name, player.userid, player.uniqueid,
+        player.frags, connected // 60, connected % 60, random.randint(5, 80), player.address))
+    lines.append('%d users' % len(self.players))
+    return '\n'.join(lines) + '\n'
+
+#==============================
+def main_func():
+  parser = OptionParser()
+  parser.add_option('--host', dest='host', default='127.0.0.1',
+    help='the address to listen on')
+  parser.add_option('--port', type='int', dest='port', default=27015,
+    help='the port to listen on')
+  parser.add_option('--password', dest='password', default='password',
+    help='the rcon password')
+  parser.add_option('--players', type='int', dest='players', default=32,
+    help='how many players are on the server')
+  parser.add_option('--split-size', type='int', dest='split_size', default=0,
+    help='splits replies longer than this many bytes into 0xFE packets')
+  parser.add_option('--loss', type='float', dest='loss', default=0.0,
+    help='the chance of a packet being lost, from 0 to 1')
+  parser.add_option('--reorder', type='float', dest='reorder', default=0.0,
+    help='the chance of a reply being held back so later ones overtake it')
+  parser.add_option('--latency', type='float', dest='latency', default=0.0,
+    help='seconds every reply is delayed by')
+  parser.add_option('--log-rate', type='float', dest='log_rate', default=0.0,
+    help='log lines per second sent to the log addresses')
+  parser.add_option('--seed', type='int', dest='seed', default=None,
+    help='seeds the random numbers to make a run repeatable')
+
+  (options, args) = parser.parse_args()
+
+  random.seed(options.seed)
+  server = FakeHLDS(options.password, options.players, options.split_size, options.loss,
+    options.reorder, latency=options.latency, log_rate=options.log_rate)
+  reactor.listenUDP(options.port, server, interface=options.host)
+  print 'Fake hlds listening on %s:%d' % (options.host, options.port)
+
+  #==============================
+  def print_stats():
+    print ', '.join(['%s: %s' % item for item in sorted(server.stats.items())])
+  task.LoopingCall(print_stats).start(10, now=False)
+
+  reactor.run()
+
+#==============================
+if __name__ == "__main__":
+  main_func()
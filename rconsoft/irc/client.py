@@ -246,9 +246,9 @@ class IrcClient(object):
             _kwargs[k] = args[i]
         
         try:
-          self.events['pre_%s' % name].send(sender=self, **_kwargs)
+          self.events['pre_%s' % name].send_fast(sender=self, **_kwargs)
           _kwargs['return_'] = fn(*args, **kwargs)
-          self.events['post_%s' % name].send(sender=self, **_kwargs)
+          self.events['post_%s' % name].send_fast(sender=self, **_kwargs)
         except TypeError, e:
           traceback.print_exc()
           traceback._print(sys.stderr, e.message)
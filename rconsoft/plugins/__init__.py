@@ -110,10 +110,13 @@ class Plugin(object):
 #    return plugin
 
 #==============================
-def load_all():
-  """Loads all the plugins from the directories specified by the config."""
+def load_all(plugins=None):
+  """Loads all the plugins from the directories specified by the config.
+  Pass a list of plugin names to load those instead of the ones in the
+  config."""
   
-  plugins = cget('global', 'plugins', default=[])
+  if plugins is None:
+    plugins = cget('global', 'plugins', default=[])
   paths = cget('global', 'directories', 'plugins', default=[os.path.join(INSTALLDIR, 'plugins')])
   
   for plugin in plugins:    
@@ -1,9 +1,10 @@
 # Read LICENSE for licensing details.
 
 from rconsoft.plugins import Plugin
-from rconsoft import rcon_client, command_handler
-from rconsoft.config import cget, has_access
-from rconsoft.command import get_dispatcher, command, shell_parse
+from rconsoft import servers, command_handler
+from rconsoft.config import has_access, uniqueids_with_access
+from rconsoft.command import command, shell_parse
+from rconsoft.rcon.client import log_failure
 
 #------------------------------
 class CorePlugin(Plugin):
@@ -14,13 +15,14 @@ class CorePlugin(Plugin):
   def __init__(self, *args, **kwargs):
     Plugin.__init__(self, *args, **kwargs)
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
   
   #==============================
   @command('r', 'rr', 'map', 'changelevel', 'say', 'hsay', 'pass', 'password')
   def on_command(self, command, params, silent, **kwargs):
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     # We don't have access. Return.
     if not has_access(uniqueid, 'admin'):
@@ -31,7 +33,7 @@ class CorePlugin(Plugin):
     # Restart round
     if command == 'r' or command == 'rr':
       wait = params if params else '1'
-      rcon_client.cvar('sv_restart', wait)
+      rcon_client.cvar('sv_restart', wait).addErrback(log_failure, 'setting sv_restart')
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     # Map
     elif command == 'map' or command == 'changelevel':
@@ -50,14 +52,15 @@ class CorePlugin(Plugin):
     # Password
     elif command == 'pass' or command == 'password':
       if params:
-        rcon_client.cvar('sv_password', params)
+        rcon_client.cvar('sv_password', params).addErrback(log_failure, 'setting sv_password')
         if not silent:
           rcon_client.hsay('', 'Set password to: %s' % params)
       else:
         #==============================
         def got_password(value):
           rcon_client.hsay('', 'Password is set to: %s' % value)
-        rcon_client.cvar('sv_password').addCallback(got_password)
+        d = rcon_client.cvar('sv_password').addCallback(got_password)
+        d.addErrback(log_failure, 'reading sv_password')
         
     
     # Keep processing other plugins.
@@ -68,6 +71,7 @@ class CorePlugin(Plugin):
   def on_control(self, command, params, silent, **kwargs):
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     if not has_access(uniqueid, 'admin'):
       return True
@@ -82,10 +86,7 @@ class CorePlugin(Plugin):
     else:
       # If there was no force param, then add all people who are admins or higher
       # onto the list of exceptions.
-      for user in cget('users', default=[]):
-        entry = cget('users', user, default={'uniqueid': None})
-        if has_access(entry['uniqueid'], 'user'):
-          uniqueid_exceptions.append(entry['uniqueid'])
+      uniqueid_exceptions = uniqueids_with_access('user')
      
     action = ''
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -1,9 +1,9 @@
 # Read LICENSE for licensing details.
 
 from rconsoft.plugins import Plugin
-from rconsoft import rcon_client, command_handler
+from rconsoft import servers, command_handler
 from rconsoft.config import cget
-from rconsoft.command import get_dispatcher, command, ALL_COMMANDS, REMAINING_COMMANDS
+from rconsoft.command import command, ALL_COMMANDS, REMAINING_COMMANDS
 
 #------------------------------
 class ExamplePlugin(Plugin):  
@@ -11,7 +11,7 @@ class ExamplePlugin(Plugin):
   def __init__(self, *args, **kwargs):
     Plugin.__init__(self, *args, **kwargs)
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
 
   #==============================
   @command(ALL_COMMANDS)
@@ -22,6 +22,7 @@ class ExamplePlugin(Plugin):
     
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     # We don't have access. Return.
     if not has_access(uniqueid, 'admin'):
@@ -38,6 +39,7 @@ class ExamplePlugin(Plugin):
   def on_example_number(self, command, params, silent, **kwargs):
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     # We don't have access. Return.
     if not has_access(uniqueid, 'admin'):
@@ -58,6 +60,7 @@ class ExamplePlugin(Plugin):
     
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     # We don't have access. Return.
     if not has_access(uniqueid, 'admin'):
@@ -6,9 +6,10 @@ from twisted.internet import reactor
 
 from rconsoft.plugins import Plugin
 from rconsoft.dispatch.dispatcher import Signal
-from rconsoft import rcon_client, command_handler
-from rconsoft.config import cget, has_access
-from rconsoft.command import get_dispatcher, command
+from rconsoft import servers, command_handler
+from rconsoft.config import settings, has_access
+from rconsoft.command import command
+from rconsoft.rcon.scheduler import PRIORITY_BULK
 
 #------------------------------
 class ExePlugin(Plugin):
@@ -18,11 +19,10 @@ class ExePlugin(Plugin):
   def __init__(self, *args, **kwargs):
     Plugin.__init__(self, *args, **kwargs)
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
     
     self.pre_lo3 = Signal()
     self.post_lo3 = Signal()
-    self.performing_lo3 = False
 
   #==============================
   @command('exec', 'execr')
@@ -36,21 +36,27 @@ class ExePlugin(Plugin):
       return True
 
     if (command == 'exec' or command == 'execr') and params:
-      self.exec_(params)
+      server = kwargs.get('server')
+      self.exec_(params, server)
       
+      # The restart goes in the same lane as the script, so it's sent after it.
       if command == 'execr':
-        rcon_client.cvar('sv_restart', '1')
+        servers.client(server).command('sv_restart', '1', deferred=False, priority=PRIORITY_BULK)
 
     # Keep processing other plugins.
     return True
   
   #==============================
-  def exec_(self, name):
+  def exec_(self, name, server=None):
+    """Sends every line of a script to a server. If server is None, the
+    default server is used."""
+    
     if not name:
       return
+    rcon_client = servers.client(server)
     
     # Grab the location of our scripts
-    path = cget('plugins', 'exec', 'scripts_path', default=os.path.join(os.path.dirname(__file__), 'scripts'))
+    path = settings.plugins.exec_.scripts_path or os.path.join(os.path.dirname(__file__), 'scripts')
     
     # Iterate through the scripts dir and try to find any file matching name.
     list = os.listdir(path)
@@ -59,7 +65,10 @@ class ExePlugin(Plugin):
       if name == file_name:
         fp = open(os.path.join(path, file), 'r')
         for line in fp:
-          rcon_client.command(line, deferred=False)
+          line = line.strip()
+          # Blank lines and comments do nothing, so don't bother sending them.
+          if line and not line.startswith('//'):
+            rcon_client.command(line, deferred=False, priority=PRIORITY_BULK)
         fp.close()
         break
   
@@ -73,21 +82,25 @@ class ExePlugin(Plugin):
       return True
       
     if command == 'lo3':
-      # Don't do lo3 if we're already doing lo3.
-      if self.performing_lo3:
+      server = kwargs.get('server') or servers.default
+      rcon_client = server.rcon_client
+      state = server.state(self)
+      
+      # Don't do lo3 if we're already doing lo3 on this server.
+      if state.get('performing_lo3'):
         return True
-      self.performing_lo3 = True
+      state['performing_lo3'] = True
     
-      self.pre_lo3.send(sender=self.__class__)
+      self.pre_lo3.send(sender=self.__class__, server=server)
       
-      self.exec_(cget('plugins', 'exec', 'exec_on_lo3'))
+      # The configuration options for going lo3. They're kept for the whole
+      # lo3, even if the config is reloaded in the middle of it.
+      options = settings.plugins.exec_
+      lo3_messages = options.lo3_messages
+      lo3_delays = options.lo3_delays
+      lo3_live_message = options.lo3_live_message
       
-      # Get the configuration options for going lo3.
-      default_lo3_messages = ['[ Going live on 3 restarts ]', '[ Two more restarts ]', '[ Last restart ]']
-      default_lo3_delays = ['2', '2', '5']
-      lo3_messages = cget('plugins', 'exec', 'lo3_messages', default=default_lo3_messages)
-      lo3_delays = cget('plugins', 'exec', 'lo3_delays', default=default_lo3_delays)
-      lo3_live_message = cget('plugins', 'exec', 'lo3_live_message', default='[* LIVE LIVE LIVE *]')
+      self.exec_(options.exec_on_lo3, server)
        
       #==============================
       def do_restarts(index):
@@ -95,12 +108,14 @@ class ExePlugin(Plugin):
           message = lo3_messages[index]
           delay = lo3_delays[index]
           rcon_client.hsay('', message)
-          rcon_client.command('sv_restart', delay)
+          # The restart goes in the same lane as the exec_on_lo3 script, so
+          # it's sent after it.
+          rcon_client.command('sv_restart', str(delay), deferred=False, priority=PRIORITY_BULK)
           index += 1
-          reactor.callLater(int(delay)+0.9, do_restarts, index)
+          reactor.callLater(delay+0.9, do_restarts, index)
         else:
-          self.performing_lo3 = False
+          state['performing_lo3'] = False
           rcon_client.hsay('', lo3_live_message)
-          self.post_lo3.send(sender=self.__class__)
+          self.post_lo3.send(sender=self.__class__, server=server)
         
       do_restarts(0)
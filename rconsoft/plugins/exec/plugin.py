@@ -89,7 +89,7 @@ class ExecPlugin(CommandProvider):
           message = lo3_messages[index]
           delay = lo3_delays[index]
           rcon_client.hsay('', message)
-          rcon_client.command('sv_restart', delay)
+          rcon_client.command('sv_restart', delay, deferred=False)
           index += 1
           reactor.callLater(int(delay)+1, do_restarts, index)
         else:
@@ -7,9 +7,9 @@ from xml.etree import ElementTree as etree
 from twisted.internet import reactor
 
 from rconsoft.plugins import Plugin
-from rconsoft import rcon_client, rcon_receiver, command_handler
+from rconsoft import servers, command_handler
 from rconsoft.config import cget, has_access
-from rconsoft.command import get_dispatcher, command, shell_parse
+from rconsoft.command import command, shell_parse, defer_to_thread
 
 URL = 'http://steamid.esportsea.com/?action=search&type=single&key=steam_id&query=%s&output=xml&version=extended'
 
@@ -54,7 +54,7 @@ class IDLookupPlugin(Plugin):
   def __init__(self, *args, **kwargs):
     Plugin.__init__(self, *args, **kwargs)
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
   
   #==============================
   @command('id', 'idteam')
@@ -71,6 +71,7 @@ class IDLookupPlugin(Plugin):
     if silent:
       return True
     
+    rcon_client = servers.client(kwargs.get('server'))
     players = None
     
     if command == 'id':
@@ -91,20 +92,16 @@ class IDLookupPlugin(Plugin):
       if team:
         players = rcon_client.find_players('team', team)
     
+    # The lookups are slow, so they run in a thread. Returning the deferred
+    # lets the command handler limit how many run at once.
     if players:
-      reactor.callInThread(self.display_players, players)
+      return defer_to_thread(self.display_players, players, rcon_client)
     
     # Keep processing other plugins.
     return True
   
   #==============================
-  def on_rcon_event(self, event, data, **kwargs):
-    if event == 'user_entered':
-      if 'uniqueid' in data:
-        reactor.callInThread(self.display_id, data['uniqueid'])
-  
-  #==============================
-  def display_players(self, players):
+  def display_players(self, players, rcon_client):
     slist = []
     for player in players:
       player = players[player]
@@ -122,26 +119,19 @@ class IDLookupPlugin(Plugin):
       slist.sort(player_sort)
       
       for entry in slist:
-        self.display_info(entry)
+        self.display_info(entry, rcon_client)
   
   #==============================
-  def display_id(self, uniqueid):
-    """Retrieves and displays a single user's league status."""
-    
-    info = self.lookup_id(uniqueid)
-    info['ingame_name'] = rcon_client.players[uniqueid]['name']
-    self.display_info(info)
-      
-  #==============================
-  def display_info(self, info):
-    """A function to display information about a player's league status in game."""
+  def display_info(self, info, rcon_client):
+    """A function to display information about a player's league status in game.
+    This runs in a thread, so the message is handed to the reactor thread."""
     
     if 'team_name' in info:
       league = '%(team_game)s-%(team_league)s-%(team_division)s' % info
       record = '%(wins)s-%(losses)s-%(ties)s' % info['team_record']
-      rcon_client.hsay('', '%s in %s(%s, %s) | %s' % (info['player_alias'], info['team_name'], league, record, info['ingame_name']))
+      reactor.callFromThread(rcon_client.hsay, '', '%s in %s(%s, %s) | %s' % (info['player_alias'], info['team_name'], league, record, info['ingame_name']))
     else:
-      rcon_client.hsay('', '%s is not in any leagues' % info['ingame_name'])
+      reactor.callFromThread(rcon_client.hsay, '', '%s is not in any leagues' % info['ingame_name'])
   
   #==============================
   def lookup_id(self, uniqueid):
@@ -8,9 +8,9 @@ from twisted.internet import reactor
 
 from rconsoft.plugins import Plugin
 from rconsoft.dispatch.dispatcher import Signal
-from rconsoft import rcon_client, command_handler
+from rconsoft import servers, command_handler
 from rconsoft.config import cget, has_access
-from rconsoft.command import get_dispatcher, command
+from rconsoft.command import command, defer_to_thread
 
 #------------------------------
 class Ip2LocationPlugin(Plugin):
@@ -20,7 +20,7 @@ class Ip2LocationPlugin(Plugin):
   def __init__(self, *args, **kwargs):
     Plugin.__init__(self, *args, **kwargs)
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
     
     self.parse_re = None
 
@@ -35,14 +35,16 @@ class Ip2LocationPlugin(Plugin):
       # Keep processing other plugins.
       return True
 
+    # The lookup is slow, so it runs in a thread. Returning the deferred lets
+    # the command handler limit how many run at once.
     if command == 'ip2l' and params:
-      reactor.callInThread(self.display_name, params)
+      return defer_to_thread(self.display_name, params, servers.client(kwargs.get('server')))
 
     # Keep processing other plugins.
     return True
   
   #==============================
-  def display_name(self, name):
+  def display_name(self, name, rcon_client):
     if not name:
       return
     
@@ -66,7 +68,8 @@ class Ip2LocationPlugin(Plugin):
       # Save the information for later
       player.update(data)
       
-    rcon_client.hsay(player['name'], '%s, %s, %s (%s)' % (player['city'], player['region'], player['country'], player['area_code']))
+    # This runs in a thread, so the message is handed to the reactor thread.
+    reactor.callFromThread(rcon_client.hsay, player['name'], '%s, %s, %s (%s)' % (player['city'], player['region'], player['country'], player['area_code']))
     
   #==============================
   def lookup_ip(self, ip):
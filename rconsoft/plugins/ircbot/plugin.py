@@ -2,16 +2,23 @@
 
 import re
 import random
+import logging
 
 from twisted.internet import reactor
 
 from rconsoft.plugins import Plugin
-from rconsoft import rcon_client, command_handler
-from rconsoft.config import cget, has_access
-from rconsoft.command import get_dispatcher, command
+from rconsoft import servers, command_handler
+from rconsoft.config import settings, has_access, config_changed
+from rconsoft.command import command
 from rconsoft.irc.client import IrcClient
+from rconsoft.rcon.client import log_failure
+
+log = logging.getLogger('general')
 
 irc_client = None
+
+# The options only read when connecting.
+NETWORK_OPTIONS = ['host', 'port', 'alias', 'nickname', 'username', 'realname', 'authname', 'password', 'channels', 'modes']
  
 #------------------------------
 class IrcBotPlugin(Plugin):  
@@ -21,19 +28,21 @@ class IrcBotPlugin(Plugin):
     
     Plugin.__init__(self, *args, **kwargs)
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
+    config_changed.connect(self.on_config_changed)
     
+    options = settings.plugins.ircbot
     network = {
-      'host': cget('plugins', 'ircbot', 'host'),
-      'port': int(cget('plugins', 'ircbot', 'port')),
-      'alias': cget('plugins', 'ircbot', 'alias'),
-      'nickname': cget('plugins', 'ircbot', 'nickname'),
-      'username': cget('plugins', 'ircbot', 'username'),
-      'realname': cget('plugins', 'ircbot', 'realname', default=''),
-      'authname': cget('plugins', 'ircbot', 'authname'),
-      'password': cget('plugins', 'ircbot', 'password'),
-      'channels': cget('plugins', 'ircbot', 'channels'),
-      'modes': cget('plugins', 'ircbot', 'modes', default='')
+      'host': options.host,
+      'port': options.port,
+      'alias': options.alias,
+      'nickname': options.nickname,
+      'username': options.username,
+      'realname': options.realname,
+      'authname': options.authname,
+      'password': options.password,
+      'channels': list(options.channels),
+      'modes': options.modes
     }
     irc_client = IrcClient(network)    
     irc_client.events['post_joined'].connect(self.on_joined)
@@ -43,6 +52,7 @@ class IrcBotPlugin(Plugin):
     reactor.connectTCP(network['host'], network['port'], irc_client.factory)
     
     self.finding = False
+    self.server = None # The server we are finding a scrim for.
     self.ad = ''
     self.ad_delayed_call = None
     self.comment = ''
@@ -52,6 +62,12 @@ class IrcBotPlugin(Plugin):
     # Usually means spammers.
     self.bad_message_re = re.compile(r'(#[a-zA-Z])|click|paste|idle')
     
+  #==============================
+  def on_config_changed(self, paths, **kwargs):
+    for path in paths:
+      if path[:2] == ('plugins', 'ircbot') and (len(path) == 2 or path[2] in NETWORK_OPTIONS):
+        log.warning('[%s] %s changed, restart for it to take effect' % (self.__class__.__name__, '.'.join(path)))
+  
   #==============================
   def on_joined(self, channel, **kwargs):
     """Called when the bot joins a channel."""
@@ -75,15 +91,13 @@ class IrcBotPlugin(Plugin):
         self.nicks[user] = user # Probably should fill with info or something.
         
         if not self.bad_message_re.match(message):
-          rcon_client.hsay('irc:%s' % user, message)
+          servers.client(self.server).hsay('irc:%s' % user, message)
       else:
         # If the user is in the ignore list, then just return. This could be
         # "Global" telling you something that we shouldn't respond to or we'll
         # enter into an infinite loop.
-        user = user.lower()
-        for ignore in cget('plugins', 'ircbot', 'ignore_nicks', default=[]):
-          if ignore.lower() == user:
-            return
+        if user.lower() in settings.plugins.ircbot.ignore_nicks:
+          return
           
         irc_client.msg(user, 'Sorry, I\'m no longer looking for a scrim.')
   
@@ -98,7 +112,7 @@ class IrcBotPlugin(Plugin):
         return self.nicks[key]
     
     if not silent:
-      rcon_client.hsay('', 'Did not find nick: %s' % name)
+      servers.client(self.server).hsay('', 'Did not find nick: %s' % nick)
     
     return None
   
@@ -107,6 +121,7 @@ class IrcBotPlugin(Plugin):
   def on_command(self, command, params, silent, **kwargs):    
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     # We don't have access. Return.
     if not has_access(uniqueid, 'admin'):
@@ -116,16 +131,16 @@ class IrcBotPlugin(Plugin):
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
     # Find
     if command == 'find':      
-      # We must decode the string to interpret the escapes (e.g. '\x37' into '7').
-      ad = cget('plugins', 'ircbot', 'ad').decode('string-escape')
-      self.comment = params if params else cget('plugins', 'ircbot', 'default_comment', default='de_any')
-      self.ad = ad.replace('{comment}', self.comment)
+      options = settings.plugins.ircbot
+      self.comment = params if params else options.default_comment
+      self.ad = options.ad.replace('{comment}', self.comment)
       
       # We're not finding, so let's start it.
       if not self.finding:
         if not silent:
           rcon_client.hsay('', 'Finding a scrim.')
         self.finding = True
+        self.server = kwargs.get('server') or servers.default
         
         # Only call do_advertising if the delayed call isn't active.
         # Otherwise we would message the channel immediately and potientially
@@ -152,15 +167,15 @@ class IrcBotPlugin(Plugin):
       if params:
         nick = self.find_nick(params, silent)
         if nick:
-          default_password = cget('game', 'default_password', default='scrim')
-          new_password = '%s%d' % (default_password, random.randint(1, 99))
-          rcon_client.cvar('sv_password', new_password)
+          server = kwargs.get('server') or servers.default
+          new_password = '%s%d' % (settings.game.default_password, random.randint(1, 99))
+          rcon_client.cvar('sv_password', new_password).addErrback(log_failure, 'setting sv_password')
           rcon_client.hsay('', 'Giving "%s" the info. New password: %s' % (nick, new_password))
           rcon_client.hsay('', 'Don\'t forget to .stopfind when they connect.')
           # Too bad python 2.6's string formatting isn't in 2.5
-          accept_message = cget('plugins', 'ircbot', 'accept_message', default='connect {host}:{port};password {password}')
-          accept_message = accept_message.replace('{host}', cget('rcon', 'host'))
-          accept_message = accept_message.replace('{port}', cget('rcon', 'port'))
+          accept_message = settings.plugins.ircbot.accept_message
+          accept_message = accept_message.replace('{host}', server.host)
+          accept_message = accept_message.replace('{port}', str(server.port))
           accept_message = accept_message.replace('{password}', new_password)
           irc_client.msg(nick, accept_message)    
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -200,5 +215,5 @@ class IrcBotPlugin(Plugin):
     for channel in self.channels:
       irc_client.msg(channel, self.ad)
       
-    self.ad_delayed_call = reactor.callLater(int(cget('plugins', 'ircbot', 'ad_interval', default=45)), self.do_advertising)
+    self.ad_delayed_call = reactor.callLater(settings.plugins.ircbot.ad_interval, self.do_advertising)
     
\ No newline at end of file
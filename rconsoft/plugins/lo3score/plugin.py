@@ -6,7 +6,8 @@ import logging
 from twisted.internet import reactor
 
 from rconsoft.plugins import Plugin
-from rconsoft import rcon_client, rcon_receiver
+from rconsoft import rcon_receiver
+from rconsoft.rcon.receiver import event
 from rconsoft.config import cget, has_access
 
 log = logging.getLogger('general')
@@ -17,12 +18,9 @@ class Lo3ScorePlugin(Plugin):
   def __init__(self, *args, **kwargs):
     Plugin.__init__(self, *args, **kwargs)
    
-    rcon_receiver.event.connect(self.on_rcon_event)
+    rcon_receiver.connect_handlers(self)
     
     #CommandProvider.plugins.find('ExePlugin')    
-    
-    self.t_score = 0
-    self.ct_score = 0
 
   #==============================
   def on_command(self, command, params, silent, **kwargs):
@@ -41,9 +39,11 @@ class Lo3ScorePlugin(Plugin):
 
 
   #==============================
-  def on_rcon_event(self, event, data, **kwargs):
-    if event == 'team_triggered':
-      if 't_score' in data and 'ct_score' in data:
-        if data['t_score'] != '0' or data['ct_score'] != '0':
-          self.t_score = data['t_score']
-          self.ct_score = data['ct_score']
+  @event('team_triggered')
+  def on_team_triggered(self, event, data, server=None, **kwargs):
+    if server is not None and 't_score' in data and 'ct_score' in data:
+      if data['t_score'] != '0' or data['ct_score'] != '0':
+        # Scores are kept per server.
+        state = server.state(self)
+        state['t_score'] = data['t_score']
+        state['ct_score'] = data['ct_score']
@@ -5,9 +5,9 @@ import os
 from twisted.internet import reactor
 
 from rconsoft.plugins import Plugin
-from rconsoft import rcon_client, command_handler
+from rconsoft import servers, command_handler
 from rconsoft.config import cget, has_access
-from rconsoft.command import get_dispatcher, command, shell_parse
+from rconsoft.command import command, shell_parse
 
 #------------------------------
 class RatePlugin(Plugin):
@@ -19,13 +19,14 @@ class RatePlugin(Plugin):
     
     self.performing_lo3 = False
     
-    command_handler.event.connect(get_dispatcher(self))
+    command_handler.connect_handlers(self)
 
   #==============================
   @command('rate', 'rateteam')
   def on_command(self, command, params, silent, **kwargs):
     extra = kwargs.get('extra', {})
     uniqueid = extra.get('uniqueid', '')
+    rcon_client = servers.client(kwargs.get('server'))
     
     # We don't have access. Return.
     if not has_access(uniqueid, 'admin'):
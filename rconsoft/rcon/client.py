@@ -1,7 +1,7 @@
 # Read LICENSE for licensing details.
 
-import struct
 import re
+import time
 import logging
 
 from twisted.internet.protocol import DatagramProtocol
@@ -9,6 +9,11 @@ from twisted.internet import defer
 from twisted.internet import reactor
 
 from rconsoft.dispatch.dispatcher import Signal
+from rconsoft.rcon.flow import SendWindow
+from rconsoft.rcon.scheduler import RconScheduler, LANE_NAMES
+from rconsoft.rcon.scheduler import PRIORITY_MODERATION, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from rconsoft.rcon.reassembly import SplitPacketReassembler, SPLIT_HEADER
+from rconsoft.rcon.pending import PendingRequest, PendingTable, TAG_PREFIX, can_tag, split_tag
 
 log = logging.getLogger('general')
 log_detail = logging.getLogger('detail')
@@ -24,67 +29,89 @@ class RconError(Exception):
   pass
 
 #------------------------------
-class NetworkData(object):
-  """This object encapsulates network data. It enables you to
-  easily grab bits and pieces of the message."""
-  
-  #==============================
-  def __init__(self, data):
-    self.data = data
-    
-  #==============================
-  def get_byte(self):
-    ret = ord(self.data[0])
-    self.data = self.data[1:]
-    return ret
+class RconTimeout(RconError):
+  """Thrown when the server does not respond to an rcon command in time."""
+  pass
 
-  #==============================
-  def get_char(self):
-    ret = str(self.data[0])
-    self.data = self.data[1:]
-    return ret
-  
-  #==============================
-  def get_string(self):
-    loc = self.data.find('\x00')
-    ret = self.data[0:loc]
-    self.data = self.data[loc+1:]
-    return ret
-  
-  #==============================
-  def get_int(self):
-    ret = struct.unpack('i', self.data[0:4])[0]
-    self.data = self.data[4:]
-    return ret
-  
-  #==============================
-  def get_float(self):
-    ret = struct.unpack('f', self.data[0:4])[0]
-    self.data = self.data[4:]
-    return ret
+#==============================
+def log_failure(failure, what):
+  """An errback for rcon commands whose result nobody else waits on. Logs
+  why what failed and stops the failure there, so a lost response isn't
+  left as an unhandled error in the Deferred."""
   
-  #==============================
-  def __str__(self):
-    return self.data.__str__()
-  
-  #==============================
-  def __repr__(self):
-    return self.data.__repr__()
- 
+  if failure.check(RconError):
+    log.warning('[rcon] %s failed: %s' % (what, failure.getErrorMessage()))
+  else:
+    log.error('[rcon] %s failed: %s' % (what, failure.getTraceback()))
+
 #------------------------------
 class HL1Network(DatagramProtocol):
   """A class to handle networking for HL1 servers. It contains methods to do
   rcon authentication and to send rcon commands."""
   
+  # The challenge is asked for again with exponential backoff, up to
+  # MAX_CHALLENGE_DELAY seconds apart, and given up on after
+  # MAX_CHALLENGE_ATTEMPTS.
+  MAX_CHALLENGE_DELAY = 60.0
+  MAX_CHALLENGE_ATTEMPTS = 10
+  
   #==============================
-  def __init__(self, host, port, password):   
+  def __init__(self, host, port, password, window=8, max_pending=256, batch_size=512,
+               rate=20, burst=10, lane_limits=(64, 64, 128), max_challenge_age=300):
+    """window is the maximum amount of commands that may be waiting on a
+    response at once. Commands sent beyond that are queued. max_pending is
+    the maximum amount of commands that may be waiting or queued. Commands
+    sent beyond that are dropped. batch_size is the maximum length of the
+    fire-and-forget commands merged into a single packet.
+    
+    rate and burst limit how many packets per second are sent, and
+    lane_limits is the maximum queue length of each priority lane. See
+    RconScheduler.
+    
+    The rcon challenge is renewed once it is max_challenge_age seconds old,
+    or as soon as the server rejects it."""
+    
     self.host = host
     self.port = port
     self.password = password
+    self.challenge_id = None
+    self.challenge_time = None
+    self.max_challenge_age = max_challenge_age
+    self._challenge_call = None
+    self._challenge_attempts = 0
+    # How many more 'Bad challenge.' replies are due for requests that were
+    # already queued again, and until when they may arrive.
+    self._stale_rejections = 0
+    self._stale_until = 0
+    self.max_pending = max_pending
+    self.batch_size = batch_size
     
     self.ready = Signal()
-    
-    self.deferreds = []
+    # Sent once the host is resolved to an ip.
+    self.resolved = Signal()
+    # Sent with every response that could not be matched to a request.
+    self.unmatched = Signal()
+    
+    self.pending = PendingTable()
+    self.scheduler = RconScheduler(rate, burst, lane_limits)
+    self.window = SendWindow(window)
+    self._pump_call = None
+    self.batch = []
+    self._flush_call = None
+    self.reassembler = SplitPacketReassembler()
+    self.stats = {
+      'sent': 0,
+      'received': 0,
+      'matched_tag': 0,
+      'matched_content': 0,
+      'unmatched': 0,
+      'timeouts': 0,
+      'retries': 0,
+      'dropped': 0,
+      'batched': 0,
+      'challenges': 0,
+      'bad_challenges': 0
+    }
   
   #==============================
   # Twisted event
@@ -94,6 +121,7 @@ class HL1Network(DatagramProtocol):
       """This is called once the host is resolved."""
       
       self.host = ip
+      self.resolved.send(sender=self.__class__, network=self)
       self.transport.connect(self.host, self.port)
       self.authenticate()
     
@@ -101,51 +129,73 @@ class HL1Network(DatagramProtocol):
   
   #==============================
   # Twisted event
-  # Note: There could be a potiential problem with this function and using deferreds.
-  # In udp, we are not guaranteed the order of the packets we receive. So it could be
-  # the case that you call rcon_client.command("mp_startmoney") and
-  # rcon_client.command("mp_friendlyfire"), and have the mp_friendlyfire response return
-  # first and have the callback of the first command called. This has yet to happen
-  # so I have yet to worry about it.
   def datagramReceived(self, data, (host, port)):
     if data.startswith('\xFF\xFF\xFF\xFFchallenge rcon'):
+      if self._challenge_call and self._challenge_call.active():
+        self._challenge_call.cancel()
+      self._challenge_call = None
+      
+      was_ready = self.challenge_id is not None
       self.challenge_id = data.split(' ')[2].strip(' \n\x00')
-      # This is just to test to see if our password worked. It will
-      # throw an exception if it wasn't the right password.
-      #self.command('say')
-      # Send the ready signal since we've received our challenge.
-      self.ready.send(sender=self.__class__)
+      self.challenge_time = time.time()
+      # Send the ready signal since we've received our challenge. A routine
+      # renewal of a working challenge doesn't count.
+      if not was_ready:
+        self.ready.send(sender=self.__class__, network=self)
+      self._pump()
     elif data.startswith("\xFF\xFF\xFF\xFFlBad rcon_password."):
       raise PasswordError('Invalid rcon password')
     elif data.startswith("\xFF\xFF\xFF\xFFlBad challenge."):
-      raise Exception("BAD CHALLENGE???? WHY???")
-    elif self.deferreds and data.startswith('\xFF\xFF\xFF', 1):
-      # All this code reassembles packets if they're fragmented by the hlds.
-      # It's a little tricky since we have to do this asynchronously, and save
-      # our state between receives.
-      if data and data[0] == '\xFE':
-        packet_count = ord(data[8]) & 15
-        self.deferreds[0]['packet_count'] = packet_count
-        self.deferreds[0]['packets'] = [' ' for i in range(packet_count)]        
-      packet_count = getattr(self.deferreds[0], 'packet_count', None)
-      if packet_count is not None:
-        if packet_count > 0:
-          index = ord(data[8]) >> 4
-          self.deferreds[0]['packets'][index] = data[9:]
-          packet_count -= 1
-          self.deferreds[0]['packet_count'] = packet_count
-        
-          if packet_count == 0:
-            data = ''
-            for packet in self.deferreds[0]['packets']:
-              data = data + packet
-      # --End reassemble packet code
-      
-      # This executees if packet_count is either None or 0 (important!)
-      if not packet_count:
-        data = data[5:].strip(' \n\x00')
-        self.deferreds[0]['deferred'].callback(data)
-        self.deferreds = self.deferreds[1:]
+      self._bad_challenge()
+    elif data.startswith(SPLIT_HEADER):
+      # The hlds splits large responses (e.g. cvarlist) over several packets.
+      # Once all of them have arrived we handle the original packet.
+      data = self.reassembler.add(data)
+      if data is not None:
+        self.datagramReceived(data, (host, port))
+    elif data.startswith('\xFF\xFF\xFF\xFF'):
+      self._response_received(data[5:].strip(' \n\x00'))
+
+  #==============================
+  def _response_received(self, data):
+    """Finds the request a response belongs to and fires its deferred.
+    Tagged responses are matched by their tag. Untagged responses are
+    matched by content, falling back to the oldest untagged request."""
+    
+    self.stats['received'] += 1
+    
+    response, tag = split_tag(data)
+    if tag is not None:
+      request = self.pending.pop_tag(tag)
+      if request:
+        self.stats['matched_tag'] += 1
+    else:
+      request = self.pending.pop_match(response)
+      if request:
+        self.stats['matched_content'] += 1
+    
+    if request is None:
+      # The hlds answers fire-and-forget commands with an empty response,
+      # so those are not worth counting.
+      if response or tag is not None:
+        self.stats['unmatched'] += 1
+        log_detail.debug('[%s] unmatched response: %r' % (self.__class__.__name__, data))
+        self.unmatched.send(sender=self.__class__, data=response, tag=tag)
+      return
+    
+    if request.timeout_call and request.timeout_call.active():
+      request.timeout_call.cancel()
+    # A response to a resent command could be for any of the sends, so
+    # its round trip time can't be trusted.
+    if request.attempts == 1:
+      self.window.ack(time.time() - request.sent_time)
+    else:
+      self.window.ack()
+    
+    if request.deferred:
+      request.deferred.callback(response)
+    
+    self._pump()
 
   #==============================
   # Twisted event
@@ -156,36 +206,241 @@ class HL1Network(DatagramProtocol):
   #============================== 
   def authenticate(self, password=None):
     """Authenticates to the server. If the password is not passed, it uses
-    self.password instead."""
+    self.password instead. The challenge is asked for again if the server
+    doesn't answer in time."""
     
     if password:
       self.password = password
     
-    data = self.send("challenge rcon")
+    self._challenge_attempts = 0
+    self._ask_challenge()
+  
+  #==============================
+  def _ask_challenge(self):
+    if self._challenge_call and self._challenge_call.active():
+      self._challenge_call.cancel()
+    self._challenge_call = None
+    
+    if self._challenge_attempts >= self.MAX_CHALLENGE_ATTEMPTS:
+      log.error('[%s] No rcon challenge from %s:%s after %d attempts. Giving up.' % (self.__class__.__name__, self.host, self.port, self._challenge_attempts))
+      return
+    
+    delay = min(self.MAX_CHALLENGE_DELAY, self.window.rtt.rto() * 2 ** self._challenge_attempts)
+    self._challenge_attempts += 1
+    self._challenge_call = reactor.callLater(delay, self._ask_challenge)
+    
+    self.stats['challenges'] += 1
+    self.send("challenge rcon")
+  
+  #==============================
+  def _bad_challenge(self):
+    """Called when the server rejects our challenge, e.g. after a map change
+    or a restart. Sending stops until a new challenge arrives. The commands
+    sent with the rejected challenge were rejected too, so they are queued
+    again to be sent with the new challenge.
+    
+    The reply doesn't say which command it rejects, and replaying a command
+    that did run (e.g. a kick) would run it twice. So a rejection is only
+    acted on when every command waiting on a response was sent with the
+    current challenge. Commands sent with an older one are left to time out."""
+    
+    self.stats['bad_challenges'] += 1
+    
+    # Every command in flight gets a 'Bad challenge.' of its own. Only the
+    # first one has anything left to do.
+    if self._stale_rejections and time.time() < self._stale_until:
+      self._stale_rejections -= 1
+      return
+    self._stale_rejections = 0
+    if self.challenge_id is None or self.pending.sent_with_other(self.challenge_id):
+      return
+    
+    requests = self.pending.pop_challenge(self.challenge_id)
+    if not requests:
+      return
+    self.challenge_id = None
+    log.debug('[%s] Bad challenge. Renewing it.' % self.__class__.__name__)
+    
+    self._stale_rejections = len(requests) - 1
+    self._stale_until = time.time() + 2 * self.window.rtt.rto()
+    requests.reverse()
+    for request in requests:
+      if request.timeout_call and request.timeout_call.active():
+        request.timeout_call.cancel()
+      self.scheduler.push(request, request.priority, front=True)
+    
+    self.authenticate()
   
   #==============================
   def send(self, data):
     """Sends a packet to the server."""
     
     self.transport.write("\xFF\xFF\xFF\xFF%s\x00" % data)
+    self.stats['sent'] += 1
     
   #============================== 
   def command(self, *args, **kwargs):
     """Sends an rcon command to the server. It takes a variable amount of
     parameters which it separates by spaces. You can pass deferred=False to
-    not create a deferred for this command."""
+    not create a deferred for this command.
+    
+    Commands are tagged so their response can be matched even if responses
+    arrive out of order. If a command can't be tagged, you can pass match
+    (a compiled regular expression or a function) to match its response by
+    content.
+    
+    The command is queued if the send window is full, and is sent once
+    enough earlier commands have been answered. Pass priority to choose
+    which lane it waits in (see RconScheduler). It defaults to
+    PRIORITY_INTERACTIVE.
+    
+    If no response arrives in time, the deferred fails with RconTimeout.
+    Pass retries to resend the command that many times first. Only do this
+    for commands which are safe to run twice (e.g. reading a cvar).
+    
+    Fire-and-forget commands are collected until the end of the current
+    reactor iteration and then merged into as few packets as possible. The
+    hlds runs ';' separated commands in order. Commands are always sent in
+    the order they were issued, within their lane."""
+    
+    command = ' '.join(args).strip()
+    priority = kwargs.get('priority', PRIORITY_INTERACTIVE)
+    
+    if len(self.pending) + len(self.scheduler) + len(self.batch) >= self.max_pending:
+      self.stats['dropped'] += 1
+      log.warning('[%s] Too many pending rcon commands. Dropped: %s' % (self.__class__.__name__, command))
+      if kwargs.get('deferred', True):
+        return defer.fail(RconError('Too many pending rcon commands'))
+      return None
+    
+    if not kwargs.get('deferred', True):
+      if not command:
+        return None
+      self.batch.append((priority, command))
+      if not self._flush_call or not self._flush_call.active():
+        self._flush_call = reactor.callLater(0, self.flush)
+      return None
+    
+    # Anything collected before this command must go out before it.
+    self.flush()
     
-    d = None
-    if kwargs.get('deferred', True):
-      d = defer.Deferred()
-      self.deferreds.append({'deferred': d})   
-      #print "Added callback for: %s" % ' '.join(args)
-    
-    command = "rcon %s \"%s\" %s" % (self.challenge_id, self.password, ' '.join(args))
-    self.send(command)
+    d = defer.Deferred()
+    request = PendingRequest(command, d, kwargs.get('match', None), kwargs.get('retries', 0))
+    if not self.scheduler.push(request, priority):
+      self.stats['dropped'] += 1
+      return defer.fail(RconError('The %s queue is full' % LANE_NAMES[priority]))
+    self._pump()
     
     return d
   
+  #==============================
+  def flush(self):
+    """Merges the collected fire-and-forget commands into packets of at most
+    batch_size characters and queues them. Only commands of the same
+    priority share a packet."""
+    
+    if self._flush_call and self._flush_call.active():
+      self._flush_call.cancel()
+    self._flush_call = None
+    
+    batch, self.batch = self.batch, []
+    packet = []
+    packet_priority = None
+    size = 0
+    for priority, command in batch:
+      # A command with an unbalanced quote would swallow the commands after
+      # it, so it goes in a packet of its own.
+      if not can_tag(command):
+        if packet:
+          self._queue_batch(packet, packet_priority)
+          packet, size = [], 0
+        self._queue_batch([command], priority)
+        continue
+      
+      if packet and (priority != packet_priority or size + 1 + len(command) > self.batch_size):
+        self._queue_batch(packet, packet_priority)
+        packet, size = [], 0
+      
+      size += len(command) + (1 if packet else 0)
+      packet.append(command)
+      packet_priority = priority
+    
+    if packet:
+      self._queue_batch(packet, packet_priority)
+    self._pump()
+  
+  #==============================
+  def _queue_batch(self, commands, priority):
+    if not self.scheduler.push(PendingRequest(';'.join(commands)), priority):
+      self.stats['dropped'] += len(commands)
+      log.warning('[%s] The %s queue is full. Dropped: %s' % (self.__class__.__name__, LANE_NAMES[priority], ';'.join(commands)))
+      return
+    if len(commands) > 1:
+      self.stats['batched'] += len(commands)
+  
+  #==============================
+  def _pump(self):
+    """Sends queued commands while the send window has room. If the window
+    or the rate limit asks us to slow down, it calls itself again once we
+    may send."""
+    
+    # Either a call is already scheduled or we can't send anything yet.
+    if self._pump_call and self._pump_call.active():
+      return
+    self._pump_call = None
+    if self.challenge_id is None:
+      return
+    
+    while len(self.scheduler) and len(self.pending) < self.window.limit():
+      delay = max(self.window.delay(), self.scheduler.delay())
+      if delay > 0:
+        self._pump_call = reactor.callLater(delay, self._pump)
+        return
+      self._send_request(self.scheduler.pop())
+  
+  #==============================
+  def _send_request(self, request):
+    """Tags a request, adds it to the pending table and sends it."""
+    
+    command = request.command
+    self.pending.add(request, tag=can_tag(command))
+    if request.tag is not None:
+      command = '%s;echo %s%d' % (command, TAG_PREFIX, request.tag)
+    
+    # Renew the challenge before it goes stale. The current one keeps being
+    # used until the new one arrives.
+    if (self.max_challenge_age and not self._challenge_call and
+        time.time() - self.challenge_time > self.max_challenge_age):
+      self.authenticate()
+    
+    request.attempts += 1
+    request.challenge = self.challenge_id
+    request.sent_time = time.time()
+    request.timeout_call = reactor.callLater(
+      self.window.rtt.rto() * 2 ** (request.attempts - 1),
+      self._request_timed_out, request)
+    self.window.sent(request.sent_time)
+    self.send("rcon %s \"%s\" %s" % (self.challenge_id, self.password, command))
+  
+  #==============================
+  def _request_timed_out(self, request):
+    """Called when a request hasn't been answered in time. It is resent if
+    it has retries left, otherwise its deferred fails."""
+    
+    self.pending.remove(request)
+    self.stats['timeouts'] += 1
+    self.window.loss()
+    log_detail.debug('[%s] timed out: %r' % (self.__class__.__name__, request))
+    
+    if request.retries > 0:
+      request.retries -= 1
+      self.stats['retries'] += 1
+      self.scheduler.push(request, request.priority, front=True)
+    elif request.deferred:
+      request.deferred.errback(RconTimeout('No response to: %s' % request.command))
+    
+    self._pump()
+  
   #============================== 
   def is_player(self, player):
     """Returns whether the player passed is a player or not."""
@@ -298,7 +553,7 @@ class RconClient(object):
   #==============================
   def kick(self, uniqueid, reason=''):
     """Kick a user based on their uniqueid."""
-    self.command("kick", "#%s" % uniqueid, reason)
+    self.command("kick", "#%s" % uniqueid, reason, deferred=False, priority=PRIORITY_MODERATION)
     
     log_detail.debug('[%s] kick: %s' % (self.__class__.__name__, uniqueid))
   
@@ -356,9 +611,9 @@ class RconClient(object):
     """Bans a user from the server. Be sure to call writeid to write the bans to the config."""
     
     if kick:
-      self.command("banid", str(duration), "%s" % uniqueid, "kick")
+      self.command("banid", str(duration), "%s" % uniqueid, "kick", deferred=False, priority=PRIORITY_MODERATION)
     else:
-      self.command("banid", str(duration), "%s" % uniqueid)
+      self.command("banid", str(duration), "%s" % uniqueid, deferred=False, priority=PRIORITY_MODERATION)
     
   #============================== 
   def ban_ex(self, names=None, uniqueids=None, duration=0, uniqueid_exceptions=None):
@@ -416,13 +671,13 @@ class RconClient(object):
     """Unbans users from the server. Be sure to call
     writeid to undo the ban from the config.
     """    
-    self.command("removeid", "%s" % uniqueid) 
+    self.command("removeid", "%s" % uniqueid, deferred=False, priority=PRIORITY_MODERATION)
 
   #==============================
   def say(self, text):
     """Makes the server say something."""
     
-    self.command("say", text)
+    self.command("say", text, deferred=False, priority=PRIORITY_BULK)
   
   #==============================
   def hsay(self, hostname, text):
@@ -445,25 +700,25 @@ class RconClient(object):
   def hostname(self, hostname):
     """Sets the hostname of the server."""
       
-    self.command('hostname', '"%s"' % (hostname if hostname else ''))
+    self.command('hostname', '"%s"' % (hostname if hostname else ''), deferred=False, priority=PRIORITY_BULK)
     
   #============================== 
   def changelevel(self, map):
     """Changes the map of the server."""
     
-    self.command("changelevel", map)
+    self.command("changelevel", map, deferred=False)
 
   #==============================
   def restart(self):
     """Restarts the server."""
     
-    self.command("_restart")
+    self.command("_restart", deferred=False)
     
   #==============================
   def quit(self):
     """Quits the server."""
     
-    self.command("quit")
+    self.command("quit", deferred=False)
     
   #==============================
   def cvar(self, cvar, value=None):
@@ -479,11 +734,12 @@ class RconClient(object):
         ret = m.group(3)
       
       if value:
-        self.command(cvar, value)
+        self.command(cvar, value, deferred=False)
         
       d.callback(ret)
       
-    self.command('%s' % cvar).addCallback(got_cvar)
+    match = re.compile('^"%s" (is|=) ' % re.escape(cvar), re.IGNORECASE)
+    self.command('%s' % cvar, match=match, retries=2).addCallbacks(got_cvar, d.errback)
     
     return d
   
@@ -497,22 +753,22 @@ class RconClient(object):
         value = "0"
       else:
         value = "1"
-      self.cvar(cvar, value)
+      return self.cvar(cvar, value)
     
-    self.cvar(cvar).addCallback(got_cvar)
+    self.cvar(cvar).addCallback(got_cvar).addErrback(log_failure, 'toggling %s' % cvar)
 
   
   #==============================
   def exec_(self, config):
     """Sends a exec command to load a config."""
     
-    self.command("exec", config)
+    self.command("exec", config, deferred=False, priority=PRIORITY_BULK)
   
   #==============================
   def writeid(self):
     """Updates the banned.cfg with the current bans."""
     
-    self.command("writeid")
+    self.command("writeid", deferred=False, priority=PRIORITY_MODERATION)
   
   #==============================
   def users(self):
@@ -542,7 +798,7 @@ class RconClient(object):
         
       d.callback(self.players)
     
-    self.command('users').addCallback(process_users)
+    self.command('users', retries=2).addCallbacks(process_users, d.errback)
     return d
   
   #==============================
@@ -563,7 +819,7 @@ class RconClient(object):
       
       d.callback(player)
       
-    self.command('user', player['userid']).addCallback(got_user)
+    self.command('user', player['userid'], retries=2).addCallbacks(got_user, d.errback)
     return d  
 
   #==============================
@@ -0,0 +1,133 @@
+# Read LICENSE for licensing details.
+"""Typed records for the events parsed from log lines.
+
+Every event has its own class, made by event_class from the event's regex.
+The fields are the named groups of the regex, preceded by the parts of the
+player prefix for events about a player. They are read as attributes
+(data.name) or, like the dictionaries events used to be, by key
+(data['name']). Fields which are rarely used are only pulled out of the
+regex match when they are read."""
+
+# The values of these fields repeat over and over (a player's uniqueid on
+# every line about them, team and event names), so a single copy is kept.
+INTERNED_FIELDS = ('uniqueid', 'team', 'event')
+
+#------------------------------
+class LogEvent(object):
+  """The base class of the event records. Use event_class to make one."""
+
+  __slots__ = ('_match',)
+
+  event_type = None # The name of the event, e.g. 'user_say'.
+  fields = () # Every field, in the order of the regex.
+  _player = () # (field, index in the player, interned) for each player field.
+  _eager = () # The fields pulled out of the match right away.
+  _interned = () # The indexes of the eager fields which are interned.
+
+  #==============================
+  def __init__(self, match, player=None):
+    """match is the match of the event's regex. player is the parsed player
+    prefix for events about a player (see receiver.parse_player)."""
+
+    self._match = match
+    for field, index, interned in self._player:
+      value = player[index]
+      if interned:
+        value = intern(value)
+      setattr(self, field, value)
+
+    if not self._eager:
+      return
+
+    values = match.group(*self._eager)
+    if len(self._eager) == 1:
+      values = (values,)
+    if self._interned:
+      values = list(values)
+      for index in self._interned:
+        if values[index] is not None:
+          values[index] = intern(values[index])
+
+    for field, value in zip(self._eager, values):
+      setattr(self, field, value)
+
+  #==============================
+  def __getitem__(self, key):
+    if key not in self.fields:
+      raise KeyError(key)
+    return getattr(self, key)
+
+  #==============================
+  def get(self, key, default=None):
+    if key not in self.fields:
+      return default
+    return getattr(self, key)
+
+  #==============================
+  def __contains__(self, key):
+    return key in self.fields
+
+  #==============================
+  def __iter__(self):
+    return iter(self.fields)
+
+  #==============================
+  def keys(self):
+    return list(self.fields)
+
+  #==============================
+  def items(self):
+    return [(field, getattr(self, field)) for field in self.fields]
+
+  #==============================
+  def groupdict(self):
+    """Returns the fields as a dictionary."""
+
+    return dict(self.items())
+
+  #==============================
+  def __repr__(self):
+    return '<%s %r>' % (self.__class__.__name__, self.groupdict())
+
+#==============================
+def _lazy_field(field):
+  #==============================
+  def get(self):
+    return self._match.group(field)
+  return property(get)
+
+#==============================
+def event_class(name, regex, lazy=(), player=None):
+  """Makes the record class of an event.
+
+  name - the name of the event, e.g. 'user_say'.
+  regex - the compiled regex of the event. Its named groups are the fields.
+  lazy - the fields which are rarely used. They are only pulled out of the
+    match when read.
+  player - for an event about a player, the fields the name, userid,
+    uniqueid and team of the player are stored in. None leaves one out.
+  """
+
+  player_fields = []
+  if player is not None:
+    for index, field in enumerate(player):
+      if field is not None:
+        player_fields.append((field, index, field in INTERNED_FIELDS))
+
+  fields = sorted(regex.groupindex, key=regex.groupindex.get)
+  eager = tuple([field for field in fields if field not in lazy])
+
+  attributes = {
+    '__slots__': tuple([field for field, index, interned in player_fields]) + eager,
+    'event_type': name,
+    'fields': tuple([field for field, index, interned in player_fields] + fields),
+    '_player': tuple(player_fields),
+    '_eager': eager,
+    '_interned': tuple([index for index, field in enumerate(eager) if field in INTERNED_FIELDS])
+  }
+  for field in fields:
+    if field in lazy:
+      attributes[field] = _lazy_field(field)
+
+  class_name = str(''.join([part.capitalize() for part in name.split('_')]) + 'Event')
+  return type(class_name, (LogEvent,), attributes)
@@ -0,0 +1,118 @@
+# Read LICENSE for licensing details.
+"""Flow control for rcon commands. Keeps track of the round trip time to the
+server and how many commands can be in flight at once."""
+
+import time
+
+#------------------------------
+class RttEstimator(object):
+  """Keeps a smoothed round trip time the same way TCP does (RFC 6298)."""
+
+  ALPHA = 0.125
+  BETA = 0.25
+  
+  # Bounds (in seconds) of the retransmission timeout.
+  INITIAL_RTO = 1.0
+  MIN_RTO = 0.2
+  MAX_RTO = 10.0
+
+  #==============================
+  def __init__(self):
+    self.srtt = None
+    self.rttvar = None
+    self.min_rtt = None
+
+  #==============================
+  def sample(self, rtt):
+    """Adds a round trip time measurement in seconds."""
+
+    if self.srtt is None:
+      self.srtt = rtt
+      self.rttvar = rtt / 2.0
+    else:
+      self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+      self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+    if self.min_rtt is None or rtt < self.min_rtt:
+      self.min_rtt = rtt
+
+  #==============================
+  def rto(self):
+    """Returns how many seconds to wait for a response before giving up."""
+
+    if self.srtt is None:
+      return self.INITIAL_RTO
+    return min(self.MAX_RTO, max(self.MIN_RTO, self.srtt + 4 * self.rttvar))
+
+#------------------------------
+class SendWindow(object):
+  """Decides how many commands may be in flight and how fast they are sent.
+
+  The window grows by one command per round trip while round trip times stay
+  close to the fastest one seen. When they climb, the server is queueing our
+  commands so the window shrinks. Sends are paced so that a full window is
+  spread over one round trip instead of going out in a single burst.
+  """
+
+  # A round trip this many times slower than the fastest one means the server
+  # is falling behind. The slack (in seconds) keeps jitter on a fast link from
+  # counting as queueing.
+  QUEUEING_FACTOR = 2.0
+  QUEUEING_SLACK = 0.005
+
+  #==============================
+  def __init__(self, max_size=8):
+    self.max_size = max(1, max_size)
+    self.size = 1.0
+    self.rtt = RttEstimator()
+    self.last_send = 0
+
+  #==============================
+  def limit(self):
+    """Returns the number of commands that may be in flight right now."""
+
+    return max(1, int(self.size))
+
+  #==============================
+  def pace(self):
+    """Returns the minimum amount of seconds between two sends."""
+
+    if self.rtt.srtt is None:
+      return 0
+    return self.rtt.srtt / self.limit()
+
+  #==============================
+  def delay(self, now=None):
+    """Returns how many seconds to wait before the next send is allowed."""
+
+    if now is None:
+      now = time.time()
+    return self.last_send + self.pace() - now
+
+  #==============================
+  def sent(self, now=None):
+    """Records that a command was just sent."""
+
+    if now is None:
+      now = time.time()
+    self.last_send = now
+
+  #==============================
+  def ack(self, rtt=None):
+    """Records that a response arrived after rtt seconds. Pass None if the
+    response was for a retried command since its round trip is ambiguous."""
+
+    if rtt is None:
+      return
+    self.rtt.sample(rtt)
+    min_rtt = self.rtt.min_rtt
+    if rtt > max(min_rtt * self.QUEUEING_FACTOR, min_rtt + self.QUEUEING_SLACK):
+      self.size = max(1.0, self.size - 1.0 / self.size)
+    else:
+      self.size = min(float(self.max_size), self.size + 1.0 / self.size)
+
+  #==============================
+  def loss(self):
+    """Records that a command went unanswered. The window is halved."""
+
+    self.size = max(1.0, self.size / 2.0)
@@ -0,0 +1,111 @@
+# Read LICENSE for licensing details.
+"""A UDP port which reads log lines in batches.
+
+Twisted's UDP port hands every datagram to its protocol as soon as it is
+read. LogPort reads up to max_batch datagrams per wakeup and hands them to
+the protocol's datagramsReceived all at once. Whatever is left is read on
+the next wakeup, so a burst can't starve the rest of the reactor."""
+
+import os
+import errno
+import socket
+import logging
+
+from twisted.internet import udp
+from twisted.python import log as twisted_log
+
+log = logging.getLogger('general')
+
+# Reading these errors means there is nothing more to read for now.
+_READ_IGNORE = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR, errno.ECONNREFUSED)
+
+#------------------------------
+class LogPort(udp.Port):
+  """A UDP port which passes the datagrams it reads to the protocol's
+  datagramsReceived as a list of (data, (host, port)).
+
+  max_batch - the most datagrams read per wakeup.
+  receive_buffer - the size of the socket's receive buffer (SO_RCVBUF) in
+    bytes. The kernel may round it or cap it (net.core.rmem_max on Linux).
+    None leaves the default.
+  """
+
+  #==============================
+  def __init__(self, port, proto, interface='', maxPacketSize=8192, reactor=None, max_batch=64, receive_buffer=None):
+    udp.Port.__init__(self, port, proto, interface, maxPacketSize, reactor)
+    self.max_batch = max(1, max_batch)
+    self.receive_buffer = receive_buffer
+    self.stats = {
+      'batches': 0,
+      'datagrams': 0,
+      'max_batch': 0,
+      'full_batches': 0 # Batches that stopped at max_batch.
+    }
+
+  #==============================
+  def createInternetSocket(self):
+    skt = udp.Port.createInternetSocket(self)
+    if self.receive_buffer:
+      try:
+        skt.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+      except socket.error, e:
+        log.warning('[%s] could not set the receive buffer to %d bytes: %s' % (self.__class__.__name__, self.receive_buffer, e))
+    return skt
+
+  #==============================
+  def receive_buffer_size(self):
+    """Returns the size of the socket's receive buffer as the kernel set it."""
+
+    return self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+  #==============================
+  def doRead(self):
+    batch = []
+    try:
+      while len(batch) < self.max_batch:
+        try:
+          data, addr = self.socket.recvfrom(self.maxPacketSize)
+        except socket.error, se:
+          if se.args[0] in _READ_IGNORE:
+            break
+          raise
+        batch.append((data, addr[:2]))
+    finally:
+      if batch:
+        self.stats['batches'] += 1
+        self.stats['datagrams'] += len(batch)
+        if len(batch) > self.stats['max_batch']:
+          self.stats['max_batch'] = len(batch)
+        if len(batch) == self.max_batch:
+          self.stats['full_batches'] += 1
+        try:
+          self.protocol.datagramsReceived(batch)
+        except:
+          twisted_log.err()
+
+  #==============================
+  def kernel_drops(self):
+    """Returns how many datagrams the kernel dropped because the receive
+    buffer was full, or None if that can't be found out. Only Linux keeps
+    this count (in /proc/net/udp)."""
+
+    try:
+      inode = str(os.fstat(self.socket.fileno()).st_ino)
+    except (AttributeError, OSError, socket.error):
+      return None
+
+    for path in ('/proc/net/udp', '/proc/net/udp6'):
+      try:
+        fp = open(path, 'r')
+      except IOError:
+        continue
+      try:
+        # sl local_address rem_address st tx_queue:rx_queue tr:tm->when
+        # retrnsmt uid timeout inode ref pointer drops
+        for line in fp.readlines()[1:]:
+          fields = line.split()
+          if len(fields) >= 13 and fields[9] == inode:
+            return int(fields[12])
+      finally:
+        fp.close()
+    return None
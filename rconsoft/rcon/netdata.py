@@ -0,0 +1,77 @@
+# Read LICENSE for licensing details.
+"""Reading the fields of hlds network messages. It has no dependencies, so
+both the twisted client and the blocking rconlib use it."""
+
+import struct
+
+#------------------------------
+class NetworkData(object):
+  """This object encapsulates network data. It enables you to
+  easily grab bits and pieces of the message.
+  
+  Reading moves a cursor (offset) forward instead of slicing off what was
+  read, so parsing a message takes time proportional to its size."""
+  
+  # Compiled struct formats, shared between all instances.
+  _structs = {}
+  
+  #==============================
+  def __init__(self, data, offset=0):
+    self.data = data
+    self.view = memoryview(data)
+    self.offset = offset
+    
+  #==============================
+  def get_byte(self):
+    ret = ord(self.data[self.offset])
+    self.offset += 1
+    return ret
+
+  #==============================
+  def get_char(self):
+    ret = self.data[self.offset]
+    self.offset += 1
+    return ret
+  
+  #==============================
+  def get_string(self):
+    loc = self.data.find('\x00', self.offset)
+    if loc == -1:
+      loc = len(self.data)
+    ret = self.data[self.offset:loc]
+    self.offset = loc + 1
+    return ret
+  
+  #==============================
+  def get_int(self):
+    return self.unpack('<i')[0]
+  
+  #==============================
+  def get_float(self):
+    return self.unpack('<f')[0]
+  
+  #==============================
+  def unpack(self, format):
+    """Reads a fixed layout in one go and returns a tuple of its fields.
+    format is a struct format, e.g. '<iiB' for two ints and a byte."""
+    
+    s = self._structs.get(format)
+    if s is None:
+      s = self._structs[format] = struct.Struct(format)
+    ret = s.unpack_from(self.view, self.offset)
+    self.offset += s.size
+    return ret
+  
+  #==============================
+  def remaining(self):
+    """Returns how many bytes are left to read."""
+    
+    return max(0, len(self.data) - self.offset)
+  
+  #==============================
+  def __str__(self):
+    return self.data[self.offset:]
+  
+  #==============================
+  def __repr__(self):
+    return self.data[self.offset:].__repr__()
@@ -0,0 +1,161 @@
+# Read LICENSE for licensing details.
+"""Bookkeeping for rcon requests that are waiting on a response."""
+
+import re
+
+# Every tagged rcon command has 'echo <TAG_PREFIX><tag>' appended to it.
+# The hlds executes the echo after the command itself, so the tag always
+# ends up on the last line of the response.
+TAG_PREFIX = 'rsft#'
+TAG_RE = re.compile(r'(?:^|\n)%s(?P<tag>\d+)\s*$' % re.escape(TAG_PREFIX))
+
+#==============================
+def can_tag(command):
+  """Returns whether a tag can safely be appended to a command. A command with
+  an unbalanced quote would swallow the tag, so it is not tagged."""
+
+  return command.count('"') % 2 == 0
+
+#==============================
+def split_tag(response):
+  """Splits a response into (response, tag). The tag is None if the response
+  was not tagged."""
+
+  m = TAG_RE.search(response)
+  if not m:
+    return (response, None)
+  return (response[:m.start()].strip(' \n\x00'), int(m.group('tag')))
+
+#------------------------------
+class PendingRequest(object):
+  """A single rcon request which is waiting on a response.
+
+  command - the command sent to the server (without the rcon header).
+  deferred - the deferred to fire with the response. May be None.
+  match - used to match untagged responses by content. Either a compiled
+    regular expression or a function which takes the response and returns
+    a boolean.
+  retries - how many times the command may be resent if it times out. Only
+    commands which are safe to run twice should be retried.
+  
+  challenge is the rcon challenge the request was last sent with.
+  """
+
+  #==============================
+  def __init__(self, command, deferred=None, match=None, retries=0):
+    self.command = command
+    self.deferred = deferred
+    self.match = match
+    self.retries = retries
+    self.attempts = 0
+    self.priority = None
+    self.tag = None
+    self.queued_time = None
+    self.sent_time = None
+    self.challenge = None
+    self.timeout_call = None
+
+  #==============================
+  def matches(self, response):
+    """Returns whether an untagged response belongs to this request."""
+
+    if self.match is None:
+      return False
+    if hasattr(self.match, 'search'):
+      return self.match.search(response) is not None
+    return bool(self.match(response))
+
+  #==============================
+  def __repr__(self):
+    return '<PendingRequest tag=%s command=%r>' % (self.tag, self.command)
+
+#------------------------------
+class PendingTable(object):
+  """A table of requests that are waiting on a response from the server.
+  Tagged requests are looked up by their tag. Untagged requests are matched
+  by content, and if that fails, in the order they were sent."""
+
+  #==============================
+  def __init__(self):
+    self.tagged = {} # Indexed by tag
+    self.untagged = [] # In the order they were sent
+    self.next_tag = 1
+
+  #==============================
+  def add(self, request, tag=True):
+    """Adds a request to the table. If tag is True, a new tag is assigned
+    to the request. Returns the request."""
+
+    if tag:
+      request.tag = self.next_tag
+      self.next_tag += 1
+      self.tagged[request.tag] = request
+    else:
+      request.tag = None
+      self.untagged.append(request)
+    return request
+
+  #==============================
+  def pop_tag(self, tag):
+    """Removes and returns the request with the tag passed, or None."""
+
+    return self.tagged.pop(tag, None)
+
+  #==============================
+  def pop_match(self, response):
+    """Removes and returns the untagged request the response belongs to, or
+    None. Requests with a matcher are tried first. Otherwise the oldest
+    request without a matcher is used."""
+
+    fallback = None
+    for index, request in enumerate(self.untagged):
+      if request.match is None:
+        if fallback is None:
+          fallback = index
+      elif request.matches(response):
+        return self.untagged.pop(index)
+
+    if fallback is not None:
+      return self.untagged.pop(fallback)
+    return None
+
+  #==============================
+  def remove(self, request):
+    """Removes a request from the table if it is in it."""
+
+    if request.tag is not None:
+      self.tagged.pop(request.tag, None)
+    elif request in self.untagged:
+      self.untagged.remove(request)
+
+  #==============================
+  def sent_with_other(self, challenge):
+    """Returns whether any request was sent with another challenge than the
+    one passed."""
+
+    for request in self.tagged.itervalues():
+      if request.challenge != challenge:
+        return True
+    for request in self.untagged:
+      if request.challenge != challenge:
+        return True
+    return False
+
+  #==============================
+  def pop_challenge(self, challenge):
+    """Removes and returns the requests sent with a challenge, in the order
+    they were sent."""
+
+    requests = [request for request in self.tagged.itervalues() if request.challenge == challenge]
+    for request in requests:
+      del self.tagged[request.tag]
+    untagged = [request for request in self.untagged if request.challenge == challenge]
+    if untagged:
+      self.untagged = [request for request in self.untagged if request.challenge != challenge]
+    requests.extend(untagged)
+    requests.sort(key=lambda request: request.sent_time)
+    return requests
+
+  #==============================
+  def __len__(self):
+    return len(self.tagged) + len(self.untagged)
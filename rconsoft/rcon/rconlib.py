@@ -1,9 +1,10 @@
 import socket
-import struct
 import re
 import time
 import logging
 
+from rconsoft.rcon.netdata import NetworkData
+
 log = logging.getLogger(__name__)
 
 #------------------------------
@@ -17,52 +18,14 @@ class RconError(Exception):
   pass
 
 #------------------------------
-class RconResponse(object):
+class RconResponse(NetworkData):
   """This object encapsulates an rcon response. It enables you to
   easily grab bits and pieces of the message."""
   
   #==============================
   def __init__(self, data):
-    self.data = data[5:]
-    
-  #==============================
-  def get_byte(self):
-    ret = ord(self.data[0])
-    self.data = self.data[1:]
-    return ret
-
-  #==============================
-  def get_char(self):
-    ret = str(data[0])
-    self.data = self.data[1:]
-    return ret
-  
-  #==============================
-  def get_string(self):
-    loc = self.data.find('\x00')
-    ret = self.data[0:loc]
-    self.data = self.data[loc+1:]
-    return ret
-  
-  #==============================
-  def get_int(self):
-    ret = struct.unpack('i', self.data[0:4])[0]
-    self.data = self.data[4:]
-    return ret
-  
-  #==============================
-  def get_float(self):
-    ret = struct.unpack('f', self.data[0:4])[0]
-    self.data = self.data[4:]
-    return ret
-  
-  #==============================
-  def __str__(self):
-    return self.data.__str__()
-  
-  #==============================
-  def __repr__(self):
-    return self.data.__repr__()    
+    # Skip the \xFF\xFF\xFF\xFF header and the response type.
+    NetworkData.__init__(self, data, 5)
 
 #------------------------------
 class HL1Network(object):
@@ -0,0 +1,129 @@
+# Read LICENSE for licensing details.
+"""Reassembles responses the hlds splits over several packets.
+
+A split packet looks like:
+  int32  -2 (\\xFE\\xFF\\xFF\\xFF)
+  int32  sequence id, the same for every packet of a response
+  byte   upper four bits: index of this packet, lower four bits: packet count
+  ...    a piece of the original packet
+"""
+
+import time
+import struct
+
+SPLIT_HEADER = '\xFE\xFF\xFF\xFF'
+HEADER_SIZE = 9
+
+#------------------------------
+class SplitPacket(object):
+  """The packets of a single split response that have arrived so far."""
+
+  __slots__ = ('fragments', 'missing', 'created')
+
+  #==============================
+  def __init__(self, count, created):
+    self.fragments = [None] * count
+    self.missing = count
+    self.created = created
+
+  #==============================
+  def join(self):
+    """Joins the fragments into the original packet. The payloads are copied
+    once into a buffer sized for the whole packet."""
+
+    size = 0
+    for fragment in self.fragments:
+      size += len(fragment) - HEADER_SIZE
+
+    buf = bytearray(size)
+    offset = 0
+    for fragment in self.fragments:
+      end = offset + len(fragment) - HEADER_SIZE
+      buf[offset:end] = memoryview(fragment)[HEADER_SIZE:]
+      offset = end
+    return str(buf)
+
+#------------------------------
+class SplitPacketReassembler(object):
+  """Collects split packets by their sequence id. Several split responses may
+  be in progress at once. Responses that are still incomplete after timeout
+  seconds are thrown away, as are the oldest ones once more than max_pending
+  are in progress."""
+
+  #==============================
+  def __init__(self, timeout=5.0, max_pending=16):
+    self.timeout = timeout
+    self.max_pending = max_pending
+    self.pending = {} # Indexed by sequence id
+    self.stats = {
+      'fragments': 0,
+      'completed': 0,
+      'expired': 0,
+      'duplicates': 0,
+      'invalid': 0
+    }
+
+  #==============================
+  def add(self, data, now=None):
+    """Adds a split packet. Returns the original packet once all of its
+    pieces have arrived, otherwise None."""
+
+    if now is None:
+      now = time.time()
+
+    if len(data) < HEADER_SIZE or not data.startswith(SPLIT_HEADER):
+      self.stats['invalid'] += 1
+      return None
+
+    sequence = struct.unpack_from('<i', data, 4)[0]
+    info = ord(data[8])
+    count = info & 15
+    index = info >> 4
+    if index >= count:
+      self.stats['invalid'] += 1
+      return None
+
+    self.stats['fragments'] += 1
+
+    packet = self.pending.get(sequence)
+    if packet is None or len(packet.fragments) != count:
+      self.expire(now)
+      if len(self.pending) >= self.max_pending:
+        self._drop_oldest()
+      packet = SplitPacket(count, now)
+      self.pending[sequence] = packet
+
+    if packet.fragments[index] is not None:
+      self.stats['duplicates'] += 1
+      return None
+
+    packet.fragments[index] = data
+    packet.missing -= 1
+    if packet.missing:
+      return None
+
+    del self.pending[sequence]
+    self.stats['completed'] += 1
+    return packet.join()
+
+  #==============================
+  def expire(self, now=None):
+    """Throws away responses that have been incomplete for too long."""
+
+    if now is None:
+      now = time.time()
+
+    deadline = now - self.timeout
+    for sequence in [s for s, p in self.pending.iteritems() if p.created < deadline]:
+      del self.pending[sequence]
+      self.stats['expired'] += 1
+
+  #==============================
+  def _drop_oldest(self):
+    sequence = min(self.pending, key=lambda s: self.pending[s].created)
+    del self.pending[sequence]
+    self.stats['expired'] += 1
+
+  #==============================
+  def __len__(self):
+    return len(self.pending)
@@ -3,15 +3,67 @@
 
 import re
 import logging
+import inspect
+from timeit import default_timer as timer
 
+from twisted.internet import reactor
 from twisted.internet.protocol import DatagramProtocol
 
 from rconsoft.dispatch.dispatcher import Signal
+from rconsoft.rcon.events import event_class
+from rconsoft.rcon.logport import LogPort
 from rconsoft.config import config
 
 log = logging.getLogger('general')
 log_detail = logging.getLogger('detail')
 
+# The word after the player in a log line about a player. Stops at
+# punctuation, so 'say_team' is 'say' and 'connected, address' is 'connected'.
+WORD_RE = re.compile(r'[A-Za-z]*')
+
+# The fields the parts of the player prefix are stored in by default: the
+# name, userid, uniqueid and team in "name<userid><uniqueid><team>".
+PLAYER = ('name', 'userid', 'uniqueid', 'team')
+
+#==============================
+def parse_player(response):
+  """Parses the player a log line starts with, e.g.
+  "name<userid><uniqueid><team>" say "hi". Returns ((name, userid,
+  uniqueid, team), end), where end is where the rest of the line starts, or
+  None if the line doesn't start with a player.
+  
+  The name may contain anything, including '<' and '>" ', so the player ends
+  at the first '>" ' that is preceded by <userid><uniqueid><team>. Those are
+  split off from the right, so a name with '<' in it stays whole."""
+  
+  if response[:1] != '"':
+    return None
+  
+  end = response.find('>" ')
+  while end != -1:
+    parts = response[1:end].rsplit('<', 3)
+    if len(parts) == 4:
+      name, userid, uniqueid, team = parts
+      if userid[-1:] == '>' and uniqueid[-1:] == '>' and userid[:-1].isdigit():
+        return ((name, userid[:-1], uniqueid[:-1], team), end + 3)
+    end = response.find('>" ', end + 1)
+  return None
+
+#==============================
+def event(*args):
+  """A decorator that stores the events the method handles into the method
+  itself. RconReceiver.connect_handlers connects the method to only those
+  events, so it is not called for any other log line.
+  
+  E.g.
+  @event('user_connected', 'user_disconnected')
+  def handler(event, data, server=None, **kwargs):
+     ..."""
+  def new(f):
+    setattr(f, '__events__', args)
+    return f
+  return new
+
 #------------------------------
 class EventError(Exception):
   """Is thrown when something involving events errors."""
@@ -23,51 +75,59 @@ class RconReceiver(DatagramProtocol):
   def __init__(self):
     self._init_signals()
     
-    self.events = {
-      'user_connected': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" connected, address "(?P<ip>.*?):(?P<port>.*?)"')
-      },
-      'user_disconnected': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" disconnected') 
-      },
-      'user_validated': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" STEAM USERID validated')
-      },
-      'user_entered': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" entered the game')
-      },
-      'user_joined_team': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><.*?>" joined team "(?P<team>.*?)"')
-      },
-      'user_say': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" say(_(?P<to>.*?))? "(?P<message>.*)"( \((?P<status>.*?)\))?')
-      },
-      'user_changed_name': {
-        'regex': re.compile(r'^"(?P<old_name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><.*?>" changed name to "(?P<name>.*?)"')
-      },
-      'user_triggered': {
-        'regex': re.compile(r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" triggered "(?P<event>.*?)"')
-      },
-      'world_triggered': {
-        'regex': re.compile(r'^World triggered "(?P<event>.*?)"( \(CT "(?P<ct_score>\d+)"\) \(T "(?P<t_score>\d+)"\))?')
-      },
-      'server_say': {
-        'regex': re.compile(r'^Server say "(?P<message>.*?)"')
-      },
-      'server_cvar': {
-        'regex': re.compile(r'^Server cvar "(?P<cvar>.*?)" = "(?P<value>.*?)"')
-      },
-      'team_scored': {
-        'regex': re.compile(r'^Team "(?P<team>.*?)" scored "(?P<score>.*?)" with "(?P<players>.*?)" players')
-      },
-      'team_triggered': {
-        'regex': re.compile(r'^Team "(?P<team>.*?)" triggered "(?P<event>.*?)"( \(CT "(?P<ct_score>\d+)"\) \(T "(?P<t_score>\d+)"\))?')
-      },
-      'rcon_command': {
-        'regex': re.compile(r'^Rcon: \"rcon (?P<challenge>\d+) \"(?P<password>.*?)\" (?P<command>.*?)\" from \"(?P<ip>.*?):(?P<port>.*?)\"')
-      }
+    # Used to figure out which server a log line came from. See set_servers.
+    self.servers = None
+    
+    # The LogPort the receiver listens on. See listen.
+    self.port = None
+    
+    self.events = {}
+    self.event_names = [] # In the order they were added
+    self._classifier = None
+    self._keyless = []
+    
+    # A signal for each event name. See connect_event.
+    self.routes = {}
+    
+    # How many subscribers are interested in each event. Only those events
+    # are parsed. The key None means every event. See add_interest.
+    self.interest = {}
+    
+    # The counters of the classifier. parse_time is the total amount of
+    # seconds spent classifying and parsing lines. See line_cost.
+    self.stats = {
+      'lines': 0,
+      'matched': 0,
+      'unhandled': 0,
+      'skipped': 0,
+      'ignored': 0, # Lines of events nobody is interested in. See is_event.
+      'regex_tries': 0,
+      'errors': 0, # Lines which couldn't be parsed or whose handlers raised
+      'parse_time': 0.0
     }
     
+    # The key of an event is what a line has to be classified as for the
+    # event to be tried (see classify). The regexes of the events about a
+    # player only match what follows the player. The fields listed last are
+    # rarely used, so they are only parsed when read.
+    for name, key, player, regex, lazy in [
+      ('user_connected', '" connected', PLAYER, r'connected, address "(?P<ip>.*?):(?P<port>.*?)"', ('ip', 'port')),
+      ('user_disconnected', '" disconnected', PLAYER, r'disconnected', ()),
+      ('user_validated', '" STEAM', PLAYER, r'STEAM USERID validated', ()),
+      ('user_entered', '" entered', PLAYER, r'entered the game', ()),
+      ('user_joined_team', '" joined', ('name', 'userid', 'uniqueid', None), r'joined team "(?P<team>.*?)"', ()),
+      ('user_say', '" say', PLAYER, r'say(_(?P<to>.*?))? "(?P<message>.*)"( \((?P<status>.*?)\))?', ('to', 'status')),
+      ('user_changed_name', '" changed', ('old_name', 'userid', 'uniqueid', None), r'changed name to "(?P<name>.*?)"', ()),
+      ('user_triggered', '" triggered', PLAYER, r'triggered "(?P<event>.*?)"', ()),
+      ('world_triggered', 'World', None, r'^World triggered "(?P<event>.*?)"( \(CT "(?P<ct_score>\d+)"\) \(T "(?P<t_score>\d+)"\))?', ('ct_score', 't_score')),
+      ('server_say', 'Server', None, r'^Server say "(?P<message>.*?)"', ()),
+      ('server_cvar', 'Server', None, r'^Server cvar "(?P<cvar>.*?)" = "(?P<value>.*?)"', ()),
+      ('team_scored', 'Team', None, r'^Team "(?P<team>.*?)" scored "(?P<score>.*?)" with "(?P<players>.*?)" players', ('players',)),
+      ('team_triggered', 'Team', None, r'^Team "(?P<team>.*?)" triggered "(?P<event>.*?)"( \(CT "(?P<ct_score>\d+)"\) \(T "(?P<t_score>\d+)"\))?', ('ct_score', 't_score')),
+      ('rcon_command', 'Rcon:', None, r'^Rcon: \"rcon (?P<challenge>\d+) \"(?P<password>.*?)\" (?P<command>.*?)\" from \"(?P<ip>.*?):(?P<port>.*?)\"', ('challenge', 'password', 'ip', 'port'))
+    ]:
+      self.add_event(name, regex, key, lazy, player)
+    
   #==============================
   def _init_signals(self):
     self.data = Signal()
@@ -75,37 +135,293 @@ class RconReceiver(DatagramProtocol):
     self.unhandled_event = Signal()
   
   #==============================
-  def add_event(self, name, regex):
+  def set_servers(self, servers):
+    """Sets the ServerRegistry used to find out which server sent a log line.
+    The server is passed along with every signal as server."""
+    
+    self.servers = servers
+  
+  #==============================
+  def listen(self, port, interface='', max_batch=64, receive_buffer=None):
+    """Starts listening for log lines on a LogPort, which reads up to
+    max_batch of them per wakeup and sets the socket's receive buffer to
+    receive_buffer bytes. Its counters are in self.port.stats, and
+    self.port.kernel_drops() tells how many lines the kernel dropped."""
+    
+    self.port = LogPort(port, self, interface, max_batch=max_batch, receive_buffer=receive_buffer, reactor=reactor)
+    self.port.startListening()
+    return self.port
+  
+  #==============================
+  def add_event(self, name, regex, key=None, lazy=(), player=None):
+    """Adds an event which is fired for every log line matching regex. Events
+    are tried in the order they were added. The data of the event is a record
+    whose fields are the named groups of regex (see rconsoft.rcon.events).
+    
+    key - what a line must be classified as for regex to be tried (e.g.
+      '" say' or 'World'). See classify. An event without a key is tried on
+      every line, which is slower.
+    lazy - the fields which are rarely used. They are only parsed when read.
+    player - for an event about a player, the fields to store the name,
+      userid, uniqueid and team of the player in (see PLAYER). Use None to
+      leave one out. The player is parsed by parse_player, and regex only
+      has to match what follows it (e.g. 'say "(?P<message>.*)"').
+    """
+    
     if name in self.events:
       raise EventError('Event already exists')
       
-    if isinstance(regex, str):
-      regex = re.compile(str)
+    if isinstance(regex, basestring):
+      regex = re.compile(regex)
     
     self.events[name] = {
-      'regex': regex
+      'regex': regex,
+      'key': key,
+      'player': player is not None,
+      'class': event_class(name, regex, lazy, player)
     }
+    self.event_names.append(name)
+    self._classifier = None
   
   #==============================
-  # Twisted event
-  def datagramReceived(self, data, (host, port)):
-    self.data.send(sender=self.__class__, data=data)
-    #print data
-    #log L date - time: response
-    null, null, date, null, time, response = data[4:-2].split(' ', 5)
-
-    #log.debug(response)
-    found_event = False
-    for event in self.events:
-      m = self.events[event]['regex'].match(response)
+  def add_interest(self, *names):
+    """Registers interest in the events passed. Only events somebody is
+    interested in are parsed and sent on the event signal, so whoever
+    connects to it must call this too (connect_event does this itself).
+    Without names, every event is parsed.
+    
+    Example: rcon_receiver.add_interest('user_say', 'user_entered')
+    """
+    
+    for name in names or (None,):
+      self.interest[name] = self.interest.get(name, 0) + 1
+    self._classifier = None
+  
+  #==============================
+  def remove_interest(self, *names):
+    """Undoes a call to add_interest with the same names."""
+    
+    for name in names or (None,):
+      count = self.interest.get(name, 0) - 1
+      if count > 0:
+        self.interest[name] = count
+      else:
+        self.interest.pop(name, None)
+    self._classifier = None
+  
+  #==============================
+  def connect_event(self, name, receiver, weak=True):
+    """Connects a receiver to a single event. It is only called for log lines
+    of that event, and interest in the event is registered for it."""
+    
+    route = self.routes.get(name)
+    if route is None:
+      route = self.routes[name] = Signal()
+    route.connect(receiver, weak=weak)
+    self.add_interest(name)
+  
+  #==============================
+  def disconnect_event(self, name, receiver, weak=True):
+    """Undoes a call to connect_event."""
+    
+    route = self.routes.get(name)
+    if route is not None:
+      route.disconnect(receiver, weak=weak)
+      self.remove_interest(name)
+  
+  #==============================
+  def connect_handlers(self, obj):
+    """Connects every method of obj tagged by the event decorator to the
+    events it handles."""
+    
+    for name, method in inspect.getmembers(obj, inspect.ismethod):
+      for event_name in getattr(method, '__events__', []):
+        self.connect_event(event_name, method)
+  
+  #==============================
+  def is_interesting(self, name):
+    """Returns whether anybody is interested in an event."""
+    
+    return None in self.interest or name in self.interest
+  
+  #==============================
+  def _build_classifier(self):
+    """Builds a table of the events to try for each key, leaving out the
+    events nobody is interested in. The events without a key are tried for
+    every key, and are the only ones tried for lines whose key no event has."""
+    
+    keyless = []
+    classifier = {}
+    for name in self.event_names:
+      if not self.is_interesting(name):
+        continue
+      key = self.events[name]['key']
+      if key is None:
+        keyless.append(name)
+        for names in classifier.values():
+          names.append(name)
+      elif key not in classifier:
+        classifier[key] = keyless + [name]
+      else:
+        classifier[key].append(name)
+    
+    self._classifier = classifier
+    self._keyless = keyless
+  
+  #==============================
+  def classify(self, response):
+    """Returns (key, player, end) for a log line. For a line about a player,
+    key is '" ' followed by the word after the player (e.g. '" say' for both
+    say and say_team), and player and end are what parse_player returns. For
+    any other line key is the first word (e.g. 'World') and player is None."""
+    
+    parsed = parse_player(response)
+    if parsed is not None:
+      player, end = parsed
+      return ('" ' + WORD_RE.match(response, end).group(), player, end)
+    
+    end = response.find(' ')
+    if end == -1:
+      return (response, None, 0)
+    return (response[:end], None, 0)
+  
+  #==============================
+  def match(self, response):
+    """Returns (event, match, player) for a log line, or (None, None, None)
+    if no event matches it. player is the player the line is about, if any
+    (see parse_player)."""
+    
+    if self._classifier is None:
+      self._build_classifier()
+    
+    key, player, end = self.classify(response)
+    names = self._classifier.get(key)
+    if names is None:
+      names = self._keyless
+    
+    for name in names:
+      event = self.events[name]
+      self.stats['regex_tries'] += 1
+      if not event['player']:
+        m = event['regex'].match(response)
+      elif player is not None:
+        m = event['regex'].match(response, end)
+      else:
+        continue
+      if m:
+        return (name, m, player)
+    
+    return (None, None, None)
+  
+  #==============================
+  def is_event(self, response):
+    """Returns whether a log line is one of the events nobody is interested
+    in. match doesn't try those, so this tells their lines apart from lines
+    which aren't an event at all. It is slower than match, so it is only
+    used for the lines match found nothing for, while unhandled_event has
+    receivers."""
+    
+    key, player, end = self.classify(response)
+    for name in self.event_names:
+      event = self.events[name]
+      if self.is_interesting(name) or event['key'] not in (None, key):
+        continue
+      if not event['player']:
+        m = event['regex'].match(response)
+      elif player is not None:
+        m = event['regex'].match(response, end)
+      else:
+        continue
       if m:
-        log_detail.debug('[%s] event [%s]: %s' % (self.__class__.__name__, event, m.groupdict()))
-        self.event.send(sender=self.__class__, event=event, data=m.groupdict())
-        found_event = True
-        break
+        return True
+    return False
+  
+  #==============================
+  def line_cost(self):
+    """Returns the average amount of seconds spent parsing a log line."""
+    
+    if not self.stats['lines']:
+      return 0.0
+    return self.stats['parse_time'] / self.stats['lines']
+  
+  #==============================
+  # Twisted event
+  def datagramReceived(self, data, address):
+    self.datagramsReceived([(data, address)])
+  
+  #==============================
+  def datagramsReceived(self, datagrams):
+    """Handles a batch of log lines, a list of (data, (host, port)). Every
+    line is parsed before the first is dispatched, and they are dispatched
+    in the order they arrived. A line that can't be parsed, or whose
+    handlers raise, is logged and skipped without affecting the others."""
     
+    # Nothing to parse if nobody wants either the events or the lines which
+    # aren't one.
+    unhandled = bool(self.unhandled_event.receivers)
+    parse = bool(self.interest) or unhandled
+    
+    lines = []
+    started = timer()
+    for data, (host, port) in datagrams:
+      server = None
+      if self.servers is not None:
+        server = self.servers.find(host, port)
+        if server is None:
+          log_detail.debug('[%s] log line from an unknown server %s:%s' % (self.__class__.__name__, host, port))
+          continue
+      
+      if not parse:
+        self.stats['skipped'] += 1
+        lines.append((server, data, None, None, None))
+        continue
+      
+      try:
+        #log L date - time: response
+        null, null, date, null, time, response = data[4:-2].split(' ', 5)
+        
+        event, m, player = self.match(response)
+        if m:
+          lines.append((server, data, response, event, self.events[event]['class'](m, player)))
+        elif unhandled and self.is_event(response):
+          # Known to the receiver, so not unhandled, but nobody wants it.
+          self.stats['ignored'] += 1
+          lines.append((server, data, None, None, None))
+        else:
+          lines.append((server, data, response, None, None))
+      except Exception:
+        self.stats['errors'] += 1
+        log.exception('[%s] could not parse the log line %r' % (self.__class__.__name__, data))
+    
+    if parse:
+      self.stats['parse_time'] += timer() - started
+      self.stats['lines'] += len(lines)
+    
+    for line in lines:
+      try:
+        self._dispatch(*line)
+      except Exception:
+        self.stats['errors'] += 1
+        log.exception('[%s] handling the log line %r failed' % (self.__class__.__name__, line[1]))
+  
+  #==============================
+  def _dispatch(self, server, data, response, event, event_data):
+    if self.data.receivers:
+      self.data.send_fast(sender=self.__class__, data=data, server=server)
+    
+    if event is not None:
+      self.stats['matched'] += 1
+      if log_detail.isEnabledFor(logging.DEBUG):
+        log_detail.debug('[%s] event [%s]: %s' % (self.__class__.__name__, event, event_data))
+      route = self.routes.get(event)
+      if route is not None:
+        route.send_fast(sender=self.__class__, event=event, data=event_data, server=server)
+      if self.event.receivers:
+        self.event.send_fast(sender=self.__class__, event=event, data=event_data, server=server)
     # If the event wasn't found, then fire the unhandled_event in case some plugin wants to handle it.
-    # Though, you could just use add_event instead.
-    if not found_event:
-      self.unhandled_event.send(sender=self.__class__, data=response)
-
+    # Though, you could just use add_event instead. The lines of events
+    # nobody is interested in have no response here, so they aren't sent.
+    elif response is not None:
+      self.stats['unhandled'] += 1
+      if self.unhandled_event.receivers:
+        self.unhandled_event.send_fast(sender=self.__class__, data=response, server=server)
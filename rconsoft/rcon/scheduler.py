@@ -0,0 +1,149 @@
+# Read LICENSE for licensing details.
+"""Decides which queued rcon command is sent next, and when.
+
+Commands wait in one of three lanes. The moderation lane (kicks and bans)
+always goes first, then the interactive lane (answers to chat commands,
+cvar reads), then the bulk lane (exec scripts and chat output). A token
+bucket limits how many packets per second leave so the hlds doesn't start
+dropping them."""
+
+import time
+from collections import deque
+
+PRIORITY_MODERATION = 0
+PRIORITY_INTERACTIVE = 1
+PRIORITY_BULK = 2
+
+LANE_NAMES = ['moderation', 'interactive', 'bulk']
+
+#------------------------------
+class TokenBucket(object):
+  """Allows rate tokens per second on average and bursts of up to burst
+  tokens."""
+
+  #==============================
+  def __init__(self, rate, burst):
+    self.rate = float(rate)
+    self.burst = float(burst)
+    self.tokens = self.burst
+    self.last = time.time()
+
+  #==============================
+  def _refill(self, now):
+    if now > self.last:
+      self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+    self.last = now
+
+  #==============================
+  def delay(self, now=None):
+    """Returns how many seconds until a token is available."""
+
+    if now is None:
+      now = time.time()
+    self._refill(now)
+    if self.tokens >= 1:
+      return 0
+    return (1 - self.tokens) / self.rate
+
+  #==============================
+  def consume(self, now=None):
+    """Takes a token. Returns False if there was none."""
+
+    if now is None:
+      now = time.time()
+    self._refill(now)
+    if self.tokens < 1:
+      return False
+    self.tokens -= 1
+    return True
+
+#------------------------------
+class Lane(object):
+  """A queue of commands of one priority, along with its counters."""
+
+  #==============================
+  def __init__(self, name, limit):
+    self.name = name
+    self.limit = limit
+    self.queue = deque()
+    self.stats = {
+      'queued': 0,
+      'sent': 0,
+      'dropped': 0,
+      'latency': 0.0, # Total seconds commands waited in this lane
+      'max_latency': 0.0
+    }
+
+#------------------------------
+class RconScheduler(object):
+  """Holds queued commands in priority lanes and hands them out highest
+  priority first, no faster than the token bucket allows.
+
+  rate - packets per second.
+  burst - packets that may be sent at once after being idle.
+  limits - the maximum queue length of each lane, indexed by priority.
+  """
+
+  #==============================
+  def __init__(self, rate=20, burst=10, limits=(64, 64, 128)):
+    self.bucket = TokenBucket(rate, burst)
+    self.lanes = [Lane(name, limit) for name, limit in zip(LANE_NAMES, limits)]
+
+  #==============================
+  def push(self, request, priority=PRIORITY_INTERACTIVE, front=False):
+    """Queues a request. Returns False, and drops it, if its lane is full.
+    A request pushed to the front (e.g. a retry) is never dropped."""
+
+    lane = self.lanes[priority]
+    if not front and len(lane.queue) >= lane.limit:
+      lane.stats['dropped'] += 1
+      return False
+
+    request.priority = priority
+    if front:
+      lane.queue.appendleft(request)
+    else:
+      request.queued_time = time.time()
+      lane.stats['queued'] += 1
+      lane.queue.append(request)
+    return True
+
+  #==============================
+  def delay(self, now=None):
+    """Returns how many seconds until the next request may be sent."""
+
+    return self.bucket.delay(now)
+
+  #==============================
+  def pop(self, now=None):
+    """Returns the next request to send, or None if there is none or the
+    rate limit has been reached."""
+
+    for lane in self.lanes:
+      if lane.queue:
+        break
+    else:
+      return None
+
+    if now is None:
+      now = time.time()
+    if not self.bucket.consume(now):
+      return None
+
+    request = lane.queue.popleft()
+    latency = now - request.queued_time
+    lane.stats['sent'] += 1
+    lane.stats['latency'] += latency
+    if latency > lane.stats['max_latency']:
+      lane.stats['max_latency'] = latency
+    return request
+
+  #==============================
+  def stats(self):
+    """Returns the counters of every lane, indexed by lane name."""
+
+    return dict((lane.name, dict(lane.stats, length=len(lane.queue))) for lane in self.lanes)
+
+  #==============================
+  def __len__(self):
+    return sum([len(lane.queue) for lane in self.lanes])
@@ -2,17 +2,31 @@
 
 import re
 
-from rconsoft import rcon_client, rcon_receiver
+from rconsoft import rcon_receiver
+from rconsoft.rcon.receiver import event
+from rconsoft.rcon.client import log_failure
 
 #------------------------------
 class RconTracker(object):
+  """Keeps the player list of a single server up to date."""
+  
+  # The TrackerRouter connected by the first tracker set up.
+  router = None
+  
   #==============================
-  def __init__(self):
+  def __init__(self, server):
+    self.server = server
     self.rcon_password_regex = re.compile(r'rcon_password "?(?P<password>[^"]*)"? *$')
     
   #==============================
   def setup(self):
-    rcon_receiver.event.connect(self.on_rcon_event)
+    """Starts tracking the players of the server. The tracker must be the
+    server's rcon_tracker to get its log events."""
+    
+    if RconTracker.router is None:
+      RconTracker.router = TrackerRouter()
+      rcon_receiver.connect_handlers(RconTracker.router)
+    rcon_client = self.server.rcon_client
     
     # Retrieve all the information we can from the server before
     # we start to track changes.
@@ -41,25 +55,49 @@ class RconTracker(object):
       
       for uniqueid in players:
         player = players[uniqueid]
-        rcon_client.user(player['uniqueid']).addCallback(got_user)
+        d = rcon_client.user(player['uniqueid']).addCallback(got_user)
+        d.addErrback(log_failure, 'looking up %s' % player['uniqueid'])
       
-    rcon_client.users().addCallback(got_users)
+    rcon_client.users().addCallback(got_users).addErrback(log_failure, 'listing the players')
   
   #==============================
-  def on_rcon_event(self, event, data, **kwargs):
-    if event == 'user_connected' or event == 'user_joined_team' or event == 'user_changed_name':
-      rcon_client.players.setdefault(data['uniqueid'], {}).update(data)
-     
-      # Get some extra info about this user.
-      rcon_client.user(data['uniqueid'])
-      
-    if event == 'user_disconnected':
-      del rcon_client.players[data['uniqueid']]
-      
-    elif event == 'server_cvar':
-      pass
-      
-    elif event == 'rcon_command':
-      m = self.rcon_password_regex.match(data['command'])
-      if m:
-        print 'Warning. Someone changed the password: %s' % m.groupdict()['password']
+  def on_user_changed(self, data):
+    rcon_client = self.server.rcon_client
+    rcon_client.players.setdefault(data['uniqueid'], {}).update(data)
+   
+    # Get some extra info about this user.
+    rcon_client.user(data['uniqueid']).addErrback(log_failure, 'looking up %s' % data['uniqueid'])
+  
+  #==============================
+  def on_user_disconnected(self, data):
+    del self.server.rcon_client.players[data['uniqueid']]
+  
+  #==============================
+  def on_rcon_command(self, data):
+    m = self.rcon_password_regex.match(data['command'])
+    if m:
+      print 'Warning. Someone changed the password: %s' % m.groupdict()['password']
+
+#------------------------------
+class TrackerRouter(object):
+  """Hands the log events the trackers need to the tracker of the server
+  they came from. Only one is connected to the receiver, so a log line
+  costs a single call however many servers there are."""
+  
+  #==============================
+  @event('user_connected', 'user_joined_team', 'user_changed_name')
+  def on_user_changed(self, event, data, server=None, **kwargs):
+    if server is not None and server.rcon_tracker is not None:
+      server.rcon_tracker.on_user_changed(data)
+  
+  #==============================
+  @event('user_disconnected')
+  def on_user_disconnected(self, event, data, server=None, **kwargs):
+    if server is not None and server.rcon_tracker is not None:
+      server.rcon_tracker.on_user_disconnected(data)
+  
+  #==============================
+  @event('rcon_command')
+  def on_rcon_command(self, event, data, server=None, **kwargs):
+    if server is not None and server.rcon_tracker is not None:
+      server.rcon_tracker.on_rcon_command(data)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# Read LICENSE for licensing details.
+"""Replays recorded log lines through the receive pipeline and measures it.
+
+The lines go through the real RconReceiver, Controller and plugins, as if
+the game server had sent them. Nothing is sent to a game server: the rcon
+commands the plugins send are counted and dropped.
+
+Two kinds of recordings can be replayed:
+  - an HL log file, e.g. logs/L1018000.log from the game server.
+  - a capture of the raw log datagrams, made with rconsoft --record.
+
+Example:
+  rconsoft-replay logs/L1018000.log
+  rconsoft-replay --speed 10 --plugins core,exe match.cap
+"""
+
+import time
+import struct
+import logging
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+from twisted.internet import reactor, defer
+
+import rconsoft
+import rconsoft.plugins
+from rconsoft.plugins import Plugin
+from rconsoft.command import ALL_COMMANDS, REMAINING_COMMANDS
+from rconsoft.rcon.client import HL1Network
+from rconsoft.rcon.tracker import RconTracker
+from rconsoft.dispatch.dispatcher import WEAKREF_TYPES
+from rconsoft.server import Server
+from rconsoft.controller import Controller
+from rconsoft import command_handler, rcon_client, rcon_receiver, servers
+
+log = logging.getLogger('general')
+
+# The header of a capture file, followed by records of the time the datagram
+# arrived (double), its length (unsigned int) and the datagram itself.
+CAPTURE_MAGIC = 'RSFTCAP1\n'
+CAPTURE_RECORD = struct.Struct('<dI')
+
+# The address the replayed log lines come from.
+REPLAY_ADDRESS = ('127.0.0.1', 27015)
+
+#------------------------------
+class Recorder(object):
+  """Writes every log datagram the receiver gets to a capture file. Connect
+  it to RconReceiver.data. The file is closed when the reactor shuts down,
+  so the last records aren't lost in its buffer."""
+
+  #==============================
+  def __init__(self, path):
+    self.fp = open(path, 'wb')
+    self.fp.write(CAPTURE_MAGIC)
+    reactor.addSystemEventTrigger('before', 'shutdown', self.close)
+
+  #==============================
+  def __call__(self, data, **kwargs):
+    # Lines may still arrive while the reactor shuts down.
+    if self.fp.closed:
+      return
+    self.fp.write(CAPTURE_RECORD.pack(time.time(), len(data)))
+    self.fp.write(data)
+
+  #==============================
+  def close(self):
+    """Flushes and closes the capture file. Later datagrams are dropped."""
+
+    if not self.fp.closed:
+      self.fp.flush()
+      self.fp.close()
+
+#==============================
+def log_response(data):
+  """Returns what follows the date of a log datagram, e.g. 'World triggered
+  "Round_Start"', or None if the datagram is too short to be a log line."""
+
+  parts = data[4:-2].split(' ', 5)
+  if len(parts) < 6:
+    return None
+  return parts[5]
+
+#==============================
+def read_capture(fp):
+  """Yields (time, datagram) for every record of a capture file."""
+
+  while True:
+    header = fp.read(CAPTURE_RECORD.size)
+    if len(header) < CAPTURE_RECORD.size:
+      return
+    arrived, length = CAPTURE_RECORD.unpack(header)
+    yield (arrived, fp.read(length))
+
+#==============================
+def read_log(fp):
+  """Yields (time, datagram) for every line of an HL log file. The lines are
+  wrapped the way the game server sends them."""
+
+  for line in fp:
+    line = line.rstrip('\r\n')
+    if not line.startswith('L '):
+      continue
+    try:
+      logged = time.mktime(time.strptime(line[2:23], '%m/%d/%Y - %H:%M:%S'))
+    except ValueError:
+      logged = None
+    yield (logged, '\xFF\xFF\xFF\xFFlog %s\n\x00' % line)
+
+#==============================
+def read_recording(path):
+  """Returns a list of (time, datagram) from a capture or an HL log file."""
+
+  fp = open(path, 'rb')
+  try:
+    if fp.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC:
+      return list(read_capture(fp))
+    fp.seek(0)
+    return list(read_log(fp))
+  finally:
+    fp.close()
+
+#------------------------------
+class ReplayNetwork(HL1Network):
+  """A network which counts the rcon commands sent to it instead of sending
+  them. Commands expecting a response get a deferred which never fires, as
+  if the server never answered."""
+
+  #==============================
+  def __init__(self):
+    HL1Network.__init__(self, REPLAY_ADDRESS[0], REPLAY_ADDRESS[1], '')
+    self.commands = 0
+
+  #==============================
+  def command(self, *args, **kwargs):
+    self.commands += 1
+    if kwargs.get('deferred', True):
+      return defer.Deferred()
+    return None
+
+#------------------------------
+class TimedReceiver(object):
+  """Stands in for a receiver connected to a signal and adds the time spent
+  in it to timings[name]."""
+
+  #==============================
+  def __init__(self, receiver, name, timings):
+    self.receiver = receiver
+    self.name = name
+    self.timings = timings
+
+  #==============================
+  def __call__(self, **named):
+    receiver = self.receiver
+    if isinstance(receiver, WEAKREF_TYPES):
+      receiver = receiver()
+      if receiver is None:
+        return None
+
+    started = timer()
+    try:
+      return receiver(**named)
+    finally:
+      entry = self.timings.setdefault(self.name, [0, 0.0])
+      entry[0] += 1
+      entry[1] += timer() - started
+
+#==============================
+def receiver_name(receiver):
+  """Returns a readable name for a receiver, e.g. 'CorePlugin.on_command'."""
+
+  if isinstance(receiver, WEAKREF_TYPES):
+    receiver = receiver()
+  if receiver is None:
+    return '(dead)'
+  if getattr(receiver, 'im_self', None) is not None:
+    return '%s.%s' % (receiver.im_self.__class__.__name__, receiver.im_func.__name__)
+
+  # Functions made by command.get_dispatcher are saved on their plugin.
+  for plugin in Plugin.plugins:
+    if getattr(plugin, '__dispatcher_function__', None) is receiver:
+      return '%s.%s' % (plugin.__class__.__name__, receiver.__name__)
+  return getattr(receiver, '__name__', repr(receiver))
+
+#==============================
+def instrument(signal, label, timings):
+  """Times every receiver connected to signal. The times are kept in
+  timings, indexed by '<label>: <receiver name>'."""
+
+  for key, receiver in signal.receivers.items():
+    signal.receivers[key] = TimedReceiver(receiver, '%s: %s' % (label, receiver_name(receiver)), timings)
+  signal.sender_receivers_cache.clear()
+
+#------------------------------
+class Replay(object):
+  """Sets up the receive pipeline without a network and feeds recorded
+  datagrams through it."""
+
+  #==============================
+  def __init__(self, plugins=None, all_events=False):
+    """plugins is a list of the plugin names to load, or None for the ones
+    in the config. If all_events is True, every event is parsed, even the
+    ones no handler is interested in."""
+
+    rconsoft.plugins.load_all(plugins)
+    Plugin.plugins = rconsoft.plugins.PluginList([p() for p in Plugin.plugins])
+
+    self.controller = Controller()
+    self.controller.setup_events()
+
+    self.network = ReplayNetwork()
+    self.server = servers.add(Server('replay', REPLAY_ADDRESS[0], REPLAY_ADDRESS[1], '',
+      rcon_client=rcon_client, network=self.network))
+    self.server.rcon_tracker = RconTracker(self.server)
+    self.server.rcon_tracker.setup()
+
+    if all_events:
+      rcon_receiver.add_interest()
+
+    # The datagrams parse_costs skipped, since they weren't log lines.
+    self.malformed = 0
+
+    self.handler_timings = {}
+    for name, route in rcon_receiver.routes.items():
+      instrument(route, name, self.handler_timings)
+    instrument(rcon_receiver.event, 'event', self.handler_timings)
+    instrument(rcon_receiver.unhandled_event, 'unhandled_event', self.handler_timings)
+    for name, route in command_handler.routes.items():
+      if name is ALL_COMMANDS:
+        name = '(all)'
+      elif name is REMAINING_COMMANDS:
+        name = '(remaining)'
+      instrument(route, 'command %s' % name, self.handler_timings)
+    instrument(command_handler.event, 'command', self.handler_timings)
+
+  #==============================
+  def parse_costs(self, datagrams):
+    """Parses every datagram without dispatching it. Returns a dictionary of
+    [count, seconds] indexed by event name, with the lines that aren't an
+    event under None. Datagrams which aren't log lines are skipped and
+    counted in self.malformed."""
+
+    costs = {}
+    for arrived, data in datagrams:
+      response = log_response(data)
+      if response is None:
+        self.malformed += 1
+        continue
+      started = timer()
+      event, m, player = rcon_receiver.match(response)
+      if m:
+        rcon_receiver.events[event]['class'](m, player)
+      elapsed = timer() - started
+
+      entry = costs.setdefault(event, [0, 0.0])
+      entry[0] += 1
+      entry[1] += elapsed
+    return costs
+
+  #==============================
+  def run(self, datagrams, batch=1):
+    """Feeds the datagrams through the receiver as fast as possible, batch
+    at a time. Returns the seconds it took."""
+
+    started = timer()
+    if batch <= 1:
+      for arrived, data in datagrams:
+        rcon_receiver.datagramReceived(data, REPLAY_ADDRESS)
+    else:
+      for index in xrange(0, len(datagrams), batch):
+        rcon_receiver.datagramsReceived([(data, REPLAY_ADDRESS) for arrived, data in datagrams[index:index + batch]])
+    return timer() - started
+
+  #==============================
+  def run_timed(self, datagrams, speed):
+    """Feeds the datagrams through the receiver from the reactor, speed times
+    faster than they were recorded. Returns the seconds it took."""
+
+    times = [arrived for arrived, data in datagrams if arrived is not None]
+    first = last = times and times[0] or 0
+
+    # Lines without a time are sent along with the line before them.
+    for arrived, data in datagrams:
+      if arrived is not None:
+        last = arrived
+      reactor.callLater(max(0, last - first) / speed, rcon_receiver.datagramReceived, data, REPLAY_ADDRESS)
+
+    started = timer()
+    reactor.callLater(max(0, last - first) / speed, reactor.stop)
+    reactor.run()
+    return timer() - started
+
+#==============================
+def _print_table(title, entries):
+  print
+  print '%-48s %10s %12s %10s' % (title, 'calls', 'total ms', 'avg us')
+  for name, (calls, seconds) in sorted(entries.items(), key=lambda item: -item[1][1]):
+    print '%-48s %10d %12.2f %10.2f' % (name, calls, seconds * 1000, seconds * 1000000 / max(1, calls))
+
+#==============================
+def main_func():
+  parser = OptionParser(usage='%prog [options] recording')
+  parser.add_option('-s', '--speed', type='float', dest='speed', default=0,
+    help='replays at this multiple of real time. 0 (the default) replays as fast as possible')
+  parser.add_option('-b', '--batch', type='int', dest='batch', default=1,
+    help='feeds this many lines at once, like the log port does during bursts')
+  parser.add_option('-p', '--plugins', dest='plugins', default=None,
+    help='a comma separated list of the plugins to load instead of the ones in the config')
+  parser.add_option('-a', '--all-events', action='store_true', dest='all_events', default=False,
+    help='parses every event, even the ones nobody handles')
+  parser.add_option('-r', '--repeat', type='int', dest='repeat', default=1,
+    help='replays the recording this many times')
+
+  (options, args) = parser.parse_args()
+  if len(args) != 1:
+    parser.error('a recording to replay is required')
+
+  datagrams = read_recording(args[0]) * max(1, options.repeat)
+  if not datagrams:
+    parser.error('no log lines found in %s' % args[0])
+
+  plugins = None
+  if options.plugins is not None:
+    plugins = [p.strip() for p in options.plugins.split(',') if p.strip()]
+
+  replay = Replay(plugins, options.all_events)
+
+  # Measure parsing on its own first so that the handlers don't skew it.
+  costs = replay.parse_costs(datagrams)
+
+  if options.speed > 0:
+    elapsed = replay.run_timed(datagrams, options.speed)
+  else:
+    elapsed = replay.run(datagrams, options.batch)
+
+  print 'Replayed %d lines in %.3f seconds: %.0f lines/sec' % (len(datagrams), elapsed, len(datagrams) / max(elapsed, 1e-9))
+  print 'Average parse cost: %.2f us/line, %d rcon commands sent by plugins' % (
+    rcon_receiver.line_cost() * 1000000, replay.network.commands)
+  if replay.malformed:
+    print 'Skipped %d datagrams which are not log lines' % replay.malformed
+
+  _print_table('Parse cost by event', dict(((k or '(no event)'), v) for k, v in costs.items()))
+  _print_table('Handler time (includes nested handlers)', replay.handler_timings)
+
+#==============================
+if __name__ == "__main__":
+  main_func()
@@ -0,0 +1,147 @@
+# Read LICENSE for licensing details.
+"""Keeps track of every game server RconSoft manages."""
+
+from rconsoft.rcon.client import HL1Network, RconClient
+
+#------------------------------
+class Server(object):
+  """Everything RconSoft knows about one game server: its network, its rcon
+  client, its tracker and the state plugins keep for it."""
+
+  #==============================
+  def __init__(self, name, host, port, password, rcon_client=None, network=None, **options):
+    """options are passed on to HL1Network (e.g. window, rate). A network
+    may be passed instead, e.g. one that doesn't send anything."""
+
+    self.name = name
+    self.host = host
+    self.port = port
+
+    self.network = network or HL1Network(host, port, password, **options)
+    self.rcon_client = rcon_client or RconClient()
+    self.rcon_client.set_network(self.network)
+    self.rcon_tracker = None
+
+    self.plugin_state = {}
+
+  #==============================
+  def address(self):
+    """Returns the (ip, port) the server sends from. The ip is only known
+    once the network has resolved the host."""
+
+    return (self.network.host, self.network.port)
+
+  #==============================
+  def state(self, plugin):
+    """Returns a dictionary a plugin can keep its state for this server in."""
+
+    return self.plugin_state.setdefault(plugin.__class__.__name__, {})
+
+  #==============================
+  def __repr__(self):
+    return '<Server %s %s:%s>' % (self.name, self.host, self.port)
+
+#------------------------------
+class ServerRegistry(object):
+  """A list of servers which can be looked up by name, by the address log
+  lines arrive from, or by their network. The first server added is the
+  default one."""
+
+  # The most source ips whose server is remembered. A flood of packets from
+  # random ips can't grow the cache beyond it.
+  MAX_HOSTS = 1024
+
+  #==============================
+  def __init__(self):
+    self.servers = []
+    self.names = {}
+    self.addresses = {} # Indexed by (ip, port)
+    self.hosts = {} # The server, or None, of ips not in addresses
+
+  #==============================
+  def add(self, server):
+    if server.name in self.names:
+      raise ValueError('Server already exists: %s' % server.name)
+
+    self.servers.append(server)
+    self.names[server.name] = server
+    server.network.resolved.connect(self.on_resolved)
+    self._index()
+    return server
+
+  #==============================
+  def on_resolved(self, network, **kwargs):
+    """Called when the host of a server is resolved, which changes its
+    address."""
+
+    self._index()
+
+  #==============================
+  def _index(self):
+    self.addresses = dict((s.address(), s) for s in self.servers)
+    self.hosts = {}
+
+  #==============================
+  def get(self, name):
+    """Returns the server with the name passed, or None."""
+
+    return self.names.get(name)
+
+  #==============================
+  def find(self, host, port):
+    """Returns the server that sent a packet from host:port, or None."""
+
+    server = self.addresses.get((host, port))
+    if server is not None:
+      return server
+    try:
+      return self.hosts[host]
+    except KeyError:
+      pass
+
+    # The log usually comes from another port than rcon. Match on the ip
+    # alone if it is unambiguous.
+    matches = [s for s in self.servers if s.network.host == host]
+    if len(matches) == 1:
+      server = matches[0]
+    # With only a single server, there is no one else it could be.
+    elif len(self.servers) == 1:
+      server = self.servers[0]
+
+    if len(self.hosts) >= self.MAX_HOSTS:
+      self.hosts = {}
+    self.hosts[host] = server
+    return server
+
+  #==============================
+  def find_network(self, network):
+    """Returns the server an HL1Network belongs to, or None."""
+
+    for server in self.servers:
+      if server.network is network:
+        return server
+    return None
+
+  #==============================
+  @property
+  def default(self):
+    if self.servers:
+      return self.servers[0]
+    return None
+
+  #==============================
+  def client(self, server=None):
+    """Returns the rcon client of the server passed, or of the default
+    server if None is passed."""
+
+    if server is None:
+      server = self.default
+    return server.rcon_client
+
+  #==============================
+  def __iter__(self):
+    return iter(self.servers)
+
+  #==============================
+  def __len__(self):
+    return len(self.servers)
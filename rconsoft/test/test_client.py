@@ -0,0 +1,271 @@
+# Read LICENSE for licensing details.
+
+import gc
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from rconsoft.rcon import client, flow, scheduler, reassembly
+from rconsoft.rcon.client import RconTimeout
+from rconsoft.rcon.scheduler import PRIORITY_MODERATION, PRIORITY_BULK
+from rconsoft.rcon.tracker import RconTracker
+from rconsoft.server import Server
+from rconsoft.test.test_reassembly import split
+from rconsoft.test.test_scheduler import ClockTime
+
+ADDRESS = ('127.0.0.1', 27015)
+
+#------------------------------
+class FakeTransport(object):
+  """Keeps the packets written instead of sending them."""
+  
+  #==============================
+  def __init__(self):
+    self.written = []
+  
+  #==============================
+  def write(self, data):
+    self.written.append(data)
+
+#------------------------------
+class NetworkTestCase(unittest.TestCase):
+  """Runs an HL1Network which got the challenge '1', on a fake clock."""
+  
+  #==============================
+  def setUp(self):
+    self.clock = task.Clock()
+    self.patch(client, 'reactor', self.clock)
+    for module in (client, flow, scheduler, reassembly):
+      self.patch(module, 'time', ClockTime(self.clock))
+    self.server = Server('test', ADDRESS[0], ADDRESS[1], 'password')
+    self.network = self.server.network
+    self.network.transport = FakeTransport()
+    self.receive('challenge rcon 1\n')
+  
+  #==============================
+  def receive(self, data):
+    self.network.datagramReceived('\xFF\xFF\xFF\xFF%s' % data, ADDRESS)
+  
+  #==============================
+  def sent(self):
+    """Returns the packets sent since the last call, without the header."""
+    
+    written = [data[4:-1] for data in self.network.transport.written]
+    self.network.transport.written = []
+    return written
+  
+  #==============================
+  def wait(self, seconds):
+    for i in xrange(int(seconds * 10)):
+      self.clock.advance(0.1)
+
+#------------------------------
+class ResponseTest(NetworkTestCase):
+  """Responses find their command by tag, or by content."""
+  
+  #==============================
+  def test_tags(self):
+    # The window starts at a single command in flight.
+    self.network.window.size = 2
+    first = self.network.command('users')
+    second = self.network.command('status')
+    self.assertEqual(self.sent(), [
+      'rcon 1 "password" users;echo rsft#1',
+      'rcon 1 "password" status;echo rsft#2'
+    ])
+    # The responses may arrive out of order.
+    self.receive('lstatus response\nrsft#2\n')
+    self.receive('lusers response\nrsft#1\n')
+    self.assertEqual(self.successResultOf(first), 'users response')
+    self.assertEqual(self.successResultOf(second), 'status response')
+    self.assertEqual(self.network.stats['matched_tag'], 2)
+  
+  #==============================
+  def test_untagged(self):
+    d = self.network.command('say "hi')
+    self.assertEqual(self.sent(), ['rcon 1 "password" say "hi'])
+    self.receive('lhi\n')
+    self.assertEqual(self.successResultOf(d), 'hi')
+    self.assertEqual(self.network.stats['matched_content'], 1)
+  
+  #==============================
+  def test_split(self):
+    d = self.network.command('cvarlist')
+    self.sent()
+    for packet in split('\xFF\xFF\xFF\xFFl%s\nrsft#1\n' % ('x' * 3000), 5, 3):
+      self.network.datagramReceived(packet, ADDRESS)
+    self.assertEqual(self.successResultOf(d), 'x' * 3000)
+  
+  #==============================
+  def test_unmatched(self):
+    self.receive('lrsft#7\n')
+    self.assertEqual(self.network.stats['unmatched'], 1)
+
+#------------------------------
+class BatchTest(NetworkTestCase):
+  """Fire-and-forget commands share packets."""
+  
+  #==============================
+  def setUp(self):
+    NetworkTestCase.setUp(self)
+    self.network.window.size = 8.0
+  
+  #==============================
+  def test_merged(self):
+    for text in ('a', 'b', 'c'):
+      self.network.command('say', text, deferred=False)
+    self.assertEqual(self.sent(), [])
+    self.clock.advance(0)
+    self.assertEqual(self.sent(), ['rcon 1 "password" say a;say b;say c;echo rsft#1'])
+    self.assertEqual(self.network.stats['batched'], 3)
+  
+  #==============================
+  def test_batch_size(self):
+    self.network.batch_size = 12
+    for text in ('a', 'b', 'c'):
+      self.network.command('say', text, deferred=False)
+    self.clock.advance(0)
+    self.assertEqual(self.sent(), [
+      'rcon 1 "password" say a;say b;echo rsft#1',
+      'rcon 1 "password" say c;echo rsft#2'
+    ])
+  
+  #==============================
+  def test_priorities(self):
+    self.network.command('say', 'a', deferred=False, priority=PRIORITY_BULK)
+    self.network.command('kick', '#1', deferred=False, priority=PRIORITY_MODERATION)
+    self.network.command('say', 'b', deferred=False, priority=PRIORITY_BULK)
+    self.clock.advance(0)
+    # Only neighbouring commands of the same priority share a packet, and
+    # moderation goes first.
+    self.assertEqual(self.sent(), [
+      'rcon 1 "password" kick #1;echo rsft#1',
+      'rcon 1 "password" say a;echo rsft#2',
+      'rcon 1 "password" say b;echo rsft#3'
+    ])
+  
+  #==============================
+  def test_unbalanced_quote(self):
+    self.network.command('say', 'a', deferred=False)
+    self.network.command('say', '"b', deferred=False)
+    self.network.command('say', 'c', deferred=False)
+    self.clock.advance(0)
+    self.assertEqual(self.sent(), [
+      'rcon 1 "password" say a;echo rsft#1',
+      'rcon 1 "password" say "b',
+      'rcon 1 "password" say c;echo rsft#2'
+    ])
+  
+  #==============================
+  def test_before_deferred(self):
+    self.network.command('say', 'a', deferred=False)
+    self.network.command('users')
+    self.assertEqual(self.sent(), [
+      'rcon 1 "password" say a;echo rsft#1',
+      'rcon 1 "password" users;echo rsft#2'
+    ])
+
+#------------------------------
+class WindowTest(NetworkTestCase):
+  """Commands beyond the send window wait for a response."""
+  
+  #==============================
+  def test_queued(self):
+    self.network.command('users')
+    self.network.command('status')
+    self.assertEqual(self.sent(), ['rcon 1 "password" users;echo rsft#1'])
+    self.assertEqual(len(self.network.scheduler), 1)
+    self.receive('lusers response\nrsft#1\n')
+    self.assertEqual(self.sent(), ['rcon 1 "password" status;echo rsft#2'])
+  
+  #==============================
+  def test_loss(self):
+    self.network.window.size = 4.0
+    self.network.command('users').addErrback(lambda failure: None)
+    self.clock.advance(self.network.window.rtt.rto())
+    self.assertEqual(self.network.window.limit(), 2)
+
+#------------------------------
+class ChallengeTest(NetworkTestCase):
+  """Commands rejected with a bad challenge are sent again with a new
+  one."""
+  
+  #==============================
+  def setUp(self):
+    NetworkTestCase.setUp(self)
+    self.network.window.size = 8.0
+  
+  #==============================
+  def test_bad_challenge(self):
+    users = self.network.command('users')
+    status = self.network.command('status')
+    self.sent()
+    # Every command in flight is rejected, but one challenge is enough.
+    self.receive('lBad challenge.\n')
+    self.receive('lBad challenge.\n')
+    self.assertEqual(self.sent(), ['challenge rcon'])
+    self.assertEqual(self.network.challenge_id, None)
+    self.assertEqual(len(self.network.pending), 0)
+    
+    self.receive('challenge rcon 2\n')
+    self.assertEqual(self.sent(), [
+      'rcon 2 "password" users;echo rsft#3',
+      'rcon 2 "password" status;echo rsft#4'
+    ])
+    self.receive('lusers response\nrsft#3\n')
+    self.receive('lstatus response\nrsft#4\n')
+    self.assertEqual(self.successResultOf(users), 'users response')
+    self.assertEqual(self.successResultOf(status), 'status response')
+  
+  #==============================
+  def test_older_challenge(self):
+    self.network.command('users').addErrback(lambda failure: None)
+    # The challenge is renewed while users is in flight.
+    self.receive('challenge rcon 2\n')
+    self.network.command('status').addErrback(lambda failure: None)
+    self.sent()
+    # It can't be told which command was rejected. Replaying users could
+    # run it twice, so nothing is replayed.
+    self.receive('lBad challenge.\n')
+    self.assertEqual(self.sent(), [])
+    self.assertEqual(self.network.challenge_id, '2')
+    self.assertEqual(len(self.network.pending), 2)
+  
+  #==============================
+  def test_backoff(self):
+    self.network.authenticate()
+    self.wait(1000)
+    self.assertEqual(self.sent(), ['challenge rcon'] * self.network.MAX_CHALLENGE_ATTEMPTS)
+    self.assertEqual(self.clock.getDelayedCalls(), [])
+  
+  #==============================
+  def test_answered(self):
+    self.network.authenticate()
+    self.receive('challenge rcon 2\n')
+    self.wait(100)
+    self.assertEqual(self.sent(), ['challenge rcon'])
+
+#------------------------------
+class TimeoutTest(NetworkTestCase):
+  """Commands the server never answers."""
+  
+  #==============================
+  def test_retries(self):
+    d = self.server.rcon_client.users()
+    self.wait(60)
+    self.failureResultOf(d, RconTimeout)
+    # Sent once and retried twice.
+    self.assertEqual(len(self.sent()), 3)
+    self.assertEqual(self.network.stats['timeouts'], 3)
+    self.assertEqual(len(self.network.pending), 0)
+  
+  #==============================
+  def test_nothing_unhandled(self):
+    self.server.rcon_tracker = RconTracker(self.server)
+    self.server.rcon_tracker.setup()
+    self.server.rcon_client.players['STEAM_0:1:1'] = {'uniqueid': 'STEAM_0:1:1', 'userid': '2'}
+    self.server.rcon_client.toggle_cvar('mp_friendlyfire')
+    self.wait(60)
+    self.assertEqual(self.network.stats['timeouts'], 6)
+    gc.collect()
+    self.assertEqual(self.flushLoggedErrors(), [])
@@ -0,0 +1,127 @@
+# Read LICENSE for licensing details.
+
+import threading
+
+from twisted.trial import unittest
+from twisted.internet import defer, task
+
+from rconsoft.command import CommandHandler, CommandInterrupt, ALL_COMMANDS, defer_to_thread
+
+#------------------------------
+class LimitTest(unittest.TestCase):
+  """The limits of a command and the handlers they run."""
+  
+  #==============================
+  def setUp(self):
+    self.handler = CommandHandler()
+    self.called = []
+    self.release = threading.Event()
+    self.slow = []
+  
+  #==============================
+  def tearDown(self):
+    self.release.set()
+  
+  #==============================
+  def on_broken(self, **kwargs):
+    raise ValueError('handler failed')
+  
+  #==============================
+  def on_interrupt(self, **kwargs):
+    raise CommandInterrupt()
+  
+  #==============================
+  def on_command(self, command, **kwargs):
+    self.called.append(command)
+  
+  #==============================
+  def on_slow(self, command, **kwargs):
+    self.called.append(command)
+    d = defer.Deferred()
+    self.slow.append(d)
+    return d
+  
+  #==============================
+  def on_blocking(self, command, **kwargs):
+    return defer_to_thread(self.release.wait, 5)
+  
+  #==============================
+  def test_handler_error(self):
+    self.handler.connect_command('test', self.on_broken)
+    self.handler.connect_command('test', self.on_command)
+    self.handler.process('test')
+    self.assertEqual(self.called, ['test'])
+  
+  #==============================
+  def test_interrupt(self):
+    self.handler.connect_command('test', self.on_interrupt)
+    self.handler.connect_command('test', self.on_command)
+    self.handler.connect_command(ALL_COMMANDS, self.on_command)
+    self.handler.process('test')
+    self.assertEqual(self.called, ['test'])
+  
+  #==============================
+  def test_observers(self):
+    self.handler.connect_command('test', self.on_slow)
+    self.handler.connect_command(ALL_COMMANDS, self.on_command)
+    self.handler.limit('test').configure(1, 0, 30)
+    self.handler.process('test')
+    self.handler.process('test')
+    self.assertEqual(self.called, ['test', 'test', 'test'])
+    self.assertEqual(self.handler.limit('test').stats['dropped'], 1)
+    for d in self.slow:
+      d.callback(None)
+  
+  #==============================
+  def test_direct(self):
+    self.handler.connect_command('test', self.on_command)
+    self.handler.process('test')
+    self.assertEqual(self.called, ['test'])
+    self.assertNotIn('test', self.handler.limits)
+  
+  #==============================
+  def test_adopt(self):
+    self.handler.connect_command('test', self.on_slow)
+    self.handler.limits.pop('test', None)
+    self.handler.process('test')
+    limit = self.handler.limits['test']
+    self.assertEqual(limit.running, 1)
+    self.handler.process('test')
+    self.assertEqual(limit.running, 2)
+    for d in self.slow:
+      d.callback(None)
+    self.assertEqual(limit.running, 0)
+    self.assertEqual(limit.stats['runs'], 2)
+  
+  #==============================
+  def test_coalesced(self):
+    self.handler.connect_command('test', self.on_slow)
+    self.handler.limit('test')
+    extra = {'uniqueid': 'STEAM_0:1:1'}
+    self.handler.process('test', extra=extra)
+    self.handler.process('test', extra=extra)
+    self.handler.process('test', extra={'uniqueid': 'STEAM_0:1:2'})
+    # The duplicate is dropped, not run after the first or given its result.
+    self.assertEqual(self.called, ['test', 'test'])
+    self.assertEqual(self.handler.limit('test').stats['coalesced'], 1)
+    for d in self.slow:
+      d.callback(None)
+    self.handler.process('test', extra=extra)
+    self.assertEqual(self.called, ['test', 'test', 'test'])
+    self.slow[-1].callback(None)
+  
+  #==============================
+  @defer.inlineCallbacks
+  def test_thread_deadline(self):
+    from twisted.internet import reactor
+    self.handler.connect_command('test', self.on_blocking)
+    limit = self.handler.limit('test')
+    limit.configure(1, 8, 0.05)
+    self.handler.process('test')
+    yield task.deferLater(reactor, 0.2, lambda: None)
+    self.assertEqual(limit.stats['expired'], 1)
+    self.assertEqual(limit.running, 1)
+    self.release.set()
+    while limit.running:
+      yield task.deferLater(reactor, 0.01, lambda: None)
+    self.assertEqual(limit.running, 0)
@@ -0,0 +1,216 @@
+# Read LICENSE for licensing details.
+
+from configobj import ConfigObj
+
+from twisted.trial import unittest
+
+from rconsoft import config as config_module
+from rconsoft.config import ConfigError, config_changed, reload_config, apply_config
+from rconsoft.config import rebuild_access, has_access, uniqueids_with_access
+from rconsoft.config import settings, load_settings, compile_settings, check_settings
+from rconsoft.controller import Controller
+
+#------------------------------
+class ReloadTest(unittest.TestCase):
+  """Reloading the config replaces it all at once, or not at all."""
+  
+  #==============================
+  def setUp(self):
+    self.original = config_module.config
+    self.changes = []
+    config_changed.connect(self.on_config_changed)
+    
+    # A copy of the config in a file of its own.
+    self.path = self.mktemp()
+    copy = ConfigObj(self.original.dict())
+    copy.filename = self.path
+    copy.write()
+    config_module.config = ConfigObj(self.path)
+  
+  #==============================
+  def tearDown(self):
+    config_changed.disconnect(self.on_config_changed)
+    # Puts back what the reload changed, e.g. the command limits.
+    apply_config(self.original)
+    config_module.config = self.original
+    config_module.load_settings()
+  
+  #==============================
+  def on_config_changed(self, paths, **kwargs):
+    self.changes.append(paths)
+  
+  #==============================
+  def write(self, change):
+    new = ConfigObj(self.path)
+    change(new)
+    new.write()
+  
+  #==============================
+  def test_reload(self):
+    old = config_module.config
+    #==============================
+    def change(new):
+      new['commands']['queue'] = '9'
+    self.write(change)
+    
+    d = reload_config()
+    #==============================
+    def reloaded(paths):
+      self.assertEqual(paths, [('commands', 'queue')])
+      self.assertEqual(self.changes, [paths])
+      self.assertEqual(config_module.cget('commands', 'queue'), '9')
+      # Whoever still holds the old config sees all of it.
+      self.assertIsNot(config_module.config, old)
+      self.assertEqual(old['commands']['queue'], '8')
+    return d.addCallback(reloaded)
+  
+  #==============================
+  def test_bad_reload(self):
+    old = config_module.config
+    #==============================
+    def change(new):
+      new['commands']['queue'] = '9'
+      new['users']['nobody'] = {'access': 'admin'}
+    self.write(change)
+    
+    d = self.assertFailure(reload_config(), ConfigError)
+    #==============================
+    def failed(error):
+      self.assertIs(config_module.config, old)
+      self.assertEqual(config_module.cget('commands', 'queue'), '8')
+      self.assertEqual(self.changes, [])
+    return d.addCallback(failed)
+  
+  #==============================
+  def test_unchanged(self):
+    self.assertEqual(apply_config(ConfigObj(self.path)), [])
+    self.assertEqual(self.changes, [])
+
+#------------------------------
+class AccessTest(unittest.TestCase):
+  """The access index gives each uniqueid the most access it is listed with."""
+  
+  #==============================
+  def setUp(self):
+    self.original = config_module.config
+    config_module.config = ConfigObj({'users': {
+      'master': {'access': 'master', 'uniqueid': 'STEAM_0:1:1'},
+      'admin': {'access': 'admin', 'uniqueid': 'STEAM_0:1:2'},
+      'user': {'access': 'user', 'uniqueid': 'STEAM_0:1:3'},
+      # Listed twice, with the most access last.
+      'twice': {'access': 'guest', 'uniqueid': 'STEAM_0:1:4'},
+      'twice_admin': {'access': 'admin', 'uniqueid': 'STEAM_0:1:4'},
+      'no_uniqueid': {'access': 'master'},
+      'bad_access': {'access': 'root', 'uniqueid': 'STEAM_0:1:5'},
+      'not_a_section': 'STEAM_0:1:6'
+    }})
+    rebuild_access()
+  
+  #==============================
+  def tearDown(self):
+    config_module.config = self.original
+    rebuild_access()
+  
+  #==============================
+  def test_has_access(self):
+    self.assertTrue(has_access('STEAM_0:1:1', 'master'))
+    self.assertTrue(has_access('STEAM_0:1:1', 'guest'))
+    self.assertFalse(has_access('STEAM_0:1:2', 'master'))
+    self.assertTrue(has_access('STEAM_0:1:2', 'admin'))
+    self.assertFalse(has_access('STEAM_0:1:3', 'admin'))
+    self.assertTrue(has_access('STEAM_0:1:3', 'user'))
+    self.assertTrue(has_access('STEAM_0:1:4', 'admin'))
+  
+  #==============================
+  def test_skipped(self):
+    for uniqueid in ['STEAM_0:1:5', 'STEAM_0:1:6', 'STEAM_0:1:7', None]:
+      self.assertFalse(has_access(uniqueid, 'guest'))
+  
+  #==============================
+  def test_uniqueids_with_access(self):
+    self.assertEqual(uniqueids_with_access('master'), frozenset(['STEAM_0:1:1']))
+    self.assertEqual(uniqueids_with_access('admin'), frozenset(['STEAM_0:1:1', 'STEAM_0:1:2', 'STEAM_0:1:4']))
+    self.assertEqual(uniqueids_with_access('guest'), frozenset(['STEAM_0:1:1', 'STEAM_0:1:2', 'STEAM_0:1:3', 'STEAM_0:1:4']))
+  
+  #==============================
+  def test_rebuild(self):
+    config_module.config['users']['admin']['access'] = 'guest'
+    self.assertTrue(has_access('STEAM_0:1:2', 'admin'))
+    rebuild_access()
+    self.assertFalse(has_access('STEAM_0:1:2', 'admin'))
+    self.assertFalse('STEAM_0:1:2' in uniqueids_with_access('user'))
+
+#------------------------------
+class SettingsTest(unittest.TestCase):
+  """The config is compiled into settings, and checked, before it is used."""
+  
+  #==============================
+  def setUp(self):
+    self.original = config_module.config
+  
+  #==============================
+  def tearDown(self):
+    config_module.config = self.original
+    load_settings()
+  
+  #==============================
+  def test_compile(self):
+    compiled = compile_settings({
+      'rcon': {'local': {'port': '27200'}},
+      'plugins': {'exec': {'lo3_delays': ['1', '2']}, 'ircbot': {'ignore_nicks': ['Bot', 'ChanServ'], 'ad': 'a\\x37'}}
+    })
+    self.assertEqual(compiled.rcon.local.port, 27200)
+    self.assertEqual(compiled.rcon.local.host, '')
+    self.assertEqual(compiled.plugins.exec_.lo3_delays, (1, 2))
+    self.assertEqual(compiled.plugins.ircbot.ignore_nicks, frozenset(['bot', 'chanserv']))
+    self.assertEqual(compiled.plugins.ircbot.ad, 'a7')
+    self.assertIdentical(compiled.game.hostname, None)
+    self.assertRaises(AttributeError, setattr, compiled.rcon, 'host', 'x')
+  
+  #==============================
+  def test_compile_errors(self):
+    for section, message in [
+      ({'rcon': {'local': {'port': 'abc'}}}, "[rcon] [[local]] port = 'abc'"),
+      ({'rcon': {'local': {'port': ['1', '2']}}}, '[rcon] [[local]] port'),
+      ({'rcon': 'local'}, '[rcon] should be a section')
+    ]:
+      e = self.assertRaises(ConfigError, compile_settings, section)
+      self.assertTrue(str(e).startswith(message), str(e))
+  
+  #==============================
+  def check(self, source):
+    check_settings(compile_settings(source), source)
+  
+  #==============================
+  def test_check(self):
+    self.check({'users': {'admin': {'access': 'admin', 'uniqueid': 'STEAM_0:1:2'}}})
+    self.check({'plugins': {'exec': {'lo3_messages': ['one'], 'lo3_delays': ['1', '2']}}})
+  
+  #==============================
+  def test_check_errors(self):
+    for source, message in [
+      ({'plugins': {'exec': {'lo3_messages': ['one', 'two'], 'lo3_delays': '1'}}}, '[plugins] [[exec]] lo3_delays'),
+      ({'users': 'admin'}, '[users] should be a section'),
+      ({'users': {'admin': 'STEAM_0:1:2'}}, '[users] admin should be a section'),
+      ({'users': {'admin': {'access': 'admin'}}}, '[users] [[admin]] has no uniqueid'),
+      ({'users': {'admin': {'access': 'root', 'uniqueid': 'STEAM_0:1:2'}}}, "[users] [[admin]] access = 'root'")
+    ]:
+      e = self.assertRaises(ConfigError, self.check, source)
+      self.assertTrue(str(e).startswith(message), str(e))
+  
+  #==============================
+  def test_load_initial(self):
+    config_module.config = ConfigObj({
+      'rcon': {'local': {'port': '27200'}},
+      'users': {'admin': {'access': 'root', 'uniqueid': 'STEAM_0:1:2'}}
+    })
+    self.assertRaises(ConfigError, load_settings)
+    # Importing the module doesn't fail; the defaults are used instead.
+    config_module._load_initial_settings()
+    self.assertEqual(settings.rcon.local.port, 27129)
+    self.assertFalse(has_access('STEAM_0:1:2', 'guest'))
+  
+  #==============================
+  def test_controller_setup(self):
+    config_module.config = ConfigObj({'plugins': {'exec': {'lo3_delays': 'x'}}})
+    self.assertRaises(ConfigError, Controller().setup)
@@ -0,0 +1,89 @@
+# Read LICENSE for licensing details.
+
+import re
+
+from twisted.trial import unittest
+
+from rconsoft.rcon.events import event_class
+from rconsoft.rcon.receiver import PLAYER, parse_player
+
+SAY = re.compile(r'say(_(?P<to>.*?))? "(?P<message>.*)"( \((?P<status>.*?)\))?')
+TRIGGERED = re.compile(r'^Team "(?P<team>.*?)" triggered "(?P<event>.*?)"')
+
+#==============================
+def say(response):
+  SayEvent = event_class('user_say', SAY, ('to', 'status'), PLAYER)
+  player, end = parse_player(response)
+  return SayEvent(SAY.match(response, end), player)
+
+#------------------------------
+class RecordTest(unittest.TestCase):
+  """The records read like the dictionaries events used to be."""
+
+  #==============================
+  def test_fields(self):
+    data = say('"Player<2><STEAM_0:1:1><CT>" say_team "hi" (dead)')
+    self.assertEqual(data.__class__.__name__, 'UserSayEvent')
+    self.assertEqual(data.event_type, 'user_say')
+    self.assertEqual(data.keys(), ['name', 'userid', 'uniqueid', 'team', 'to', 'message', 'status'])
+    self.assertEqual(data.groupdict(), {
+      'name': 'Player',
+      'userid': '2',
+      'uniqueid': 'STEAM_0:1:1',
+      'team': 'CT',
+      'to': 'team',
+      'message': 'hi',
+      'status': 'dead'
+    })
+
+  #==============================
+  def test_by_key(self):
+    data = say('"Player<2><BOT><CT>" say "hi"')
+    self.assertEqual(data['message'], 'hi')
+    self.assertEqual(data.get('uniqueid'), 'BOT')
+    self.assertEqual(data.get('ip', 'none'), 'none')
+    self.assertRaises(KeyError, lambda: data['ip'])
+    self.assertTrue('team' in data)
+    self.assertFalse('ip' in data)
+
+  #==============================
+  def test_slots(self):
+    data = say('"Player<2><BOT><CT>" say "hi"')
+    self.assertFalse(hasattr(data, '__dict__'))
+    self.assertRaises(AttributeError, setattr, data, 'extra', 1)
+
+  #==============================
+  def test_lazy(self):
+    data = say('"Player<2><STEAM_ID_LAN><CT>" say "hi"')
+    self.assertTrue('to' not in data.__class__.__slots__)
+    self.assertTrue('status' not in data.__class__.__slots__)
+    self.assertIdentical(data.to, None)
+    self.assertIdentical(data.status, None)
+    self.assertIdentical(data['status'], None)
+
+    data = say('"Player<2><STEAM_ID_LAN><CT>" say_team "hi" (dead)')
+    self.assertEqual(data.to, 'team')
+    self.assertEqual(data.get('status'), 'dead')
+
+  #==============================
+  def test_interned(self):
+    first = say('"A<2><STEAM_0:1:%d><CT>" say "hi"' % 1)
+    second = say('"B<3><STEAM_0:1:%d><CT>" say "hi"' % 1)
+    self.assertIdentical(first.uniqueid, second.uniqueid)
+    self.assertIdentical(first.team, second.team)
+
+    TeamTriggeredEvent = event_class('team_triggered', TRIGGERED)
+    first = TeamTriggeredEvent(TRIGGERED.match('Team "%s" triggered "Target_Bombed"' % 'TERRORIST'))
+    second = TeamTriggeredEvent(TRIGGERED.match('Team "%s" triggered "Target_Bombed"' % 'TERRORIST'))
+    self.assertIdentical(first.team, second.team)
+    self.assertIdentical(first.event, second.event)
+
+  #==============================
+  def test_no_player_field(self):
+    regex = re.compile(r'joined team "(?P<team>.*?)"')
+    JoinedEvent = event_class('user_joined_team', regex, (), ('name', 'userid', 'uniqueid', None))
+    response = '"Player<2><BOT><>" joined team "CT"'
+    player, end = parse_player(response)
+    data = JoinedEvent(regex.match(response, end), player)
+    self.assertEqual(data.keys(), ['name', 'userid', 'uniqueid', 'team'])
+    self.assertEqual(data.team, 'CT')
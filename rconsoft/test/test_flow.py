@@ -0,0 +1,97 @@
+# Read LICENSE for licensing details.
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from rconsoft.rcon.flow import RttEstimator, SendWindow
+
+#------------------------------
+class RttTest(unittest.TestCase):
+  """The retransmission timeout follows the round trip times."""
+  
+  #==============================
+  def test_initial(self):
+    self.assertEqual(RttEstimator().rto(), RttEstimator.INITIAL_RTO)
+  
+  #==============================
+  def test_sample(self):
+    rtt = RttEstimator()
+    rtt.sample(0.1)
+    self.assertAlmostEqual(rtt.srtt, 0.1)
+    self.assertAlmostEqual(rtt.rttvar, 0.05)
+    self.assertAlmostEqual(rtt.rto(), 0.3)
+    rtt.sample(0.3)
+    self.assertAlmostEqual(rtt.srtt, 0.125)
+    self.assertAlmostEqual(rtt.rttvar, 0.0875)
+    self.assertEqual(rtt.min_rtt, 0.1)
+  
+  #==============================
+  def test_bounds(self):
+    rtt = RttEstimator()
+    rtt.sample(0.001)
+    self.assertEqual(rtt.rto(), RttEstimator.MIN_RTO)
+    rtt = RttEstimator()
+    rtt.sample(60)
+    self.assertEqual(rtt.rto(), RttEstimator.MAX_RTO)
+
+#------------------------------
+class SendWindowTest(unittest.TestCase):
+  """The window grows while round trips stay fast and shrinks when they
+  don't."""
+  
+  #==============================
+  def setUp(self):
+    self.clock = task.Clock()
+    self.window = SendWindow(8)
+  
+  #==============================
+  def test_grow(self):
+    self.assertEqual(self.window.limit(), 1)
+    for i in xrange(100):
+      self.window.ack(0.05)
+    self.assertEqual(self.window.limit(), 8)
+  
+  #==============================
+  def test_shrink(self):
+    for i in xrange(100):
+      self.window.ack(0.05)
+    # The server is queueing our commands.
+    for i in xrange(10):
+      self.window.ack(0.5)
+    self.assertTrue(self.window.limit() < 8)
+    for i in xrange(100):
+      self.window.ack(0.5)
+    self.assertEqual(self.window.limit(), 1)
+  
+  #==============================
+  def test_jitter(self):
+    # On a fast link, a few milliseconds more isn't queueing.
+    self.window.ack(0.001)
+    for i in xrange(100):
+      self.window.ack(0.004)
+    self.assertEqual(self.window.limit(), 8)
+  
+  #==============================
+  def test_ambiguous(self):
+    self.window.ack(None)
+    self.assertEqual(self.window.rtt.srtt, None)
+    self.assertEqual(self.window.size, 1.0)
+  
+  #==============================
+  def test_loss(self):
+    self.window.size = 8.0
+    self.window.loss()
+    self.assertEqual(self.window.limit(), 4)
+    for i in xrange(5):
+      self.window.loss()
+    self.assertEqual(self.window.limit(), 1)
+  
+  #==============================
+  def test_pace(self):
+    self.assertEqual(self.window.delay(self.clock.seconds()), 0)
+    self.window.size = 4.0
+    self.window.rtt.sample(0.2)
+    self.window.sent(self.clock.seconds())
+    self.assertAlmostEqual(self.window.delay(self.clock.seconds()), 0.05)
+    self.clock.advance(0.05)
+    self.assertAlmostEqual(self.window.delay(self.clock.seconds()), 0)
@@ -0,0 +1,105 @@
+# Read LICENSE for licensing details.
+
+import re
+
+from twisted.trial import unittest
+
+from rconsoft.rcon.receiver import RconReceiver, parse_player
+
+# The regexes the player events were matched with before parse_player, whose
+# results the records must still give.
+OLD_REGEXES = {
+  'user_connected': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" connected, address "(?P<ip>.*?):(?P<port>.*?)"',
+  'user_disconnected': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" disconnected',
+  'user_validated': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" STEAM USERID validated',
+  'user_entered': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" entered the game',
+  'user_joined_team': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><.*?>" joined team "(?P<team>.*?)"',
+  'user_say': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" say(_(?P<to>.*?))? "(?P<message>.*)"( \((?P<status>.*?)\))?',
+  'user_changed_name': r'^"(?P<old_name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><.*?>" changed name to "(?P<name>.*?)"',
+  'user_triggered': r'^"(?P<name>.*?)<(?P<userid>\d+)><(?P<uniqueid>.*?)><(?P<team>.*?)>" triggered "(?P<event>.*?)"'
+}
+
+# Names which are hard to tell apart from the rest of the player prefix.
+NAMES = [
+  'Player',
+  '<<Bob>>',
+  'a<b',
+  'x>y',
+  '"quoted"',
+  'x>" y',
+  ''
+]
+
+UNIQUEIDS = ['STEAM_0:1:1', 'BOT', 'STEAM_ID_LAN', 'VALVE_ID_PENDING']
+
+#==============================
+def lines(name, uniqueid):
+  player = '"%s<12><%s><CT>"' % (name, uniqueid)
+  return [
+    ('user_connected', '%s connected, address "10.0.0.1:27005"' % player),
+    ('user_disconnected', '%s disconnected' % player),
+    ('user_validated', '%s STEAM USERID validated' % player),
+    ('user_entered', '"%s<12><%s><>" entered the game' % (name, uniqueid)),
+    ('user_joined_team', '"%s<12><%s><>" joined team "TERRORIST"' % (name, uniqueid)),
+    ('user_say', '%s say "hi <there>"' % player),
+    ('user_say', '%s say_team "go" (dead)' % player),
+    ('user_changed_name', '%s changed name to "new"' % player),
+    ('user_triggered', '%s triggered "Planted_The_Bomb"' % player)
+  ]
+
+#------------------------------
+class ParsePlayerTest(unittest.TestCase):
+  """parse_player splits the player prefix off a log line."""
+
+  #==============================
+  def test_names(self):
+    for name in NAMES:
+      for uniqueid in UNIQUEIDS:
+        response = '"%s<12><%s><CT>" say "hi"' % (name, uniqueid)
+        player, end = parse_player(response)
+        self.assertEqual(player, (name, '12', uniqueid, 'CT'))
+        self.assertEqual(response[end:], 'say "hi"')
+
+  #==============================
+  def test_userid_in_name(self):
+    # The old regexes took the first <userid> for the end of the name.
+    player, end = parse_player('">" <1><<12><BOT><CT>" say "hi"')
+    self.assertEqual(player, ('>" <1><', '12', 'BOT', 'CT'))
+
+  #==============================
+  def test_no_team(self):
+    player, end = parse_player('"Player<3><BOT><>" entered the game')
+    self.assertEqual(player, ('Player', '3', 'BOT', ''))
+
+  #==============================
+  def test_not_a_player(self):
+    for response in [
+      'World triggered "Round_Start"',
+      'Server say "hi"',
+      '"Player<x><BOT><CT>" entered the game',
+      '"Player<3><BOT>" entered the game',
+      '"Player" entered the game',
+      '"'
+    ]:
+      self.assertIdentical(parse_player(response), None)
+
+#------------------------------
+class OldRegexTest(unittest.TestCase):
+  """The records of the player events have the fields the regexes they
+  replaced gave, whatever is in the name."""
+
+  #==============================
+  def setUp(self):
+    self.receiver = RconReceiver()
+    self.receiver.add_interest()
+
+  #==============================
+  def test_fields(self):
+    for name in NAMES:
+      for uniqueid in UNIQUEIDS:
+        for event, response in lines(name, uniqueid):
+          expected = re.match(OLD_REGEXES[event], response).groupdict()
+          matched, m, player = self.receiver.match(response)
+          self.assertEqual(matched, event, response)
+          record = self.receiver.events[matched]['class'](m, player)
+          self.assertEqual(record.groupdict(), expected, response)
@@ -0,0 +1,100 @@
+# Read LICENSE for licensing details.
+
+import re
+
+from twisted.trial import unittest
+
+from rconsoft.rcon.pending import PendingRequest, PendingTable, can_tag, split_tag
+
+#------------------------------
+class TagTest(unittest.TestCase):
+  """Tagging commands and finding the tag in their response."""
+  
+  #==============================
+  def test_can_tag(self):
+    self.assertTrue(can_tag('users'))
+    self.assertTrue(can_tag('say "hi"'))
+    self.assertFalse(can_tag('say "hi'))
+  
+  #==============================
+  def test_split_tag(self):
+    self.assertEqual(split_tag('"sv_restart" is "0"\nrsft#12\n'), ('"sv_restart" is "0"', 12))
+    self.assertEqual(split_tag('rsft#3'), ('', 3))
+    self.assertEqual(split_tag('"sv_restart" is "0"'), ('"sv_restart" is "0"', None))
+  
+  #==============================
+  def test_tag_in_the_middle(self):
+    # Only a tag on the last line counts.
+    response = 'rsft#4\nsomething else'
+    self.assertEqual(split_tag(response), (response, None))
+
+#------------------------------
+class PendingTableTest(unittest.TestCase):
+  """Matching responses to the requests waiting on them."""
+  
+  #==============================
+  def setUp(self):
+    self.table = PendingTable()
+  
+  #==============================
+  def test_tagged(self):
+    first = self.table.add(PendingRequest('users'))
+    second = self.table.add(PendingRequest('status'))
+    self.assertEqual((first.tag, second.tag), (1, 2))
+    self.assertIs(self.table.pop_tag(2), second)
+    self.assertIs(self.table.pop_tag(2), None)
+    self.assertEqual(len(self.table), 1)
+  
+  #==============================
+  def test_match(self):
+    plain = self.table.add(PendingRequest('say "hi'), tag=False)
+    cvar = self.table.add(PendingRequest('sv_restart', match=re.compile('^"sv_restart"')), tag=False)
+    # The request whose matcher matches goes first, even if it is newer.
+    self.assertIs(self.table.pop_match('"sv_restart" is "0"'), cvar)
+    self.assertIs(self.table.pop_match('"sv_restart" is "0"'), plain)
+    self.assertIs(self.table.pop_match('"sv_restart" is "0"'), None)
+  
+  #==============================
+  def test_match_function(self):
+    request = self.table.add(PendingRequest('users', match=lambda response: 'userid' in response), tag=False)
+    self.assertIs(self.table.pop_match('nothing'), None)
+    self.assertIs(self.table.pop_match('userid : uniqueid'), request)
+  
+  #==============================
+  def test_fallback(self):
+    # Untagged requests without a matcher get responses in the order they
+    # were sent.
+    first = self.table.add(PendingRequest('say "a'), tag=False)
+    second = self.table.add(PendingRequest('say "b'), tag=False)
+    self.table.add(PendingRequest('sv_restart', match=re.compile('^"sv_restart"')), tag=False)
+    self.assertIs(self.table.pop_match('anything'), first)
+    self.assertIs(self.table.pop_match('anything'), second)
+    self.assertIs(self.table.pop_match('anything'), None)
+    self.assertEqual(len(self.table), 1)
+  
+  #==============================
+  def test_remove(self):
+    tagged = self.table.add(PendingRequest('users'))
+    untagged = self.table.add(PendingRequest('say "hi'), tag=False)
+    self.table.remove(tagged)
+    self.table.remove(untagged)
+    self.table.remove(untagged)
+    self.assertEqual(len(self.table), 0)
+  
+  #==============================
+  def test_challenge(self):
+    old = PendingRequest('users')
+    old.challenge, old.sent_time = '1', 1.0
+    first = PendingRequest('say "a')
+    first.challenge, first.sent_time = '2', 3.0
+    second = PendingRequest('status')
+    second.challenge, second.sent_time = '2', 2.0
+    self.table.add(old)
+    self.table.add(first, tag=False)
+    self.table.add(second)
+    self.assertTrue(self.table.sent_with_other('2'))
+    # In the order they were sent, tagged or not.
+    self.assertEqual(self.table.pop_challenge('2'), [second, first])
+    self.assertFalse(self.table.sent_with_other('1'))
+    self.assertEqual(self.table.pop_challenge('2'), [])
+    self.assertEqual(len(self.table), 1)
@@ -0,0 +1,117 @@
+# Read LICENSE for licensing details.
+
+import struct
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from rconsoft.rcon.reassembly import SplitPacketReassembler, SPLIT_HEADER
+
+#==============================
+def split(data, sequence, count):
+  """Splits data into the count packets the hlds would send."""
+  
+  size = -(-len(data) // count)
+  return [SPLIT_HEADER + struct.pack('<i', sequence) + chr(index << 4 | count) + data[index * size:(index + 1) * size]
+    for index in xrange(count)]
+
+#------------------------------
+class ReassemblyTest(unittest.TestCase):
+  """Split responses are put back together, and lost ones are thrown
+  away."""
+  
+  #==============================
+  def setUp(self):
+    self.clock = task.Clock()
+    self.reassembler = SplitPacketReassembler(timeout=5.0, max_pending=2)
+  
+  #==============================
+  def add(self, data):
+    return self.reassembler.add(data, self.clock.seconds())
+  
+  #==============================
+  def test_in_order(self):
+    packets = split('\xFF\xFF\xFF\xFFl' + 'x' * 3000, 1, 3)
+    self.assertEqual(self.add(packets[0]), None)
+    self.assertEqual(self.add(packets[1]), None)
+    self.assertEqual(self.add(packets[2]), '\xFF\xFF\xFF\xFFl' + 'x' * 3000)
+    self.assertEqual(len(self.reassembler), 0)
+    self.assertEqual(self.reassembler.stats['completed'], 1)
+  
+  #==============================
+  def test_out_of_order(self):
+    packets = split('abcdefghij', 1, 3)
+    self.assertEqual(self.add(packets[2]), None)
+    self.assertEqual(self.add(packets[0]), None)
+    self.assertEqual(self.add(packets[1]), 'abcdefghij')
+  
+  #==============================
+  def test_interleaved(self):
+    first = split('first response', 1, 2)
+    second = split('second response', 2, 2)
+    self.assertEqual(self.add(first[0]), None)
+    self.assertEqual(self.add(second[1]), None)
+    self.assertEqual(self.add(second[0]), 'second response')
+    self.assertEqual(self.add(first[1]), 'first response')
+  
+  #==============================
+  def test_duplicate(self):
+    packets = split('abcdef', 1, 2)
+    self.add(packets[0])
+    self.assertEqual(self.add(packets[0]), None)
+    self.assertEqual(self.reassembler.stats['duplicates'], 1)
+    self.assertEqual(self.add(packets[1]), 'abcdef')
+  
+  #==============================
+  def test_invalid(self):
+    self.assertEqual(self.add(SPLIT_HEADER), None)
+    self.assertEqual(self.add('\xFF\xFF\xFF\xFFlnot split'), None)
+    # Index 2 of 2 pieces.
+    self.assertEqual(self.add(SPLIT_HEADER + struct.pack('<i', 1) + chr(2 << 4 | 2) + 'x'), None)
+    self.assertEqual(self.reassembler.stats['invalid'], 3)
+    self.assertEqual(len(self.reassembler), 0)
+  
+  #==============================
+  def test_timeout(self):
+    lost = split('lost response', 1, 2)
+    self.add(lost[0])
+    self.clock.advance(6)
+    # Starting another response throws away the ones that timed out.
+    self.add(split('next response', 2, 2)[0])
+    self.assertEqual(self.reassembler.stats['expired'], 1)
+    self.assertEqual(self.add(lost[1]), None)
+    self.assertEqual(len(self.reassembler), 2)
+  
+  #==============================
+  def test_expire(self):
+    self.add(split('lost response', 1, 2)[0])
+    self.clock.advance(4)
+    self.reassembler.expire(self.clock.seconds())
+    self.assertEqual(len(self.reassembler), 1)
+    self.clock.advance(2)
+    self.reassembler.expire(self.clock.seconds())
+    self.assertEqual(len(self.reassembler), 0)
+  
+  #==============================
+  def test_eviction(self):
+    oldest = split('oldest', 1, 2)
+    self.add(oldest[0])
+    self.clock.advance(1)
+    self.add(split('middle', 2, 2)[0])
+    self.clock.advance(1)
+    newest = split('newest', 3, 2)
+    self.add(newest[0])
+    # Only max_pending responses are kept. The oldest makes room.
+    self.assertEqual(len(self.reassembler), 2)
+    self.assertEqual(self.reassembler.stats['expired'], 1)
+    self.assertEqual(self.add(oldest[1]), None)
+    self.assertEqual(self.add(newest[1]), 'newest')
+  
+  #==============================
+  def test_count_changed(self):
+    # A sequence id reused with another packet count starts over.
+    self.add(split('abcdef', 1, 2)[0])
+    packets = split('abcdefghi', 1, 3)
+    self.assertEqual(self.add(packets[0]), None)
+    self.assertEqual(self.add(packets[1]), None)
+    self.assertEqual(self.add(packets[2]), 'abcdefghi')
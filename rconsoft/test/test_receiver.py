@@ -0,0 +1,142 @@
+# Read LICENSE for licensing details.
+
+from twisted.trial import unittest
+
+from rconsoft.rcon.receiver import RconReceiver
+
+ADDRESS = ('127.0.0.1', 27015)
+
+#==============================
+def log_line(response):
+  return '\xFF\xFF\xFF\xFFlog L 10/18/2026 - 12:00:00: %s\n\x00' % response
+
+#------------------------------
+class BatchTest(unittest.TestCase):
+  """A bad line in a batch of log lines only loses that line."""
+
+  #==============================
+  def setUp(self):
+    self.receiver = RconReceiver()
+    self.said = []
+    self.receiver.connect_event('server_say', self.on_server_say)
+
+  #==============================
+  def on_server_say(self, event, data, **kwargs):
+    if data.message == 'raise':
+      raise ValueError('handler failed')
+    self.said.append(data.message)
+
+  #==============================
+  def test_junk_datagram(self):
+    self.receiver.datagramsReceived([
+      (log_line('Server say "first"'), ADDRESS),
+      ('\xFF\xFF\xFF\xFFjunk', ADDRESS),
+      (log_line('Server say "second"'), ADDRESS)
+    ])
+    self.assertEqual(self.said, ['first', 'second'])
+    self.assertEqual(self.receiver.stats['errors'], 1)
+
+  #==============================
+  def test_handler_error(self):
+    self.receiver.datagramsReceived([
+      (log_line('Server say "raise"'), ADDRESS),
+      (log_line('Server say "after"'), ADDRESS)
+    ])
+    self.assertEqual(self.said, ['after'])
+    self.assertEqual(self.receiver.stats['errors'], 1)
+
+#------------------------------
+class ClassifyTest(unittest.TestCase):
+  """Lines are only tried against the events of their key."""
+
+  #==============================
+  def setUp(self):
+    self.receiver = RconReceiver()
+
+  #==============================
+  def test_keys(self):
+    classify = self.receiver.classify
+    self.assertEqual(classify('"Player<2><BOT><CT>" say_team "hi"')[0], '" say')
+    self.assertEqual(classify('"a<b<2><STEAM_ID_LAN><>" connected, address "1.2.3.4:5"')[0], '" connected')
+    self.assertEqual(classify('"x>" y<2><STEAM_0:1:1><CT>" say "hi"')[0], '" say')
+    self.assertEqual(classify('World triggered "Round_Start"'), ('World', None, 0))
+    self.assertEqual(classify('Loading'), ('Loading', None, 0))
+
+  #==============================
+  def test_match(self):
+    self.receiver.add_interest()
+    for response, expected in [
+      ('"Player<2><BOT><CT>" say_team "hi"', 'user_say'),
+      ('"Player<2><BOT><CT>" triggered "Planted_The_Bomb"', 'user_triggered'),
+      ('"Player<2><BOT><CT>" changed name to "other"', 'user_changed_name'),
+      ('Team "CT" triggered "CTs_Win" (CT "1") (T "0")', 'team_triggered'),
+      ('Team "CT" scored "1" with "5" players', 'team_scored'),
+      ('Server cvar "mp_timelimit" = "20"', 'server_cvar'),
+      ('Server say "hi"', 'server_say'),
+      ('"Player<2><BOT><CT>" dropped "hegrenade"', None),
+      ('Started map "de_dust2"', None)
+    ]:
+      self.assertEqual(self.receiver.match(response)[0], expected, response)
+    # Only the events of the key were tried: both Team and both Server
+    # events share a key, and the unknown lines tried none.
+    self.assertEqual(self.receiver.stats['regex_tries'], 9)
+
+  #==============================
+  def test_keyless(self):
+    self.receiver.add_event('user_dropped', r'^"(?P<name>.*?)<.*" dropped "(?P<item>.*?)"')
+    self.receiver.add_interest()
+    self.assertEqual(self.receiver.match('"Player<2><BOT><CT>" dropped "ak47"')[0], 'user_dropped')
+    self.assertEqual(self.receiver.match('Server say "hi"')[0], 'server_say')
+    self.assertEqual(self.receiver.match('Started map "de_dust2"')[0], None)
+
+  #==============================
+  def test_interest(self):
+    self.receiver.add_interest('user_say')
+    self.assertEqual(self.receiver.match('"Player<2><BOT><CT>" say "hi"')[0], 'user_say')
+    self.assertEqual(self.receiver.match('Server say "hi"')[0], None)
+    self.assertEqual(self.receiver.stats['regex_tries'], 1)
+
+    self.receiver.remove_interest('user_say')
+    self.assertEqual(self.receiver.match('"Player<2><BOT><CT>" say "hi"')[0], None)
+
+#------------------------------
+class UnhandledTest(unittest.TestCase):
+  """Only lines which aren't an event go to unhandled_event."""
+
+  #==============================
+  def setUp(self):
+    self.receiver = RconReceiver()
+    self.said = []
+    self.unhandled = []
+    self.receiver.connect_event('server_say', self.on_server_say)
+    self.receiver.unhandled_event.connect(self.on_unhandled_event)
+
+  #==============================
+  def on_server_say(self, event, data, **kwargs):
+    self.said.append(data.message)
+
+  #==============================
+  def on_unhandled_event(self, data, **kwargs):
+    self.unhandled.append(data)
+
+  #==============================
+  def test_unhandled(self):
+    self.receiver.datagramsReceived([
+      (log_line('Server say "hi"'), ADDRESS),
+      (log_line('World triggered "Round_Start"'), ADDRESS),
+      (log_line('"Player<2><BOT><CT>" say "hi"'), ADDRESS),
+      (log_line('Started map "de_dust2"'), ADDRESS),
+      (log_line('"Player<2><BOT><CT>" dropped "ak47"'), ADDRESS)
+    ])
+    self.assertEqual(self.said, ['hi'])
+    self.assertEqual(self.unhandled, ['Started map "de_dust2"', '"Player<2><BOT><CT>" dropped "ak47"'])
+    self.assertEqual(self.receiver.stats['ignored'], 2)
+    self.assertEqual(self.receiver.stats['unhandled'], 2)
+
+  #==============================
+  def test_is_event(self):
+    self.assertTrue(self.receiver.is_event('World triggered "Round_Start"'))
+    self.assertTrue(self.receiver.is_event('"a<b<2><STEAM_ID_LAN><>" entered the game'))
+    self.assertFalse(self.receiver.is_event('Started map "de_dust2"'))
+    # Events somebody is interested in are left to match.
+    self.assertFalse(self.receiver.is_event('Server say "hi"'))
@@ -0,0 +1,64 @@
+# Read LICENSE for licensing details.
+
+from twisted.trial import unittest
+
+from rconsoft import replay
+from rconsoft.replay import Recorder, log_response, read_recording
+
+LINE = '\xFF\xFF\xFF\xFFlog L 10/18/2026 - 12:00:00: World triggered "Round_Start"\n\x00'
+
+#------------------------------
+class FakeReactor(object):
+  #==============================
+  def __init__(self):
+    self.triggers = []
+  
+  #==============================
+  def addSystemEventTrigger(self, phase, event, f, *args, **kwargs):
+    self.triggers.append((phase, event, f))
+  
+  #==============================
+  def shutdown(self):
+    for phase, event, f in self.triggers:
+      if (phase, event) == ('before', 'shutdown'):
+        f()
+
+#------------------------------
+class RecorderTest(unittest.TestCase):
+  """The capture is complete once the reactor shuts down."""
+  
+  #==============================
+  def setUp(self):
+    self.reactor = FakeReactor()
+    self.patch(replay, 'reactor', self.reactor)
+    self.path = self.mktemp()
+  
+  #==============================
+  def test_shutdown(self):
+    recorder = Recorder(self.path)
+    recorder(data=LINE)
+    recorder(data='\xFF\xFF\xFF\xFFjunk')
+    self.reactor.shutdown()
+    self.assertTrue(recorder.fp.closed)
+    self.assertEqual([data for arrived, data in read_recording(self.path)], [LINE, '\xFF\xFF\xFF\xFFjunk'])
+  
+  #==============================
+  def test_after_close(self):
+    recorder = Recorder(self.path)
+    recorder(data=LINE)
+    recorder.close()
+    recorder(data=LINE)
+    # The shutdown trigger finds it closed already.
+    self.reactor.shutdown()
+    self.assertEqual(len(read_recording(self.path)), 1)
+
+#------------------------------
+class LogResponseTest(unittest.TestCase):
+  #==============================
+  def test_log_line(self):
+    self.assertEqual(log_response(LINE), 'World triggered "Round_Start"')
+  
+  #==============================
+  def test_short(self):
+    for data in ['', '\xFF\xFF\xFF\xFFjunk', '\xFF\xFF\xFF\xFFlog L 10/18/2026 - 12:00:00:\n\x00']:
+      self.assertIdentical(log_response(data), None)
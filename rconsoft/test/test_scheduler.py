@@ -0,0 +1,123 @@
+# Read LICENSE for licensing details.
+
+from twisted.trial import unittest
+from twisted.internet import task
+
+from rconsoft.rcon import scheduler
+from rconsoft.rcon.scheduler import TokenBucket, RconScheduler
+from rconsoft.rcon.scheduler import PRIORITY_MODERATION, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from rconsoft.rcon.pending import PendingRequest
+
+#------------------------------
+class ClockTime(object):
+  """Stands in for the time module, telling the time of a Clock."""
+  
+  #==============================
+  def __init__(self, clock):
+    self.time = clock.seconds
+
+#------------------------------
+class TokenBucketTest(unittest.TestCase):
+  """The token bucket allows bursts, then rate tokens per second."""
+  
+  #==============================
+  def setUp(self):
+    self.clock = task.Clock()
+    self.patch(scheduler, 'time', ClockTime(self.clock))
+    self.bucket = TokenBucket(10, 3)
+  
+  #==============================
+  def test_burst(self):
+    for i in xrange(3):
+      self.assertTrue(self.bucket.consume())
+    self.assertFalse(self.bucket.consume())
+    self.assertAlmostEqual(self.bucket.delay(), 0.1)
+  
+  #==============================
+  def test_refill(self):
+    for i in xrange(3):
+      self.bucket.consume()
+    self.clock.advance(0.1)
+    self.assertEqual(self.bucket.delay(), 0)
+    self.assertTrue(self.bucket.consume())
+    self.assertFalse(self.bucket.consume())
+  
+  #==============================
+  def test_capped(self):
+    self.clock.advance(60)
+    for i in xrange(3):
+      self.assertTrue(self.bucket.consume())
+    self.assertFalse(self.bucket.consume())
+
+#------------------------------
+class SchedulerTest(unittest.TestCase):
+  """Queued commands leave highest priority first."""
+  
+  #==============================
+  def setUp(self):
+    self.clock = task.Clock()
+    self.patch(scheduler, 'time', ClockTime(self.clock))
+    self.scheduler = RconScheduler(rate=10, burst=10, limits=(2, 2, 2))
+  
+  #==============================
+  def push(self, command, priority, front=False):
+    return self.scheduler.push(PendingRequest(command), priority, front)
+  
+  #==============================
+  def pop_all(self):
+    commands = []
+    request = self.scheduler.pop()
+    while request is not None:
+      commands.append(request.command)
+      request = self.scheduler.pop()
+    return commands
+  
+  #==============================
+  def test_priority(self):
+    self.push('exec cal.cfg', PRIORITY_BULK)
+    self.push('users', PRIORITY_INTERACTIVE)
+    self.push('say hi', PRIORITY_BULK)
+    self.push('kick #1', PRIORITY_MODERATION)
+    self.assertEqual(len(self.scheduler), 4)
+    self.assertEqual(self.pop_all(), ['kick #1', 'users', 'exec cal.cfg', 'say hi'])
+    self.assertEqual(len(self.scheduler), 0)
+  
+  #==============================
+  def test_lane_limit(self):
+    retried = PendingRequest('say retried')
+    self.scheduler.push(retried, PRIORITY_BULK)
+    self.assertIs(self.scheduler.pop(), retried)
+    
+    self.assertTrue(self.push('say a', PRIORITY_BULK))
+    self.assertTrue(self.push('say b', PRIORITY_BULK))
+    self.assertFalse(self.push('say c', PRIORITY_BULK))
+    # A full lane doesn't hold up the others.
+    self.assertTrue(self.push('users', PRIORITY_INTERACTIVE))
+    # A retry goes first and is never dropped.
+    self.assertTrue(self.scheduler.push(retried, PRIORITY_BULK, front=True))
+    self.assertEqual(self.pop_all(), ['users', 'say retried', 'say a', 'say b'])
+    self.assertEqual(self.scheduler.stats()['bulk']['dropped'], 1)
+  
+  #==============================
+  def test_rate(self):
+    self.scheduler = RconScheduler(rate=10, burst=10)
+    for i in xrange(12):
+      self.push('say %d' % i, i % 2 and PRIORITY_BULK or PRIORITY_INTERACTIVE)
+    self.assertEqual(len(self.pop_all()), 10)
+    self.assertEqual(len(self.scheduler), 2)
+    self.assertAlmostEqual(self.scheduler.delay(), 0.1)
+    self.clock.advance(0.1)
+    self.assertEqual(len(self.pop_all()), 1)
+  
+  #==============================
+  def test_latency(self):
+    self.push('users', PRIORITY_INTERACTIVE)
+    self.clock.advance(2)
+    self.push('status', PRIORITY_INTERACTIVE)
+    self.clock.advance(1)
+    self.pop_all()
+    stats = self.scheduler.stats()['interactive']
+    self.assertEqual(stats['sent'], 2)
+    self.assertEqual(stats['latency'], 4)
+    self.assertEqual(stats['max_latency'], 3)
+    self.assertEqual(stats['length'], 0)
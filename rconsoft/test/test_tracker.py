@@ -0,0 +1,42 @@
+# Read LICENSE for licensing details.
+
+from twisted.trial import unittest
+
+from rconsoft import rcon_receiver
+from rconsoft.rcon.tracker import RconTracker
+from rconsoft.server import Server
+
+UNIQUEID = 'STEAM_0:1:1'
+
+#------------------------------
+class RouterTest(unittest.TestCase):
+  """Log events reach the tracker of their own server only."""
+  
+  #==============================
+  def setUp(self):
+    self.servers = []
+    for port in (27015, 27016):
+      server = Server('test%d' % port, '127.0.0.1', port, 'password')
+      server.rcon_tracker = RconTracker(server)
+      server.rcon_tracker.setup()
+      server.rcon_client.players[UNIQUEID] = {'uniqueid': UNIQUEID}
+      self.servers.append(server)
+  
+  #==============================
+  def test_single_handler(self):
+    route = rcon_receiver.routes['user_disconnected']
+    self.assertEqual(len(route.live_receivers()), 1)
+  
+  #==============================
+  def test_own_server(self):
+    route = rcon_receiver.routes['user_disconnected']
+    route.send(sender=None, event='user_disconnected', data={'uniqueid': UNIQUEID}, server=self.servers[1])
+    self.assertIn(UNIQUEID, self.servers[0].rcon_client.players)
+    self.assertNotIn(UNIQUEID, self.servers[1].rcon_client.players)
+  
+  #==============================
+  def test_unknown_server(self):
+    route = rcon_receiver.routes['user_disconnected']
+    route.send(sender=None, event='user_disconnected', data={'uniqueid': UNIQUEID}, server=None)
+    for server in self.servers:
+      self.assertIn(UNIQUEID, server.rcon_client.players)
@@ -12,8 +12,8 @@ app_name = 'rconsoft'
 #-----------------------------
 # Do some checks
 
-if sys.version_info < (2, 4, 0):
-  sys.stderr.write(app_name+' requires Python 2.4 or newer.\n')
+if sys.version_info < (2, 7, 0):
+  sys.stderr.write(app_name+' requires Python 2.7 or newer.\n')
   sys.exit(-1)
   
 try:
@@ -92,7 +92,10 @@ setup(
   #scripts=['scripts/'+app_name],
   entry_points = {
     'console_scripts': [
-      '%s = %s.app:main_func' % (app_name, app_name)
+      '%s = %s.app:main_func' % (app_name, app_name),
+      '%s-replay = %s.replay:main_func' % (app_name, app_name),
+      '%s-fakehlds = %s.fakehlds:main_func' % (app_name, app_name),
+      '%s-bench = %s.bench:main_func' % (app_name, app_name)
     ]
   }
 )